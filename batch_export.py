@@ -0,0 +1,176 @@
+"""
+Headless batch exporter for saved projects.
+
+Usage: ``python batch_export.py project1.json project2.json -o generated/ -j 4``
+
+With ``--per-script``, every script of a project becomes its own community module, and all scripts of all projects are
+generated in parallel.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from exporter import PAYLOAD_STYLES, TIMER_MODES, BlockCache, Exporter, script_names
+from graph import load_flow
+from load_test import export_load_test
+from project_format import load_nodes, read_project
+from validator import GraphLinter
+
+
+# The exporter options of exports that do not set them, on the command line and in the export dialog of the editor.
+DEFAULT_EXPORTER_OPTIONS = {
+    "rename_collisions": True,
+    "timer_mode": "per_task",
+    "start_jitter": 0.0,
+    "interval_jitter": 0.0,
+    "payload_style": "dataclass",
+    "instrument": False,
+    "offload_workers": 4,
+    "max_offloaded": 256
+}
+
+
+def output_path_for(project_path: str, output_dir: Optional[str]) -> str:
+    stem = os.path.splitext(os.path.basename(project_path))[0]
+    return os.path.join(output_dir or os.path.dirname(project_path), stem + ".py")
+
+
+def script_jobs(project_path: str, output_dir: Optional[str]) -> Iterator[Tuple[str, dict, str, str]]:
+    """
+    The label, flow data, output path and community name of every script of a project.
+    """
+    project = read_project(project_path)
+    stem = os.path.splitext(os.path.basename(project_path))[0]
+    titles = [script_data["title"] for script_data in project["scripts"]]
+    for script_data, (module_name, class_name) in zip(project["scripts"], script_names(titles)):
+        yield (f"{project_path}:{script_data['title']}", script_data["flow"],
+               os.path.join(output_dir or os.path.dirname(project_path), f"{stem}_{module_name}.py"), class_name)
+
+
+def export_nodes(nodes, output_path: str, incremental: bool = False,
+                 exporter_options: Optional[Dict[str, object]] = None,
+                 load_test: bool = False, validate: bool = True) -> Tuple[bool, List[str]]:
+    if validate:
+        errors = GraphLinter(nodes, strict_names=not (exporter_options or {}).get("rename_collisions", True)).errors()
+        if errors:
+            raise RuntimeError("; ".join(f"{diagnostic.node.display_title}: {diagnostic.message}"
+                                         for diagnostic in errors))
+    exporter = Exporter(nodes, BlockCache() if incremental else None, **(exporter_options or {}))
+    written = exporter.export(output_path)
+    if load_test:
+        stem = os.path.splitext(output_path)[0]
+        export_load_test(exporter, stem + "_load_test.py", os.path.basename(stem))
+    return written, exporter.symbols.renames
+
+
+def export_project(project_path: str, output_path: str, incremental: bool = False,
+                   exporter_options: Optional[Dict[str, object]] = None,
+                   load_test: bool = False, validate: bool = True) -> Tuple[str, str, float, bool, List[str]]:
+    start = time.perf_counter()
+    written, renames = export_nodes(load_nodes(project_path), output_path, incremental, exporter_options, load_test,
+                                    validate)
+    return project_path, output_path, time.perf_counter() - start, written, renames
+
+
+def export_flow(label: str, flow_data: dict, output_path: str, community_name: str, incremental: bool = False,
+                exporter_options: Optional[Dict[str, object]] = None,
+                load_test: bool = False, validate: bool = True) -> Tuple[str, str, float, bool, List[str]]:
+    """
+    Export the flow of one script as a community called ``community_name``.
+    """
+    start = time.perf_counter()
+    written, renames = export_nodes(load_flow(flow_data), output_path, incremental,
+                                    dict(exporter_options or {}, community_name=community_name), load_test, validate)
+    return label, output_path, time.perf_counter() - start, written, renames
+
+
+def jitter_fraction(value: str) -> float:
+    fraction = float(value)
+    if not 0 <= fraction < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 0 and less than 1, got {value}")
+    return fraction
+
+
+def run(args: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export saved IPv8 community designs without starting the GUI.")
+    parser.add_argument("projects", nargs="+", help="saved project files (JSON or compact)")
+    parser.add_argument("-o", "--output-dir", default=None,
+                        help="directory to write the generated modules to (default: next to each project)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--incremental", action="store_true",
+                        help="do not rewrite generated modules whose content did not change")
+    parser.add_argument("--strict-names", action="store_true",
+                        help="fail instead of renaming titles that map onto the same generated name")
+    parser.add_argument("--timer-mode", choices=TIMER_MODES, default=DEFAULT_EXPORTER_OPTIONS["timer_mode"],
+                        help="register every periodic task separately or merge compatible tasks into one loop")
+    parser.add_argument("--start-jitter", type=float, default=DEFAULT_EXPORTER_OPTIONS["start_jitter"],
+                        help="start periodic tasks after a random delay of up to this many seconds")
+    parser.add_argument("--interval-jitter", type=jitter_fraction, default=DEFAULT_EXPORTER_OPTIONS["interval_jitter"],
+                        help="vary task intervals randomly by up to this fraction of the interval")
+    parser.add_argument("--payload-style", choices=PAYLOAD_STYLES, default=DEFAULT_EXPORTER_OPTIONS["payload_style"],
+                        help="generate dataclass payloads or payload classes with __slots__ and generated packing code")
+    parser.add_argument("--instrument", action="store_true",
+                        help="count calls, latencies, bytes and cache entries in the generated community")
+    parser.add_argument("--offload-workers", type=int, default=DEFAULT_EXPORTER_OPTIONS["offload_workers"],
+                        help="number of workers of the thread and process pools of offloaded handlers")
+    parser.add_argument("--max-offloaded", type=int, default=DEFAULT_EXPORTER_OPTIONS["max_offloaded"],
+                        help="drop messages of offloaded handlers while this many are being handled")
+    parser.add_argument("--per-script", action="store_true",
+                        help="export every script as its own community module, <project>_<script>.py")
+    parser.add_argument("--skip-validation", action="store_true",
+                        help="also export projects that the graph linter finds errors in")
+    parser.add_argument("--load-test", action="store_true",
+                        help="also generate a <module>_load_test.py throughput and latency test for every project")
+    parsed = parser.parse_args(args)
+
+    if parsed.output_dir is not None:
+        os.makedirs(parsed.output_dir, exist_ok=True)
+    exporter_options = {
+        "rename_collisions": not parsed.strict_names,
+        "timer_mode": parsed.timer_mode,
+        "start_jitter": parsed.start_jitter,
+        "interval_jitter": parsed.interval_jitter,
+        "payload_style": parsed.payload_style,
+        "instrument": parsed.instrument,
+        "offload_workers": parsed.offload_workers,
+        "max_offloaded": parsed.max_offloaded
+    }
+
+    failures = 0
+    exported = 0
+    start = time.perf_counter()
+    jobs = []
+    if parsed.per_script:
+        for project in parsed.projects:
+            try:
+                jobs.extend((export_flow, *job) for job in script_jobs(project, parsed.output_dir))
+            except Exception as e:
+                failures += 1
+                print(f"{project} FAILED: {e!r}", file=sys.stderr)
+    else:
+        jobs = [(export_project, project, output_path_for(project, parsed.output_dir)) for project in parsed.projects]
+    with ProcessPoolExecutor(max_workers=max(1, min(parsed.jobs, len(jobs)))) as executor:
+        futures = [(job[1], executor.submit(*job, incremental=parsed.incremental, exporter_options=exporter_options,
+                                            load_test=parsed.load_test, validate=not parsed.skip_validation))
+                   for job in jobs]
+        for label, future in futures:
+            try:
+                label, output_path, duration, written, renames = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"{label} FAILED: {e!r}", file=sys.stderr)
+                continue
+            exported += 1
+            for rename in renames:
+                print(f"{label} warning: {rename}", file=sys.stderr)
+            print(f"{label} -> {output_path} ({duration:.3f}s{'' if written else ', unchanged'})")
+    print(f"Exported {exported}/{exported + failures} {'scripts' if parsed.per_script else 'projects'} "
+          f"in {time.perf_counter() - start:.3f}s")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
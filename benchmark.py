@@ -0,0 +1,200 @@
+"""
+Exporter benchmarks on synthetic graphs, without the GUI.
+
+A community can have at most ``graph.FIRST_RESERVED_MSG_ID`` messages, so larger graphs are split into scripts (separate
+communities) of at most ``SCRIPT_MESSAGES`` messages. Every stage handles all scripts of the graph.
+
+Usage: ``python benchmark.py -n 1000 -m 250 -k 100 --fan-out 2 --scales 1 10 -o bench.json``
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from random import Random
+from typing import Callable, Dict, List
+
+from exporter import (BlockCache, Exporter, camel_to_joined_lower, produce_cache_block, produce_init_block,
+                      produce_message_block)
+from graph import FIRST_RESERVED_MSG_ID, GraphIndex, GraphNode, connect, load_scripts, project_data
+from validator import GraphLinter
+
+FIELD_TYPES = ["str", "int", "float", "object"]
+# The messages per script of synthetic projects: an even number, so that requests and responses stay together.
+SCRIPT_MESSAGES = 200
+
+
+def build_synthetic_graph(messages: int, caches: int, tasks: int, fan_out: int = 1, seed: int = 42) -> List[GraphNode]:
+    """
+    Build a graph of ``messages`` messages, ``caches`` caches and ``tasks`` periodic tasks.
+
+    Every task fires ``fan_out`` selectors (alternating between AllPeers and RandomPeer), which each send one of the
+    messages. Every other message responds with the next message and every cache is created by one message and
+    retrieved by its response.
+    """
+    rng = Random(seed)
+    message_nodes = []
+    for i in range(messages):
+        fields = {f"field_{j}": rng.choice(FIELD_TYPES) for j in range(rng.randint(0, 4))}
+        message_nodes.append(GraphNode("Message", f"SyntheticMessage{i}", {"custom_fields_dict": fields}))
+    for i in range(0, messages - 1, 2):
+        connect(message_nodes[i].outputs[0], message_nodes[i + 1].inputs[0])
+
+    cache_nodes = []
+    for i in range(min(caches, messages // 2)):
+        fields = {f"field_{j}": rng.choice(FIELD_TYPES) for j in range(rng.randint(0, 4))}
+        cache_node = GraphNode("Cache", f"SyntheticCache{i}", {"custom_fields_dict": fields})
+        connect(message_nodes[2 * i].outputs[1], cache_node.inputs[0])
+        connect(cache_node.outputs[0], message_nodes[2 * i + 1].inputs[1])
+        cache_nodes.append(cache_node)
+
+    task_nodes = []
+    selector_nodes = []
+    for i in range(tasks):
+        task_node = GraphNode("PeriodicTask", "PeriodicTask", {"interval": rng.choice([0.5, 1.0, 2.0, 5.0])})
+        for j in range(fan_out):
+            selector_node = GraphNode("AllPeers" if j % 2 == 0 else "RandomPeer",
+                                      "AllPeers" if j % 2 == 0 else "RandomPeer")
+            connect(task_node.outputs[0], selector_node.inputs[0])
+            if message_nodes:
+                connect(selector_node.outputs[0], message_nodes[((i * fan_out + j) * 2) % messages].inputs[0])
+            selector_nodes.append(selector_node)
+        task_nodes.append(task_node)
+
+    return message_nodes + cache_nodes + task_nodes + selector_nodes
+
+
+def build_synthetic_project(messages: int, caches: int, tasks: int, fan_out: int = 1, seed: int = 42,
+                            script_messages: int = SCRIPT_MESSAGES) -> Dict[str, List[GraphNode]]:
+    """
+    Split a synthetic graph (see ``build_synthetic_graph``) into scripts of at most ``script_messages`` messages, with
+    the caches and tasks spread evenly over the scripts.
+    """
+    if not 0 < script_messages <= FIRST_RESERVED_MSG_ID:
+        raise RuntimeError(f"A script can have at most {FIRST_RESERVED_MSG_ID} messages, got {script_messages}!")
+    count = max(1, -(-messages // script_messages))
+
+    def share(total, i):
+        return total * (i + 1) // count - total * i // count
+
+    return {f"synthetic_{i}": build_synthetic_graph(share(messages, i), share(caches, i), share(tasks, i), fan_out,
+                                                    seed + i)
+            for i in range(count)}
+
+
+def measure(stage: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """
+    The best wall time of ``repeat`` runs, followed by one extra run under ``tracemalloc`` to find the peak memory use
+    and the number of memory blocks the stage allocated and kept alive.
+    """
+    wall_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage()
+        wall_times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        blocks_before = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+        result = stage()
+        blocks_after = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+        _, peak = tracemalloc.get_traced_memory()
+        del result
+    finally:
+        tracemalloc.stop()
+
+    return {"wall_time_s": min(wall_times), "peak_bytes": peak, "allocated_blocks": blocks_after - blocks_before}
+
+
+def consume(blocks) -> int:
+    return sum(len(fragment) for block in blocks for fragment in block)
+
+
+def benchmark_project(scripts: Dict[str, List[GraphNode]], repeat: int,
+                      output_dir: str) -> Dict[str, Dict[str, float]]:
+    errors = [diagnostic for nodes in scripts.values() for diagnostic in GraphLinter(nodes).errors()]
+    if errors:
+        # Timing the generation of code that would not run is meaningless.
+        raise RuntimeError(f"The synthetic project has {len(errors)} errors, e.g. {errors[0].message}")
+    exporters = [Exporter(nodes) for nodes in scripts.values()]
+    message_titles = [node.display_title for exporter in exporters for node in exporter.message_nodes]
+    output_paths = [os.path.join(output_dir, f"{title}.py") for title in scripts]
+    serialized_project = json.dumps(project_data(scripts))
+    warm_caches = [BlockCache() for _ in scripts]
+    for nodes, warm_cache, output_path in zip(scripts.values(), warm_caches, output_paths):
+        Exporter(nodes, warm_cache).export(output_path)
+
+    def camel_to_joined_lower_stage():
+        camel_to_joined_lower.cache_clear()
+        return [camel_to_joined_lower(title) for title in message_titles]
+
+    stages = {
+        "load_project": lambda: load_scripts(json.loads(serialized_project)),
+        "graph_index": lambda: [GraphIndex(nodes) for nodes in scripts.values()],
+        "camel_to_joined_lower": camel_to_joined_lower_stage,
+        "produce_message_block": lambda: consume(
+            produce_message_block(i, node.display_title, node.custom_fields_dict, exporter.index.has_cache(node))
+            for exporter in exporters for i, node in enumerate(exporter.message_nodes)),
+        "produce_cache_block": lambda: consume(
+            produce_cache_block(node.display_title, node.custom_fields_dict)
+            for exporter in exporters for node in exporter.cache_nodes),
+        "produce_init_block": lambda: consume(produce_init_block(
+            [node.display_title for node in exporter.message_nodes],
+            [(i, node.interval) for i, node in enumerate(exporter.task_nodes)],
+            len(exporter.cache_nodes) > 0) for exporter in exporters),
+        # These include the index lookups that the exporter needs to produce the blocks.
+        "produce_selector_block": lambda: consume(block for exporter in exporters
+                                                  for block in exporter.selector_blocks()),
+        "produce_message_handler_block": lambda: consume(block for exporter in exporters
+                                                         for block in exporter.message_handler_blocks()),
+        "export": lambda: [Exporter(nodes).export(output_path)
+                           for nodes, output_path in zip(scripts.values(), output_paths)],
+        "export_incremental_unchanged": lambda: [Exporter(nodes, warm_cache).export(output_path)
+                                                 for nodes, warm_cache, output_path
+                                                 in zip(scripts.values(), warm_caches, output_paths)]
+    }
+    return {name: measure(stage, repeat) for name, stage in stages.items()}
+
+
+def run(args=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the exporter on synthetic graphs.")
+    parser.add_argument("-n", "--messages", type=int, default=1000, help="number of messages")
+    parser.add_argument("-m", "--caches", type=int, default=250, help="number of caches")
+    parser.add_argument("-k", "--tasks", type=int, default=100, help="number of periodic tasks")
+    parser.add_argument("--fan-out", type=int, default=2, help="number of selectors per periodic task")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1], help="multiply the graph size by these factors")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed runs per stage (the best is kept)")
+    parser.add_argument("-o", "--output", default=None, help="write the results to this JSON file")
+    parsed = parser.parse_args(args)
+
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "python": sys.version,
+            "platform": platform.platform(),
+            "repeat": parsed.repeat
+        },
+        "results": []
+    }
+    with tempfile.TemporaryDirectory() as output_dir:
+        for scale in parsed.scales:
+            size = {"messages": parsed.messages * scale, "caches": parsed.caches * scale,
+                    "tasks": parsed.tasks * scale, "fan_out": parsed.fan_out}
+            scripts = build_synthetic_project(**size)
+            for stage, measurements in benchmark_project(scripts, parsed.repeat, output_dir).items():
+                report["results"].append({"size": size, "stage": stage, **measurements})
+                print(f"{size['messages']:>8} messages  {stage:<30} {measurements['wall_time_s'] * 1000:>10.2f} ms"
+                      f" {measurements['peak_bytes'] / 1024:>10.1f} KiB peak"
+                      f" {measurements['allocated_blocks']:>8} blocks")
+
+    if parsed.output is not None:
+        with open(parsed.output, "w") as fp:
+            json.dump(report, fp, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,364 @@
+"""
+Analytical estimate of the traffic that a design generates in an overlay of N peers.
+
+Every peer runs the same community, so on average a peer receives as many messages of every type as it sends. The
+periodic tasks and their selectors inject messages, every handled message sends its ``response`` back and every cache
+lives until its retrieving message arrives (one round trip) or until it times out. Rate limiters cap the handled rate
+of their messages, at ``peer_rate`` per neighbour and ``global_rate`` in total.
+
+Aggregators batch the packets that arrive at a neighbour within ``max_delay`` of the first one (up to ``max_bytes``),
+which lowers the packet rate and the bytes sent, but not the message rates. ``serialize_once`` selectors serialize
+their message once per run, which lowers the serialization rate only. Memoizers do not change any rate: the same
+responses are sent, and how often a handler is skipped depends on how often the requests repeat, which is not known.
+
+Every script of a project is estimated as a separate community. In the JSON output, the rates of messages that respond
+to each other without bound are null.
+
+Usage: ``python estimator.py project.json -n 1000 --max-peers 30 --json estimate.json``
+"""
+import argparse
+import json
+import sys
+from math import exp, inf, log2
+from struct import calcsize
+from typing import Dict, List, Optional, Tuple
+
+from exporter import Exporter
+from project_format import load_project_scripts
+from wire_types import element_type, is_list, serializer_format
+
+# The bytes that every ``ez_send`` adds to the fields of a message.
+UDP_IP_HEADER_BYTES = 28
+COMMUNITY_PREFIX_BYTES = 22
+MESSAGE_ID_BYTES = 1
+AUTHENTICATION_BYTES = 2 + 74  # A length-prefixed curve25519 public key.
+GLOBAL_TIME_BYTES = 8
+SIGNATURE_BYTES = 64
+PACKET_OVERHEAD_BYTES = (UDP_IP_HEADER_BYTES + COMMUNITY_PREFIX_BYTES + MESSAGE_ID_BYTES + AUTHENTICATION_BYTES
+                         + GLOBAL_TIME_BYTES + SIGNATURE_BYTES)
+# The header of a batch of aggregated packets, which every packet of the batch shares, and the length of every packet.
+BATCH_HEADER_BYTES = UDP_IP_HEADER_BYTES + COMMUNITY_PREFIX_BYTES + MESSAGE_ID_BYTES
+BATCH_LENGTH_BYTES = 2
+# The ``identifier`` that is added to messages with a cache.
+CACHE_IDENTIFIER_BYTES = 4
+LIST_LENGTH_BYTES = 2
+
+
+def field_size(field_type: str, variable_bytes: int, list_length: int) -> int:
+    """
+    The serialized size of a field, assuming ``variable_bytes`` for every string, bytes or object value and
+    ``list_length`` elements for every list.
+    """
+    if is_list(field_type):
+        return LIST_LENGTH_BYTES + list_length * field_size(element_type(field_type), variable_bytes, list_length)
+    fmt = serializer_format(field_type)
+    if fmt is None:
+        return variable_bytes
+    if fmt.startswith("varlenH"):
+        return 2 + variable_bytes
+    if fmt.startswith("varlenI"):
+        return 4 + variable_bytes
+    return calcsize(">" + fmt)
+
+
+def message_size(exporter: Exporter, message_node, variable_bytes: int, list_length: int) -> int:
+    size = PACKET_OVERHEAD_BYTES + sum(field_size(field_type, variable_bytes, list_length)
+                                       for field_type in message_node.custom_fields_dict.values())
+    return size + (CACHE_IDENTIFIER_BYTES if exporter.index.has_cache(message_node) else 0)
+
+
+def limit(rate: float, limiter_node, neighbours: int) -> float:
+    """
+    The rate at which a rate limiter lets messages through, given that every neighbour sends an equal share of them.
+    """
+    if limiter_node is None:
+        return rate
+    if limiter_node.peer_rate:
+        rate = min(rate, limiter_node.peer_rate * neighbours)
+    if limiter_node.global_rate:
+        rate = min(rate, limiter_node.global_rate)
+    return rate
+
+
+def returns_to_creator(index, creator, retriever) -> bool:
+    """
+    Whether a chain of responses leads from the message that creates a cache back to the peer that created it, with the
+    message that retrieves the cache. A cache belongs to the peer that sends the message that creates it (the request
+    that it waits for the answer to) and every response goes back to the sender, so this takes an odd number of hops.
+    """
+    hops = 0
+    visited = set()
+    message_node = creator
+    while message_node is not None and message_node not in visited:
+        if message_node is retriever and hops > 0:
+            return hops % 2 == 1
+        visited.add(message_node)
+        message_node = index.first_target(message_node, "response")
+        hops += 1
+    return False
+
+
+def message_rates(exporter: Exporter, neighbours: int) -> Tuple[Dict[object, float], Dict[object, float], List[str]]:
+    """
+    The rates at which a peer receives (and sends) and handles every message, and warnings about response loops.
+
+    The messages are visited in the order of their ``response`` edges, so every rate is final when it is propagated.
+    """
+    index = exporter.index
+    received = {message_node: 0.0 for message_node in exporter.message_nodes}
+    for task_node in exporter.task_nodes:
+        if task_node.interval <= 0:
+            continue
+        for selector in index.targets(task_node, "on_timer_fire"):
+            per_run = neighbours if selector.title == "AllPeers" else min(selector.fan_out, neighbours)
+            for message_node in index.targets(selector, "message"):
+                received[message_node] += per_run / task_node.interval
+
+    pending = {message_node: sum(source.title == "Message" for source in index.sources(message_node, "received_by"))
+               for message_node in received}
+    ready = [message_node for message_node, count in pending.items() if count == 0]
+    handled = {}
+    while ready:
+        message_node = ready.pop()
+        handled[message_node] = limit(received[message_node], index.first_source(message_node, "rate_limit"),
+                                      neighbours)
+        cache_node = index.first_source(message_node, "retrieve_cache")
+        if cache_node is not None:
+            # Like ``retrieve_cache``: without a matching cache, the handler is never called.
+            creator = index.first_source(cache_node, "belongs_to")
+            handled[message_node] = (min(handled[message_node], handled[creator])
+                                     if creator in handled and returns_to_creator(index, creator, message_node)
+                                     else 0.0)
+        for response_node in index.targets(message_node, "response"):
+            received[response_node] += handled[message_node]
+            pending[response_node] -= 1
+            if pending[response_node] == 0:
+                ready.append(response_node)
+
+    warnings = []
+    looping = [message_node for message_node in exporter.message_nodes if message_node not in handled]
+    if looping:
+        names = ", ".join(exporter.symbols.class_name(message_node) for message_node in looping)
+        if any(received[message_node] > 0 for message_node in looping):
+            warnings.append(f"{names} respond to each other in a loop, their traffic grows without bound")
+            for message_node in looping:
+                received[message_node] = handled[message_node] = inf
+        else:
+            warnings.append(f"{names} only respond to each other in a loop, they are never sent")
+            for message_node in looping:
+                handled[message_node] = 0.0
+    return received, handled, warnings
+
+
+def serialization_rates(exporter: Exporter, received: Dict[object, float], neighbours: int) -> Dict[object, float]:
+    """
+    The rates at which a peer serializes every message: ``serialize_once`` selectors serialize once per run.
+    """
+    serialized = dict(received)
+    for task_node in exporter.task_nodes:
+        if task_node.interval <= 0:
+            continue
+        for selector in exporter.index.targets(task_node, "on_timer_fire"):
+            if selector.title == "AllPeers" and selector.serialize_once and neighbours > 0:
+                for message_node in exporter.index.targets(selector, "message"):
+                    serialized[message_node] -= (neighbours - 1) / task_node.interval
+    return serialized
+
+
+def aggregation(aggregator_node, rates_and_sizes: List[Tuple[float, int]], neighbours: int) -> Dict[str, float]:
+    """
+    The packets and bytes that an aggregator sends per second, given the rate and size of every message it batches.
+
+    The messages to every neighbour are assumed to arrive randomly (as a Poisson process): a batch holds its first
+    packet, plus the packets that arrive within ``max_delay``, up to ``max_bytes``. Single packets are sent as they are.
+    """
+    rate = sum(message_rate for message_rate, _ in rates_and_sizes)
+    if rate in (0.0, inf) or neighbours == 0:
+        return {"messages_per_s": rate, "packets_per_s": rate, "messages_per_packet": 1.0,
+                "bytes_out_per_s": sum(message_rate * size for message_rate, size in rates_and_sizes),
+                "bytes_saved_per_s": 0.0}
+    size = sum(message_rate * size for message_rate, size in rates_and_sizes) / rate
+    batched_size = size - UDP_IP_HEADER_BYTES - COMMUNITY_PREFIX_BYTES + BATCH_LENGTH_BYTES
+    capacity = max(1, int((aggregator_node.max_bytes - COMMUNITY_PREFIX_BYTES - MESSAGE_ID_BYTES) // batched_size))
+    arrivals = rate / neighbours * aggregator_node.max_delay
+    per_packet = min(1 + arrivals, capacity)
+    packets = rate / per_packet
+    single = packets * exp(-arrivals) if capacity > 1 else packets
+    bytes_out = single * size + (packets - single) * BATCH_HEADER_BYTES + (rate - single) * batched_size
+    return {"messages_per_s": rate, "packets_per_s": packets, "messages_per_packet": per_packet,
+            "bytes_out_per_s": bytes_out, "bytes_saved_per_s": rate * size - bytes_out}
+
+
+def scaling_exponents(exporter: Exporter, peers: int) -> Dict[object, Optional[float]]:
+    """
+    How the network-wide rate of every message grows with the overlay size, ``N^exponent``, if every peer knows every
+    other peer: the growth of the rates between ``peers`` and ``2 * peers`` peers.
+    """
+    small, _, _ = message_rates(exporter, peers - 1)
+    large, _, _ = message_rates(exporter, 2 * peers - 1)
+    return {message_node: None if small[message_node] in (0.0, inf) else log2(2 * large[message_node]
+                                                                             / small[message_node])
+            for message_node in small}
+
+
+def estimate(nodes, peers: int, max_peers: Optional[int] = None, variable_bytes: int = 32, list_length: int = 8,
+             round_trip: float = 0.1) -> dict:
+    """
+    Estimate the per-peer and network-wide message rates, bandwidth and outstanding caches of a design.
+
+    Every peer knows ``max_peers`` others, or all ``peers - 1`` others if ``max_peers`` is not given.
+    """
+    exporter = Exporter(nodes)
+    index = exporter.index
+    class_name = exporter.symbols.class_name
+    neighbours = peers - 1 if max_peers is None else min(peers - 1, max_peers)
+    received, handled, warnings = message_rates(exporter, neighbours)
+    serialized = serialization_rates(exporter, received, neighbours)
+    exponents = scaling_exponents(exporter, max(peers, 2))
+    sizes = {message_node: message_size(exporter, message_node, variable_bytes, list_length)
+             for message_node in exporter.message_nodes}
+
+    report = {"peers": peers, "neighbours": neighbours, "messages": {}, "caches": {}, "aggregators": {},
+              "warnings": warnings, "notes": []}
+    for message_node in exporter.message_nodes:
+        name = class_name(message_node)
+        size = sizes[message_node]
+        exponent = exponents[message_node]
+        report["messages"][name] = {
+            "bytes": size,
+            "sent_per_s": received[message_node],
+            "serialized_per_s": serialized[message_node],
+            "received_per_s": received[message_node],
+            "handled_per_s": handled[message_node],
+            "dropped_per_s": max(0.0, received[message_node] - handled[message_node]),
+            "bytes_out_per_s": received[message_node] * size,
+            "network_messages_per_s": peers * received[message_node],
+            "network_bytes_per_s": peers * received[message_node] * size,
+            "scaling": None if exponent is None else f"O(N^{round(exponent)})"
+        }
+        if exponent is not None and exponent >= 1.5:
+            warnings.append(f"the traffic of {name} grows as O(N^{round(exponent)}): it is sent to all peers, or in "
+                            f"response to a message that is" + ("" if max_peers is None
+                                                                else f", only bounded by --max-peers {max_peers}"))
+
+    for cache_node in exporter.cache_nodes:
+        name = class_name(cache_node)
+        creator = index.first_source(cache_node, "belongs_to")
+        retriever = index.first_target(cache_node, "received_by")
+        created = handled[creator] if creator is not None else 0.0
+        retrieved = handled[retriever] if retriever is not None else 0.0
+        matched = min(1.0, retrieved / created) if created not in (0.0, inf) else 1.0
+        if creator is not None and retriever is not None and not returns_to_creator(index, creator, retriever):
+            warnings.append(f"{class_name(retriever)} is not sent back to the peer that created the {name}: its "
+                            f"handler never runs and every {name} times out")
+        outstanding = created * (matched * round_trip + (1 - matched) * cache_node.timeout)
+        if 0 < cache_node.max_outstanding < outstanding:
+            warnings.append(f"about {outstanding:.0f} {name} caches are outstanding, more than the maximum of "
+                            f"{cache_node.max_outstanding}: the handler of {class_name(creator)} will skip its cache")
+            outstanding = cache_node.max_outstanding
+        report["caches"][name] = {
+            "created_per_s": created,
+            "timeouts_per_s": created * (1 - matched),
+            "outstanding": outstanding,
+            "network_outstanding": peers * outstanding
+        }
+
+    for aggregator_node, i in exporter.aggregator_ids.items():
+        report["aggregators"][f"aggregator_{i}"] = aggregation(
+            aggregator_node, [(received[message_node], sizes[message_node])
+                              for message_node in index.targets(aggregator_node, "aggregates")], neighbours)
+
+    memoized = [class_name(message_node) for message_node in exporter.message_nodes
+                if exporter.memoizer_id(message_node) is not None]
+    if memoized:
+        report["notes"].append(f"the responses to {', '.join(memoized)} are memoized: their rates are the same, but "
+                               f"how often their handlers are skipped is not estimated")
+
+    messages = report["messages"].values()
+    aggregators = report["aggregators"].values()
+    messages_per_s = sum(stats["sent_per_s"] for stats in messages)
+    packets_per_s = messages_per_s - sum(stats["messages_per_s"] - stats["packets_per_s"] for stats in aggregators)
+    bytes_out_per_s = (sum(stats["bytes_out_per_s"] for stats in messages)
+                       - sum(stats["bytes_saved_per_s"] for stats in aggregators))
+    report["totals"] = {
+        "messages_per_s": messages_per_s,
+        "packets_per_s": packets_per_s,
+        "bytes_out_per_s": bytes_out_per_s,
+        "network_messages_per_s": peers * messages_per_s,
+        "network_packets_per_s": peers * packets_per_s,
+        "network_bytes_per_s": peers * bytes_out_per_s
+    }
+    return report
+
+
+def without_infinity(value):
+    """
+    JSON has no infinity: the unbounded rates of messages that respond to each other in a loop are written as null.
+    """
+    if isinstance(value, dict):
+        return {key: without_infinity(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [without_infinity(item) for item in value]
+    return None if value == inf else value
+
+
+def print_report(report: dict) -> None:
+    print(f"{report['peers']} peers, {report['neighbours']} neighbours per peer")
+    print(f"{'message':<30} {'bytes':>6} {'sent/s':>10} {'dropped/s':>10} {'out B/s':>12} "
+          f"{'network msg/s':>14} {'network B/s':>14} {'scaling':>8}")
+    for name, stats in report["messages"].items():
+        print(f"{name:<30} {stats['bytes']:>6} {stats['sent_per_s']:>10.2f} {stats['dropped_per_s']:>10.2f} "
+              f"{stats['bytes_out_per_s']:>12.1f} {stats['network_messages_per_s']:>14.1f} "
+              f"{stats['network_bytes_per_s']:>14.1f} {stats['scaling'] or '-':>8}")
+    totals = report["totals"]
+    print(f"{'total':<30} {'':>6} {totals['messages_per_s']:>10.2f} {'':>10} {totals['bytes_out_per_s']:>12.1f} "
+          f"{totals['network_messages_per_s']:>14.1f} {totals['network_bytes_per_s']:>14.1f}")
+    if report["aggregators"]:
+        print(f"{'total packets':<30} {'':>6} {totals['packets_per_s']:>10.2f} {'':>10} {'':>12} "
+              f"{totals['network_packets_per_s']:>14.1f}")
+    for name, stats in report["messages"].items():
+        if stats["serialized_per_s"] < stats["sent_per_s"]:
+            print(f"{name:<30} serialized: {stats['serialized_per_s']:.2f}/s")
+    for name, stats in report["caches"].items():
+        print(f"{name:<30} created: {stats['created_per_s']:.2f}/s, timeouts: {stats['timeouts_per_s']:.2f}/s, "
+              f"outstanding: {stats['outstanding']:.1f} per peer")
+    for name, stats in report["aggregators"].items():
+        print(f"{name:<30} {stats['messages_per_s']:.2f} messages/s in {stats['packets_per_s']:.2f} packets/s "
+              f"({stats['messages_per_packet']:.1f} per packet), saves {stats['bytes_saved_per_s']:.1f} B/s")
+    for note in report["notes"]:
+        print(f"NOTE: {note}")
+    for warning in report["warnings"]:
+        print(f"WARNING: {warning}")
+
+
+def run(args=None) -> int:
+    parser = argparse.ArgumentParser(description="Estimate the traffic of saved IPv8 community designs.")
+    parser.add_argument("projects", nargs="+", help="saved project files (JSON or compact)")
+    parser.add_argument("-n", "--peers", type=int, default=100, help="number of peers in the overlay")
+    parser.add_argument("--max-peers", type=int, default=None,
+                        help="number of peers that every peer knows (default: all other peers)")
+    parser.add_argument("--variable-bytes", type=int, default=32,
+                        help="assumed size of every str, bytes and object field")
+    parser.add_argument("--list-length", type=int, default=8, help="assumed number of elements of every list field")
+    parser.add_argument("--round-trip", type=float, default=0.1,
+                        help="assumed seconds until the message that retrieves a cache arrives")
+    parser.add_argument("--json", default=None, help="write the estimates to this JSON file")
+    parsed = parser.parse_args(args)
+
+    reports = {}
+    for project_path in parsed.projects:
+        # Every script is a community of its own, with its own overlay.
+        reports[project_path] = {}
+        for title, nodes in load_project_scripts(project_path).items():
+            reports[project_path][title] = estimate(nodes, parsed.peers, parsed.max_peers, parsed.variable_bytes,
+                                                    parsed.list_length, parsed.round_trip)
+            print(f"{project_path}: {title}")
+            print_report(reports[project_path][title])
+    if parsed.json is not None:
+        with open(parsed.json, "w") as fp:
+            json.dump(without_infinity(reports), fp, indent=2, allow_nan=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -1,227 +1,1386 @@
-from functools import lru_cache, reduce
+import os
+import sys
+from functools import lru_cache
+from math import gcd
 from hashlib import sha1
 from json import dumps
-from typing import Dict, List, Tuple, Optional
+from keyword import iskeyword
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Optional, TextIO
 
-from nodes import AllPeersNode, RandomPeerNode, CacheNode, MessageNode, PeriodicTaskNode
+from graph import BATCH_MSG_ID, DEFAULT_CACHE_TIMEOUT, FIRST_RESERVED_MSG_ID, GraphIndex, node_key
+from wire_types import (COMPACT_TYPES, all_field_types, fields_annotations, is_hashable, is_list, required_formats,
+                        serializer_format, uses_lists)
 
 INDENT = " " * 4
 LINE_BREAK = "\n"
+DEFAULT_COMMUNITY_NAME = "MyCommunity"
+TIMER_MODES = ["per_task", "coalesced"]
+PAYLOAD_STYLES = ["dataclass", "compiled"]
 
 
-@lru_cache
+# Names that the generated module and ``Community`` already use.
+RESERVED_MODULE_NAMES = frozenset({
+    "BATCH_MSG_ID", "BoundedRequestCache", "Community", "CommunityStats", "Endpoint", "Identifier",
+    "InstrumentedRequestCache", "LATENCY_BUCKETS", "List", "MessageAggregator", "MyCommunity", "Network",
+    "OrderedDict", "Peer", "ProcessPoolExecutor", "RandomNumberCache", "RequestCache", "ResponseMemoizer",
+    "ThreadPoolExecutor", "TokenBucketLimiter", "dataclass", "defaultdict", "getLogger", "get_running_loop",
+    "instrumented", "lazy_wrapper", "monotonic", "overwrite_dataclass", "pack", "perf_counter", "rate_limited",
+    "retrieve_cache", "sample", "sleep", "type_from_format", "uniform", "unpack_from", "wraps"
+} | {type_name for type_name, _ in COMPACT_TYPES.values()})
+RESERVED_METHOD_NAMES = frozenset({
+    "offload", "on_batch", "on_deprecated_message", "on_introduction_request", "on_introduction_response", "on_packet",
+    "on_puncture", "on_puncture_request", "run_offloaded", "stats_snapshot", "unload"
+})
+# The attributes of compiled payload classes (and the arguments of their methods), which fields cannot replace.
+PAYLOAD_ATTRIBUTES = frozenset({"cls", "format_list", "from_unpack_list", "msg_id", "names", "self", "to_pack_list"})
+
+
+@lru_cache(maxsize=4096)
 def camel_to_joined_lower(message_class_name: str) -> str:
-    return reduce(lambda c, e: c + ((("_" if e[0] != e[1] else "") + e[1]) if c else e[1]),
-                  zip(message_class_name, message_class_name.lower()), "")
+    out = []
+    for character in message_class_name:
+        lower = character.lower()
+        if out and character != lower:
+            out.append("_")
+        out.append(lower)
+    return "".join(out)
+
+
+def to_identifier(name: str) -> str:
+    """
+    Replace all characters that cannot be used in a Python identifier.
+    """
+    name = "".join(character if ("_" + character).isidentifier() else "_" for character in name) or "_"
+    if not name.isidentifier() or iskeyword(name):
+        name = "_" + name
+    return name
+
+
+def script_names(script_titles: Iterable[str]) -> List[Tuple[str, str]]:
+    """
+    The (unique) module name and community class name of every script, e.g. ``ping_pong`` and ``PingPongCommunity`` for
+    a script called "ping pong".
+    """
+    names = []
+    taken = set()
+    for title in script_titles:
+        words = "".join(character if character.isalnum() else " " for character in title).split() or ["script"]
+        module_name = to_identifier("_".join(word.lower() for word in words))
+        if module_name in getattr(sys, "stdlib_module_names", ()) or module_name == "ipv8":
+            # The module would shadow a module that the generated code imports.
+            module_name += "_community"
+        class_name = to_identifier("".join(word[0].upper() + word[1:] for word in words) + "Community")
+        suffix = 1
+        unique_module_name, unique_class_name = module_name, class_name
+        while unique_module_name in taken or unique_class_name in taken:
+            suffix += 1
+            unique_module_name, unique_class_name = f"{module_name}_{suffix}", f"{class_name}{suffix}"
+        taken.update((unique_module_name, unique_class_name))
+        names.append((unique_module_name, unique_class_name))
+    return names
+
 
+def coalesce_tasks(tasks: List[Tuple[int, float]],
+                   resolution: float = 0.001) -> List[Tuple[float, List[Tuple[int, int]]]]:
+    """
+    Group tasks into schedulers that tick at the greatest common divisor of the intervals of their tasks.
 
-def produce_imports_block(has_cache: bool, has_random_selector: bool) -> str:
-    out = "from dataclasses import dataclass" + LINE_BREAK
+    Every task joins the scheduler that its interval is most compatible with: merging may not lead to more wakeups
+    than running the scheduler and the task separately. Intervals are rounded to the given resolution.
+    Returns a list of ``(tick interval, [(task id, number of ticks per task run), ...])``.
+    """
+    groups: List[Tuple[int, List[Tuple[int, int]]]] = []
+    for task_id, interval in sorted(tasks, key=lambda task: task[1]):
+        ticks = max(1, round(interval / resolution))
+        best = None
+        best_cost = 0.0
+        for i, (group_ticks, _) in enumerate(groups):
+            merged_ticks = gcd(group_ticks, ticks)
+            cost = 1 / merged_ticks - 1 / group_ticks
+            if cost <= 1 / ticks and (best is None or cost < best_cost):
+                best = i
+                best_cost = cost
+        if best is None:
+            groups.append((ticks, [(task_id, ticks)]))
+        else:
+            group_ticks, group_tasks = groups[best]
+            groups[best] = (gcd(group_ticks, ticks), group_tasks + [(task_id, ticks)])
+    ticks_per_second = round(1 / resolution)
+    return [(group_ticks / ticks_per_second,
+             sorted((task_id, ticks // group_ticks) for task_id, ticks in group_tasks))
+            for group_ticks, group_tasks in groups]
+
+
+def produce_imports_block(has_cache: bool, has_random_selector: bool,
+                          stdlib_imports: Optional[Dict[str, List[str]]] = None,
+                          type_formats: Optional[Dict[str, str]] = None) -> Iterator[str]:
+    imports = {"dataclasses": ["dataclass"]}
     if has_random_selector:
-        out += "from random import sample" + LINE_BREAK
-    out += LINE_BREAK + "from ipv8.community import Community" + LINE_BREAK
+        imports["random"] = ["sample"]
+        imports["typing"] = ["List"]
+    for module, names in (stdlib_imports or {}).items():
+        imports[module] = sorted(set(imports.get(module, [])) | set(names))
+    for module in sorted(imports):
+        yield f"from {module} import {', '.join(imports[module])}" + LINE_BREAK
+    type_formats = type_formats or {}
+    yield LINE_BREAK + "from ipv8.community import Community" + LINE_BREAK
     if has_cache:
-        out += ("from ipv8.lazy_community import lazy_wrapper, retrieve_cache" + LINE_BREAK
-                + "from ipv8.messaging.payload_dataclass import overwrite_dataclass, type_from_format" + LINE_BREAK
-                + "from ipv8.requestcache import RandomNumberCache, RequestCache" + LINE_BREAK)
+        yield "from ipv8.lazy_community import lazy_wrapper, retrieve_cache" + LINE_BREAK
+    else:
+        yield "from ipv8.lazy_community import lazy_wrapper" + LINE_BREAK
+    if has_cache or type_formats:
+        yield "from ipv8.messaging.payload_dataclass import overwrite_dataclass, type_from_format" + LINE_BREAK
     else:
-        out += ("from ipv8.lazy_community import lazy_wrapper" + LINE_BREAK
-                + "from ipv8.messaging.payload_dataclass import overwrite_dataclass" + LINE_BREAK)
-    out += "from ipv8.types import Endpoint, Network, Peer" + LINE_BREAK
-    out += LINE_BREAK + "dataclass = overwrite_dataclass(dataclass)" + LINE_BREAK
+        yield "from ipv8.messaging.payload_dataclass import overwrite_dataclass" + LINE_BREAK
     if has_cache:
-        out += "Identifier = type_from_format(\"I\")" + LINE_BREAK
-    return out
+        yield "from ipv8.requestcache import RandomNumberCache, RequestCache" + LINE_BREAK
+    yield "from ipv8.types import Endpoint, Network, Peer" + LINE_BREAK
+    yield LINE_BREAK + "dataclass = overwrite_dataclass(dataclass)" + LINE_BREAK
+    if has_cache:
+        yield "Identifier = type_from_format(\"I\")" + LINE_BREAK
+    for type_name, type_format in type_formats.items():
+        yield f"{type_name} = type_from_format(\"{type_format}\")" + LINE_BREAK
 
 
-def produce_message_block(message_number: int, message_class_name: str, fields: Dict[str, str], has_cache=False) -> str:
-    out = (f"@dataclass(msg_id={message_number})" + LINE_BREAK
+def produce_message_block(message_number: int, message_class_name: str, fields: Dict[str, str],
+                          has_cache=False) -> Iterator[str]:
+    yield (f"@dataclass(msg_id={message_number})" + LINE_BREAK
            + f"class {message_class_name}:" + LINE_BREAK)
     if len(fields) == 0 and not has_cache:
-        out += INDENT + "pass" + LINE_BREAK
-    elif len(fields) > 0:
-        out += INDENT + (LINE_BREAK + INDENT).join(f"{k}: {v}" for k, v in fields.items()) + LINE_BREAK
+        yield INDENT + "pass" + LINE_BREAK
+    for k, v in fields.items():
+        yield INDENT + f"{k}: {v}" + LINE_BREAK
     if has_cache:
-        out += INDENT + "identifier: Identifier" + LINE_BREAK
-    return out
+        yield INDENT + "identifier: Identifier" + LINE_BREAK
+
+
+def produce_compiled_message_block(message_number: int, message_class_name: str, field_formats: Dict[str, str],
+                                   has_cache=False) -> Iterator[str]:
+    """
+    A payload class with ``__slots__`` and (un)packing code that names the format of every field, so nothing is looked
+    up per message. It implements IPv8's ``Serializable`` interface without deriving from it or from
+    ``VariablePayload``: their instances have a ``__dict__``, which slots in a subclass do not remove.
+    """
+    field_formats = dict(field_formats, **({"identifier": "I"} if has_cache else {}))
+    names = ", ".join(f"\"{name}\"" for name in field_formats)
+    yield (f"class {message_class_name}:" + LINE_BREAK
+           + INDENT + f"msg_id = {message_number}" + LINE_BREAK
+           + INDENT + "format_list = [" + ", ".join(f"\"{fmt}\"" for fmt in field_formats.values()) + "]" + LINE_BREAK
+           + INDENT + f"names = [{names}]" + LINE_BREAK
+           + INDENT + f"__slots__ = ({names}{',' if len(field_formats) == 1 else ''})" + LINE_BREAK * 2
+           + INDENT + "def __init__(self" + "".join(f", {name}" for name in field_formats) + "):" + LINE_BREAK)
+    if len(field_formats) == 0:
+        yield INDENT * 2 + "pass" + LINE_BREAK
+    for name in field_formats:
+        yield INDENT * 2 + f"self.{name} = {name}" + LINE_BREAK
+    yield LINE_BREAK + INDENT + "def to_pack_list(self) -> list:" + LINE_BREAK
+    if len(field_formats) == 0:
+        yield INDENT * 2 + "return []" + LINE_BREAK
+    else:
+        yield (INDENT * 2 + "return [" + LINE_BREAK
+               + "".join(INDENT * 3 + f"(\"{fmt}\", self.{name})," + LINE_BREAK for name, fmt in field_formats.items())
+               + INDENT * 2 + "]" + LINE_BREAK)
+    yield (LINE_BREAK
+           + INDENT + "@classmethod" + LINE_BREAK
+           + INDENT + "def from_unpack_list(cls, *args):" + LINE_BREAK
+           + INDENT * 2 + "return cls(*args)" + LINE_BREAK)
 
 
-def produce_cache_block(cache_class_name: str, fields: Dict[str, str]) -> str:
-    out = (f"class {cache_class_name}(RandomNumberCache):" + LINE_BREAK
-           + INDENT + f"name = \"{cache_class_name}\"" + LINE_BREAK + LINE_BREAK
-           + INDENT + "def __init__(self, request_cache: RequestCache, "
-                    + ", ".join(f"{k}: {v}" for k, v in fields.items()) + "):" + LINE_BREAK
-           + INDENT * 2 + f"super().__init__(request_cache, {cache_class_name}.name)" + LINE_BREAK
-           + LINE_BREAK if len(fields) > 0 else "")
+def produce_cache_block(cache_class_name: str, fields: Dict[str, str], timeout: Optional[float] = None,
+                        on_timeout: str = "ignore") -> Iterator[str]:
+    """
+    A cache with the given fields, which times out after ``timeout`` seconds (IPv8's default if ``None``).
+    It declares no ``__slots__``: its ``RandomNumberCache`` bases have a ``__dict__``, which slots would not remove.
+    """
+    yield (f"class {cache_class_name}(RandomNumberCache):" + LINE_BREAK
+           + INDENT + f"name = \"{cache_class_name}\"" + LINE_BREAK * 2
+           + INDENT + "def __init__(self, request_cache: RequestCache"
+           + "".join(f", {k}: {v}" for k, v in fields.items()) + "):" + LINE_BREAK
+           + INDENT * 2 + f"super().__init__(request_cache, {cache_class_name}.name)" + LINE_BREAK)
+    if len(fields) > 0:
+        yield LINE_BREAK
     for k, v in fields.items():
-        out += INDENT * 2 + f"self.{k}: {v} = {k}" + LINE_BREAK
-    return out
+        yield INDENT * 2 + f"self.{k}: {v} = {k}" + LINE_BREAK
+    if timeout is not None:
+        yield (LINE_BREAK
+               + INDENT + "def get_timeout_delay(self) -> float:" + LINE_BREAK
+               + INDENT * 2 + f"return {timeout}" + LINE_BREAK)
+    yield LINE_BREAK + INDENT + "def on_timeout(self):" + LINE_BREAK
+    if on_timeout == "log":
+        yield (INDENT * 2 + f"getLogger(self.name).warning(\"%s:%d timed out after %.1fs\", self.prefix, self.number, "
+               + "self.get_timeout_delay())" + LINE_BREAK)
+    elif on_timeout == "implement":
+        yield INDENT * 2 + "raise NotImplementedError(\"Fill this function with your timeout logic\")" + LINE_BREAK
+    else:
+        yield INDENT * 2 + "pass" + LINE_BREAK
+
 
+def produce_bounded_request_cache_block(limits: Dict[str, int]) -> Iterator[str]:
+    """
+    A request cache that refuses to add a cache while ``limits[cache name]`` caches of its type are outstanding.
+    """
+    yield ("class BoundedRequestCache(RequestCache):" + LINE_BREAK
+           + INDENT + "limits = {" + ", ".join(f"{cache_class}.name: {limit}" for cache_class, limit in limits.items())
+           + "}" + LINE_BREAK * 2
+           + INDENT + "def __init__(self):" + LINE_BREAK
+           + INDENT * 2 + "super().__init__()" + LINE_BREAK
+           + INDENT * 2 + "self.outstanding = {prefix: set() for prefix in self.limits}" + LINE_BREAK * 2
+           + INDENT + "def add(self, cache):" + LINE_BREAK
+           + INDENT * 2 + "numbers = self.outstanding.get(cache.prefix)" + LINE_BREAK
+           + INDENT * 2 + "if numbers is None:" + LINE_BREAK
+           + INDENT * 3 + "return super().add(cache)" + LINE_BREAK
+           + INDENT * 2 + "if len(numbers) >= self.limits[cache.prefix]:" + LINE_BREAK
+           + INDENT * 3 + "return None" + LINE_BREAK
+           + INDENT * 2 + "added = super().add(cache)" + LINE_BREAK
+           + INDENT * 2 + "if added is not None:" + LINE_BREAK
+           + INDENT * 3 + "numbers.add(cache.number)" + LINE_BREAK
+           + INDENT * 2 + "return added" + LINE_BREAK * 2
+           + INDENT + "def pop(self, prefix, number):" + LINE_BREAK
+           + INDENT * 2 + "numbers = self.outstanding.get(prefix)" + LINE_BREAK
+           + INDENT * 2 + "if numbers is not None:" + LINE_BREAK
+           + INDENT * 3 + "numbers.discard(number)" + LINE_BREAK
+           + INDENT * 2 + "return super().pop(prefix, number)" + LINE_BREAK * 2
+           + INDENT + "def _on_timeout(self, cache):" + LINE_BREAK
+           + INDENT * 2 + "super()._on_timeout(cache)" + LINE_BREAK
+           + INDENT * 2 + "numbers = self.outstanding.get(cache.prefix)" + LINE_BREAK
+           + INDENT * 2 + "if numbers is not None:" + LINE_BREAK
+           + INDENT * 3 + "numbers.discard(cache.number)" + LINE_BREAK)
 
-def produce_community_block(community_hash: str) -> str:
-    return ("class MyCommunity(Community):" + LINE_BREAK
-            + INDENT + f"community_id = b\"{community_hash}\"" + LINE_BREAK)
 
+def produce_community_block(community_hash: str, community_name: str = DEFAULT_COMMUNITY_NAME) -> Iterator[str]:
+    yield (f"class {community_name}(Community):" + LINE_BREAK
+           + INDENT + f"community_id = b\"{community_hash}\"" + LINE_BREAK)
 
-def produce_init_block(message_classes: List[str], tasks: List[Tuple[int, float]], has_caches=False) -> str:
-    out = (INDENT + "def __init__(self, my_peer: Peer, endpoint: Endpoint, network: Network):" + LINE_BREAK
+
+def produce_init_block(message_classes: List[str], tasks: List[Tuple[int, float]], has_caches=False,
+                       handler_names: Optional[List[str]] = None,
+                       schedulers: Optional[List[int]] = None, start_jitter=0.0, instrumented=False,
+                       bounded_caches=False, rate_limiters: Optional[List[list]] = None,
+                       executors: Optional[List[str]] = None, offload_workers=4,
+                       aggregators: Optional[List[list]] = None,
+                       memoizers: Optional[List[list]] = None, has_random_selector=False) -> Iterator[str]:
+    yield (INDENT + "def __init__(self, my_peer: Peer, endpoint: Endpoint, network: Network):" + LINE_BREAK
            + INDENT * 2 + "super().__init__(my_peer, endpoint, network)" + LINE_BREAK)
-    out += LINE_BREAK if len(message_classes) > 0 else ""
-    for message_class in message_classes:
-        out += INDENT * 2 + (f"self.add_message_handler({message_class}, "
-                             f"self.on_{camel_to_joined_lower(message_class)})" + LINE_BREAK)
-    out += LINE_BREAK if len(tasks) > 0 else ""
+    if instrumented and not message_classes:
+        yield INDENT * 2 + "self.stats = CommunityStats({})" + LINE_BREAK
+    elif instrumented:
+        yield (INDENT * 2 + "self.stats = CommunityStats({" + LINE_BREAK
+               + "".join(f"{INDENT * 3}{message_class}.msg_id: \"{message_class}\"," + LINE_BREAK
+                         for message_class in message_classes)
+               + INDENT * 2 + "})" + LINE_BREAK)
+    if len(message_classes) > 0:
+        yield LINE_BREAK
+    if handler_names is None:
+        handler_names = [f"on_{camel_to_joined_lower(message_class)}" for message_class in message_classes]
+    for message_class, handler_name in zip(message_classes, handler_names):
+        yield INDENT * 2 + f"self.add_message_handler({message_class}, self.{handler_name})" + LINE_BREAK
+    aggregators = aggregators or []
+    if aggregators:
+        yield (INDENT * 2 + "self.add_message_handler(BATCH_MSG_ID, self.on_batch)" + LINE_BREAK * 2
+               + "".join(f"{INDENT * 2}self.aggregator_{aggregator_id} = MessageAggregator(self, {max_delay}, "
+                         f"{max_bytes})" + LINE_BREAK for aggregator_id, max_delay, max_bytes in aggregators))
+    if memoizers:
+        yield LINE_BREAK
+    for memoizer_id, max_entries, ttl in memoizers or []:
+        yield INDENT * 2 + f"self.memoizer_{memoizer_id} = ResponseMemoizer({max_entries}, {ttl})" + LINE_BREAK
+    if rate_limiters:
+        yield LINE_BREAK
+    for limiter_id, *limits in rate_limiters or []:
+        yield (INDENT * 2 + f"self.rate_limiter_{limiter_id} = TokenBucketLimiter("
+               + ", ".join(str(limit) for limit in limits) + ")" + LINE_BREAK)
+    if has_random_selector:
+        yield (LINE_BREAK
+               + INDENT * 2 + "self.peer_pool = []" + LINE_BREAK
+               + INDENT * 2 + "self.peer_pool_members = set()" + LINE_BREAK)
+    schedulers = schedulers or []
+    if len(tasks) > 0 or len(schedulers) > 0:
+        yield LINE_BREAK
+    delay = f"uniform(0, {start_jitter})" if start_jitter else "0"
     for task in tasks:
         task_id, task_interval = task
-        out += INDENT * 2 + (f"self.register_anonymous_task(\"interval_task\", self.selector_{task_id}, "
-                             f"interval={task_interval}, delay=0)" + LINE_BREAK)
-    out += LINE_BREAK if has_caches else ""
+        yield INDENT * 2 + (f"self.register_anonymous_task(\"interval_task\", self.selector_{task_id}, "
+                            f"interval={task_interval}, delay={delay})" + LINE_BREAK)
+    for scheduler_id in schedulers:
+        yield INDENT * 2 + (f"self.register_anonymous_task(\"scheduler\", self.scheduler_{scheduler_id}, "
+                            f"delay={delay})" + LINE_BREAK)
+    executors = executors or []
+    if executors:
+        yield LINE_BREAK
+    for executor in executors:
+        executor_class = "ThreadPoolExecutor" if executor == "thread" else "ProcessPoolExecutor"
+        yield INDENT * 2 + f"self.{executor}_executor = {executor_class}(max_workers={offload_workers})" + LINE_BREAK
+    if executors:
+        yield INDENT * 2 + "self.offloaded = 0" + LINE_BREAK
+    if has_caches:
+        if instrumented:
+            request_cache = "InstrumentedRequestCache(self.stats)"
+        elif bounded_caches:
+            request_cache = "BoundedRequestCache()"
+        else:
+            request_cache = "RequestCache()"
+        yield LINE_BREAK + INDENT * 2 + f"self.request_cache = {request_cache}" + LINE_BREAK
+    if has_caches or executors or aggregators:
+        yield LINE_BREAK + INDENT + "async def unload(self):" + LINE_BREAK
+    for aggregator_id, _, _ in aggregators:
+        yield INDENT * 2 + f"self.aggregator_{aggregator_id}.flush_all()" + LINE_BREAK
     if has_caches:
-        out += (INDENT * 2 + "self.request_cache = RequestCache()" + LINE_BREAK * 2
-                + INDENT + "async def unload(self):" + LINE_BREAK
-                + INDENT * 2 + "await self.request_cache.shutdown()" + LINE_BREAK
-                + INDENT * 2 + "await super().unload()" + LINE_BREAK)
-    return out
+        yield INDENT * 2 + "await self.request_cache.shutdown()" + LINE_BREAK
+    for executor in executors:
+        yield INDENT * 2 + f"self.{executor}_executor.shutdown(wait=False, cancel_futures=True)" + LINE_BREAK
+    if has_caches or executors or aggregators:
+        yield INDENT * 2 + "await super().unload()" + LINE_BREAK
+
+
+def produce_instrumentation_block(has_caches: bool, bounded_caches=False) -> Iterator[str]:
+    yield ("# Latency histograms count calls per power of two microseconds, up to ~35 minutes." + LINE_BREAK
+           + "LATENCY_BUCKETS = 32" + LINE_BREAK * 3
+           + "class CommunityStats:" + LINE_BREAK * 2
+           + INDENT + "def __init__(self, message_names):" + LINE_BREAK
+           + INDENT * 2 + "self.message_names = message_names" + LINE_BREAK
+           + INDENT * 2 + "self.calls = defaultdict(int)" + LINE_BREAK
+           + INDENT * 2 + "self.errors = defaultdict(int)" + LINE_BREAK
+           + INDENT * 2 + "self.latencies = defaultdict(lambda: [0] * LATENCY_BUCKETS)" + LINE_BREAK
+           + INDENT * 2 + "self.bytes_in = defaultdict(int)" + LINE_BREAK
+           + INDENT * 2 + "self.bytes_out = defaultdict(int)" + LINE_BREAK
+           + INDENT * 2 + "self.caches = defaultdict(lambda: {\"added\": 0, \"popped\": 0, \"timed_out\": 0})"
+           + LINE_BREAK * 2
+           + INDENT + "def observe(self, name, seconds):" + LINE_BREAK
+           + INDENT * 2 + "self.calls[name] += 1" + LINE_BREAK
+           + INDENT * 2 + "self.latencies[name][min(int(seconds * 1000000).bit_length(), LATENCY_BUCKETS - 1)] += 1"
+           + LINE_BREAK * 2
+           + INDENT + "def snapshot(self):" + LINE_BREAK
+           + INDENT * 2 + "return {" + LINE_BREAK
+           + INDENT * 3 + "\"calls\": dict(self.calls)," + LINE_BREAK
+           + INDENT * 3 + "\"errors\": dict(self.errors)," + LINE_BREAK
+           + INDENT * 3 + "# Bucket i counts the calls that took less than 2 ** i microseconds." + LINE_BREAK
+           + INDENT * 3 + "\"latency_histograms_us\": {name: list(counts) for name, counts in self.latencies.items()},"
+           + LINE_BREAK
+           + INDENT * 3 + "\"bytes_in\": {self.message_names.get(msg_id, msg_id): count"
+           + " for msg_id, count in self.bytes_in.items()}," + LINE_BREAK
+           + INDENT * 3 + "\"bytes_out\": {self.message_names.get(msg_id, msg_id): count"
+           + " for msg_id, count in self.bytes_out.items()}," + LINE_BREAK
+           + INDENT * 3 + "\"caches\": {name: dict(counts, outstanding=counts[\"added\"] - counts[\"popped\"]"
+           + " - counts[\"timed_out\"])" + LINE_BREAK
+           + INDENT * 3 + "           for name, counts in self.caches.items()}" + LINE_BREAK
+           + INDENT * 2 + "}" + LINE_BREAK * 3
+           + "def instrumented(name, msg_id=None):" + LINE_BREAK
+           + INDENT + "def decorator(func):" + LINE_BREAK
+           + INDENT * 2 + "@wraps(func)" + LINE_BREAK
+           + INDENT * 2 + "def wrapper(self, *args):" + LINE_BREAK
+           + INDENT * 3 + "if msg_id is not None:" + LINE_BREAK
+           + INDENT * 4 + "self.stats.bytes_in[msg_id] += len(args[-1])" + LINE_BREAK
+           + INDENT * 3 + "start = perf_counter()" + LINE_BREAK
+           + INDENT * 3 + "try:" + LINE_BREAK
+           + INDENT * 4 + "return func(self, *args)" + LINE_BREAK
+           + INDENT * 3 + "except Exception:" + LINE_BREAK
+           + INDENT * 4 + "self.stats.errors[name] += 1" + LINE_BREAK
+           + INDENT * 4 + "raise" + LINE_BREAK
+           + INDENT * 3 + "finally:" + LINE_BREAK
+           + INDENT * 4 + "self.stats.observe(name, perf_counter() - start)" + LINE_BREAK
+           + INDENT * 2 + "return wrapper" + LINE_BREAK
+           + INDENT + "return decorator" + LINE_BREAK)
+    if has_caches:
+        yield (LINE_BREAK * 2
+               + f"class InstrumentedRequestCache({'BoundedRequestCache' if bounded_caches else 'RequestCache'}):"
+               + LINE_BREAK * 2
+               + INDENT + "def __init__(self, stats: CommunityStats):" + LINE_BREAK
+               + INDENT * 2 + "super().__init__()" + LINE_BREAK
+               + INDENT * 2 + "self.stats = stats" + LINE_BREAK
+               + INDENT * 2 + "self.timing_out = False" + LINE_BREAK * 2
+               + INDENT + "def add(self, cache):" + LINE_BREAK
+               + INDENT * 2 + "added = super().add(cache)" + LINE_BREAK
+               + INDENT * 2 + "if added is not None:" + LINE_BREAK
+               + INDENT * 3 + "self.stats.caches[cache.prefix][\"added\"] += 1" + LINE_BREAK
+               + INDENT * 2 + "return added" + LINE_BREAK * 2
+               + INDENT + "def pop(self, prefix, number):" + LINE_BREAK
+               + INDENT * 2 + "cache = super().pop(prefix, number)" + LINE_BREAK
+               + INDENT * 2 + "if not self.timing_out:" + LINE_BREAK
+               + INDENT * 3 + "self.stats.caches[prefix][\"popped\"] += 1" + LINE_BREAK
+               + INDENT * 2 + "return cache" + LINE_BREAK * 2
+               + INDENT + "def _on_timeout(self, cache):" + LINE_BREAK
+               + INDENT * 2 + "self.stats.caches[cache.prefix][\"timed_out\"] += 1" + LINE_BREAK
+               + INDENT * 2 + "self.timing_out = True" + LINE_BREAK
+               + INDENT * 2 + "try:" + LINE_BREAK
+               + INDENT * 3 + "super()._on_timeout(cache)" + LINE_BREAK
+               + INDENT * 2 + "finally:" + LINE_BREAK
+               + INDENT * 3 + "self.timing_out = False" + LINE_BREAK)
+
+
+def produce_rate_limiter_block() -> Iterator[str]:
+    yield ("class TokenBucketLimiter:" + LINE_BREAK
+           + INDENT + "\"\"\"" + LINE_BREAK
+           + INDENT + "A global and a per-address token bucket (a rate of 0 is unlimited)." + LINE_BREAK * 2
+           + INDENT + "Only the buckets of the ``max_peers`` most recently seen addresses are kept." + LINE_BREAK
+           + INDENT + "Messages that find no token are dropped or, if ``defer``, retried once a token is expected,"
+           + LINE_BREAK
+           + INDENT + "with at most ``max_deferred`` messages waiting at a time." + LINE_BREAK
+           + INDENT + "\"\"\"" + LINE_BREAK
+           + INDENT + "__slots__ = (\"peer_rate\", \"peer_burst\", \"global_rate\", \"global_burst\", \"defer\", "
+           + "\"max_peers\", \"max_deferred\"," + LINE_BREAK
+           + INDENT * 4 + " \"peers\", \"global_tokens\", \"global_time\", \"deferred\", \"dropped\")" + LINE_BREAK * 2
+           + INDENT + "def __init__(self, peer_rate, peer_burst, global_rate, global_burst, defer, max_peers, "
+           + "max_deferred):" + LINE_BREAK
+           + INDENT * 2 + "self.peer_rate = peer_rate" + LINE_BREAK
+           + INDENT * 2 + "self.peer_burst = peer_burst" + LINE_BREAK
+           + INDENT * 2 + "self.global_rate = global_rate" + LINE_BREAK
+           + INDENT * 2 + "self.global_burst = global_burst" + LINE_BREAK
+           + INDENT * 2 + "self.defer = defer" + LINE_BREAK
+           + INDENT * 2 + "self.max_peers = max_peers" + LINE_BREAK
+           + INDENT * 2 + "self.max_deferred = max_deferred" + LINE_BREAK
+           + INDENT * 2 + "self.peers = OrderedDict()" + LINE_BREAK
+           + INDENT * 2 + "self.global_tokens = global_burst" + LINE_BREAK
+           + INDENT * 2 + "self.global_time = monotonic()" + LINE_BREAK
+           + INDENT * 2 + "self.deferred = 0" + LINE_BREAK
+           + INDENT * 2 + "self.dropped = 0" + LINE_BREAK * 2
+           + INDENT + "def acquire(self, address) -> float:" + LINE_BREAK
+           + INDENT * 2 + "\"\"\"" + LINE_BREAK
+           + INDENT * 2 + "Take a token for the given address: 0.0 if one was available, otherwise the seconds until "
+           + "one is." + LINE_BREAK
+           + INDENT * 2 + "\"\"\"" + LINE_BREAK
+           + INDENT * 2 + "now = monotonic()" + LINE_BREAK
+           + INDENT * 2 + "wait = 0.0" + LINE_BREAK
+           + INDENT * 2 + "if self.global_rate:" + LINE_BREAK
+           + INDENT * 3 + "self.global_tokens = min(self.global_burst, "
+           + "self.global_tokens + (now - self.global_time) * self.global_rate)" + LINE_BREAK
+           + INDENT * 3 + "self.global_time = now" + LINE_BREAK
+           + INDENT * 3 + "if self.global_tokens < 1:" + LINE_BREAK
+           + INDENT * 4 + "wait = (1 - self.global_tokens) / self.global_rate" + LINE_BREAK
+           + INDENT * 2 + "bucket = None" + LINE_BREAK
+           + INDENT * 2 + "if self.peer_rate:" + LINE_BREAK
+           + INDENT * 3 + "bucket = self.peers.get(address)" + LINE_BREAK
+           + INDENT * 3 + "if bucket is None:" + LINE_BREAK
+           + INDENT * 4 + "bucket = self.peers[address] = [self.peer_burst, now]" + LINE_BREAK
+           + INDENT * 4 + "if len(self.peers) > self.max_peers:" + LINE_BREAK
+           + INDENT * 5 + "self.peers.popitem(last=False)" + LINE_BREAK
+           + INDENT * 3 + "else:" + LINE_BREAK
+           + INDENT * 4 + "self.peers.move_to_end(address)" + LINE_BREAK
+           + INDENT * 4 + "bucket[0] = min(self.peer_burst, bucket[0] + (now - bucket[1]) * self.peer_rate)"
+           + LINE_BREAK
+           + INDENT * 4 + "bucket[1] = now" + LINE_BREAK
+           + INDENT * 3 + "if bucket[0] < 1:" + LINE_BREAK
+           + INDENT * 4 + "wait = max(wait, (1 - bucket[0]) / self.peer_rate)" + LINE_BREAK
+           + INDENT * 2 + "if wait == 0.0:" + LINE_BREAK
+           + INDENT * 3 + "if self.global_rate:" + LINE_BREAK
+           + INDENT * 4 + "self.global_tokens -= 1" + LINE_BREAK
+           + INDENT * 3 + "if bucket is not None:" + LINE_BREAK
+           + INDENT * 4 + "bucket[0] -= 1" + LINE_BREAK
+           + INDENT * 2 + "return wait" + LINE_BREAK * 2
+           + INDENT + "def submit(self, address, handler, *args):" + LINE_BREAK
+           + INDENT * 2 + "wait = self.acquire(address)" + LINE_BREAK
+           + INDENT * 2 + "if wait == 0.0:" + LINE_BREAK
+           + INDENT * 3 + "return handler(*args)" + LINE_BREAK
+           + INDENT * 2 + "if self.defer and self.deferred < self.max_deferred:" + LINE_BREAK
+           + INDENT * 3 + "self.deferred += 1" + LINE_BREAK
+           + INDENT * 3 + "get_running_loop().call_later(wait, self.resubmit, address, handler, args)" + LINE_BREAK
+           + INDENT * 2 + "else:" + LINE_BREAK
+           + INDENT * 3 + "self.dropped += 1" + LINE_BREAK
+           + INDENT * 2 + "return None" + LINE_BREAK * 2
+           + INDENT + "def resubmit(self, address, handler, args):" + LINE_BREAK
+           + INDENT * 2 + "self.deferred -= 1" + LINE_BREAK
+           + INDENT * 2 + "self.submit(address, handler, *args)" + LINE_BREAK * 3
+           + "def rate_limited(limiter_name):" + LINE_BREAK
+           + INDENT + "def decorator(func):" + LINE_BREAK
+           + INDENT * 2 + "@wraps(func)" + LINE_BREAK
+           + INDENT * 2 + "def wrapper(self, source_address, data):" + LINE_BREAK
+           + INDENT * 3 + "# Runs before the message is unpacked, so dropping a message is cheap." + LINE_BREAK
+           + INDENT * 3 + "return getattr(self, limiter_name).submit(source_address, func, self, source_address, data)"
+           + LINE_BREAK
+           + INDENT * 2 + "return wrapper" + LINE_BREAK
+           + INDENT + "return decorator" + LINE_BREAK)
+
+
+def produce_memoizer_block() -> Iterator[str]:
+    yield ("class ResponseMemoizer:" + LINE_BREAK
+           + INDENT + "\"\"\"" + LINE_BREAK
+           + INDENT + "The serialized responses to the ``max_entries`` most recently used requests, for ``ttl`` "
+           + "seconds." + LINE_BREAK
+           + INDENT + "\"\"\"" + LINE_BREAK
+           + INDENT + "__slots__ = (\"max_entries\", \"ttl\", \"entries\", \"hits\", \"misses\", \"evictions\", "
+           + "\"expirations\")" + LINE_BREAK * 2
+           + INDENT + "def __init__(self, max_entries, ttl):" + LINE_BREAK
+           + INDENT * 2 + "self.max_entries = max_entries" + LINE_BREAK
+           + INDENT * 2 + "self.ttl = ttl" + LINE_BREAK
+           + INDENT * 2 + "self.entries = OrderedDict()" + LINE_BREAK
+           + INDENT * 2 + "self.hits = 0" + LINE_BREAK
+           + INDENT * 2 + "self.misses = 0" + LINE_BREAK
+           + INDENT * 2 + "self.evictions = 0" + LINE_BREAK
+           + INDENT * 2 + "self.expirations = 0" + LINE_BREAK * 2
+           + INDENT + "def get(self, key):" + LINE_BREAK
+           + INDENT * 2 + "entry = self.entries.get(key)" + LINE_BREAK
+           + INDENT * 2 + "if entry is not None:" + LINE_BREAK
+           + INDENT * 3 + "packet, expires = entry" + LINE_BREAK
+           + INDENT * 3 + "if expires > monotonic():" + LINE_BREAK
+           + INDENT * 4 + "self.entries.move_to_end(key)" + LINE_BREAK
+           + INDENT * 4 + "self.hits += 1" + LINE_BREAK
+           + INDENT * 4 + "return packet" + LINE_BREAK
+           + INDENT * 3 + "del self.entries[key]" + LINE_BREAK
+           + INDENT * 3 + "self.expirations += 1" + LINE_BREAK
+           + INDENT * 2 + "self.misses += 1" + LINE_BREAK
+           + INDENT * 2 + "return None" + LINE_BREAK * 2
+           + INDENT + "def put(self, key, packet):" + LINE_BREAK
+           + INDENT * 2 + "self.entries[key] = (packet, monotonic() + self.ttl)" + LINE_BREAK
+           + INDENT * 2 + "self.entries.move_to_end(key)" + LINE_BREAK
+           + INDENT * 2 + "if len(self.entries) > self.max_entries:" + LINE_BREAK
+           + INDENT * 3 + "self.entries.popitem(last=False)" + LINE_BREAK
+           + INDENT * 3 + "self.evictions += 1" + LINE_BREAK * 2
+           + INDENT + "def snapshot(self):" + LINE_BREAK
+           + INDENT * 2 + "lookups = self.hits + self.misses" + LINE_BREAK
+           + INDENT * 2 + "return {" + LINE_BREAK
+           + INDENT * 3 + "\"entries\": len(self.entries)," + LINE_BREAK
+           + INDENT * 3 + "\"hits\": self.hits," + LINE_BREAK
+           + INDENT * 3 + "\"misses\": self.misses," + LINE_BREAK
+           + INDENT * 3 + "\"hit_rate\": self.hits / lookups if lookups else 0.0," + LINE_BREAK
+           + INDENT * 3 + "\"evictions\": self.evictions," + LINE_BREAK
+           + INDENT * 3 + "\"expirations\": self.expirations" + LINE_BREAK
+           + INDENT * 2 + "}" + LINE_BREAK)
+
+
+def produce_aggregator_block(batch_msg_id: int) -> Iterator[str]:
+    yield ("# The message id of packets that carry a batch of packets of other messages." + LINE_BREAK
+           + f"BATCH_MSG_ID = {batch_msg_id}" + LINE_BREAK * 3
+           + "class MessageAggregator:" + LINE_BREAK
+           + INDENT + "\"\"\"" + LINE_BREAK
+           + INDENT + "Coalesces the packets to the same address into one batch packet." + LINE_BREAK * 2
+           + INDENT + "A batch is sent ``max_delay`` seconds after its first packet, or as soon as it reaches "
+           + "``max_bytes``." + LINE_BREAK
+           + INDENT + "Its packets are stored behind their length, without the community prefix." + LINE_BREAK
+           + INDENT + "\"\"\"" + LINE_BREAK
+           + INDENT + "__slots__ = (\"community\", \"max_delay\", \"max_bytes\", \"batches\")" + LINE_BREAK * 2
+           + INDENT + "def __init__(self, community, max_delay, max_bytes):" + LINE_BREAK
+           + INDENT * 2 + "self.community = community" + LINE_BREAK
+           + INDENT * 2 + "self.max_delay = max_delay" + LINE_BREAK
+           + INDENT * 2 + "self.max_bytes = max_bytes" + LINE_BREAK
+           + INDENT * 2 + "self.batches = {}" + LINE_BREAK * 2
+           + INDENT + "def send(self, peer, payload):" + LINE_BREAK
+           + INDENT * 2 + "self.send_packet(peer.address, self.community.ezr_pack(payload.msg_id, payload))"
+           + LINE_BREAK * 2
+           + INDENT + "def send_packet(self, address, packet):" + LINE_BREAK
+           + INDENT * 2 + "packet = packet[len(self.community._prefix):]" + LINE_BREAK
+           + INDENT * 2 + "batch = self.batches.get(address)" + LINE_BREAK
+           + INDENT * 2 + "if batch is not None and batch[1] + 2 + len(packet) > self.max_bytes:" + LINE_BREAK
+           + INDENT * 3 + "self.flush(address)" + LINE_BREAK
+           + INDENT * 3 + "batch = None" + LINE_BREAK
+           + INDENT * 2 + "if batch is None:" + LINE_BREAK
+           + INDENT * 3 + "batch = self.batches[address] = [[], len(self.community._prefix) + 1, "
+           + "get_running_loop().call_later(self.max_delay, self.flush, address)]" + LINE_BREAK
+           + INDENT * 2 + "batch[0].append(packet)" + LINE_BREAK
+           + INDENT * 2 + "batch[1] += 2 + len(packet)" + LINE_BREAK
+           + INDENT * 2 + "if batch[1] >= self.max_bytes:" + LINE_BREAK
+           + INDENT * 3 + "self.flush(address)" + LINE_BREAK * 2
+           + INDENT + "def flush(self, address):" + LINE_BREAK
+           + INDENT * 2 + "packets, _, timer = self.batches.pop(address)" + LINE_BREAK
+           + INDENT * 2 + "timer.cancel()" + LINE_BREAK
+           + INDENT * 2 + "if len(packets) == 1:" + LINE_BREAK
+           + INDENT * 3 + "# A single packet is sent as it is." + LINE_BREAK
+           + INDENT * 3 + "self.community.endpoint.send(address, self.community._prefix + packets[0])" + LINE_BREAK
+           + INDENT * 2 + "else:" + LINE_BREAK
+           + INDENT * 3 + "self.community.endpoint.send(address, self.community._prefix + bytes((BATCH_MSG_ID,)) + "
+           + "b\"\".join(" + LINE_BREAK
+           + INDENT * 4 + "pack(\">H\", len(packet)) + packet for packet in packets))" + LINE_BREAK * 2
+           + INDENT + "def flush_all(self):" + LINE_BREAK
+           + INDENT * 2 + "for address in list(self.batches):" + LINE_BREAK
+           + INDENT * 3 + "self.flush(address)" + LINE_BREAK)
+
+
+def produce_batch_handler_block() -> Iterator[str]:
+    yield (INDENT + "def on_batch(self, source_address, data):" + LINE_BREAK
+           + INDENT * 2 + "offset = len(self._prefix) + 1" + LINE_BREAK
+           + INDENT * 2 + "while offset + 2 <= len(data):" + LINE_BREAK
+           + INDENT * 3 + "length, = unpack_from(\">H\", data, offset)" + LINE_BREAK
+           + INDENT * 3 + "packet = data[offset + 2:offset + 2 + length]" + LINE_BREAK
+           + INDENT * 3 + "offset += 2 + length" + LINE_BREAK
+           + INDENT * 3 + "# Batches in batches are dropped, instead of unpacked recursively." + LINE_BREAK
+           + INDENT * 3 + "if length > 0 and len(packet) == length and packet[0] != BATCH_MSG_ID:" + LINE_BREAK
+           + INDENT * 4 + "self.on_packet((source_address, self._prefix + packet))" + LINE_BREAK)
+
+
+def produce_stats_methods_block(memoizer_ids: Optional[List[int]] = None) -> Iterator[str]:
+    yield (INDENT + "def ezr_pack(self, msg_num: int, *payloads, **kwargs) -> bytes:" + LINE_BREAK
+           + INDENT * 2 + "packet = super().ezr_pack(msg_num, *payloads, **kwargs)" + LINE_BREAK
+           + INDENT * 2 + "self.stats.bytes_out[msg_num] += len(packet)" + LINE_BREAK
+           + INDENT * 2 + "return packet" + LINE_BREAK * 2
+           + INDENT + "def stats_snapshot(self) -> dict:" + LINE_BREAK)
+    if not memoizer_ids:
+        yield INDENT * 2 + "return self.stats.snapshot()" + LINE_BREAK
+        return
+    yield (INDENT * 2 + "return dict(self.stats.snapshot(), memoizers={" + LINE_BREAK
+           + "".join(f"{INDENT * 3}\"memoizer_{memoizer_id}\": self.memoizer_{memoizer_id}.snapshot()," + LINE_BREAK
+                     for memoizer_id in memoizer_ids)
+           + INDENT * 2 + "})" + LINE_BREAK)
+
+
+def produce_offload_methods_block(max_offloaded: int) -> Iterator[str]:
+    yield (INDENT + "def offload(self, executor, work, done, peer, message, *args):" + LINE_BREAK
+           + INDENT * 2 + "\"\"\"" + LINE_BREAK
+           + INDENT * 2 + "Run ``work(message)`` on the executor and then ``done(peer, message, *args, result)`` on "
+           + "the event loop." + LINE_BREAK
+           + INDENT * 2 + f"Messages are dropped while {max_offloaded} others are waiting for an executor." + LINE_BREAK
+           + INDENT * 2 + "\"\"\"" + LINE_BREAK
+           + INDENT * 2 + f"if self.offloaded >= {max_offloaded}:" + LINE_BREAK
+           + INDENT * 3 + "return" + LINE_BREAK
+           + INDENT * 2 + "self.offloaded += 1" + LINE_BREAK
+           + INDENT * 2 + "self.register_anonymous_task(\"offload\", self.run_offloaded, executor, work, done, peer, "
+           + "message, *args)" + LINE_BREAK * 2
+           + INDENT + "async def run_offloaded(self, executor, work, done, peer, message, *args):" + LINE_BREAK
+           + INDENT * 2 + "try:" + LINE_BREAK
+           + INDENT * 3 + "result = await get_running_loop().run_in_executor(executor, work, message)" + LINE_BREAK
+           + INDENT * 2 + "finally:" + LINE_BREAK
+           + INDENT * 3 + "self.offloaded -= 1" + LINE_BREAK
+           + INDENT * 2 + "done(peer, message, *args, result)" + LINE_BREAK)
+
+
+def produce_scheduler_block(scheduler_id: int, interval: float, tasks: List[Tuple[int, int]],
+                            interval_jitter=0.0) -> Iterator[str]:
+    yield (f"{INDENT}async def scheduler_{scheduler_id}(self):" + LINE_BREAK
+           + INDENT * 2 + "tick = 0" + LINE_BREAK
+           + INDENT * 2 + "while True:" + LINE_BREAK)
+    # A selector that raises is logged, instead of ending the loop and with it every other task of the scheduler.
+    for task_id, ticks in tasks:
+        depth = 3 if ticks == 1 else 4
+        if ticks != 1:
+            yield INDENT * 3 + f"if tick % {ticks} == 0:" + LINE_BREAK
+        yield (INDENT * depth + "try:" + LINE_BREAK
+               + INDENT * (depth + 1) + f"self.selector_{task_id}()" + LINE_BREAK
+               + INDENT * depth + "except Exception:" + LINE_BREAK
+               + INDENT * (depth + 1) + f"self.logger.exception(\"selector_{task_id} failed\")" + LINE_BREAK)
+    yield INDENT * 3 + "tick += 1" + LINE_BREAK
+    if interval_jitter:
+        yield (INDENT * 3 + f"await sleep({interval} * (1 + uniform(-{interval_jitter}, {interval_jitter})))"
+               + LINE_BREAK)
+    else:
+        yield INDENT * 3 + f"await sleep({interval})" + LINE_BREAK
+
+
+def produce_peer_sampling_block() -> Iterator[str]:
+    yield (INDENT + "def sample_peers(self, k: int) -> List[Peer]:" + LINE_BREAK
+           + INDENT * 2 + "# The peers are only copied when they changed, not on every call. Comparing the sets detects"
+           + LINE_BREAK
+           + INDENT * 2 + "# a peer that left and another that joined, without copying either." + LINE_BREAK
+           + INDENT * 2 + "if self.network.verified_peers != self.peer_pool_members:" + LINE_BREAK
+           + INDENT * 3 + "self.peer_pool = self.get_peers()" + LINE_BREAK
+           + INDENT * 3 + "self.peer_pool_members = set(self.network.verified_peers)" + LINE_BREAK
+           + INDENT * 2 + "if k < len(self.peer_pool):" + LINE_BREAK
+           + INDENT * 3 + "return [self.peer_pool[i] for i in sample(range(len(self.peer_pool)), k)]" + LINE_BREAK
+           + INDENT * 2 + "return self.peer_pool" + LINE_BREAK)
 
 
 def produce_selector_block(selector_id: int, linked_message_classes: List[str],
-                           all_peers: Optional[bool] = False, header=True) -> str:
-    out = ""
+                           all_peers: Optional[bool] = False, header=True, serialize_once=False,
+                           fan_out=1, instrumented=False,
+                           aggregators: Optional[List[Optional[int]]] = None) -> Iterator[str]:
+    """
+    The messages of which the ``aggregators`` entry is not ``None`` are sent through that aggregator.
+    """
+    aggregators = aggregators or [None] * len(linked_message_classes)
     if header:
-        out = f"{INDENT}def selector_{selector_id}(self):" + LINE_BREAK
+        if instrumented:
+            yield f"{INDENT}@instrumented(\"selector_{selector_id}\")" + LINE_BREAK
+        yield f"{INDENT}def selector_{selector_id}(self):" + LINE_BREAK
         if all_peers is None:
-            out += INDENT * 2 + "pass" + LINE_BREAK
-            return out
+            yield INDENT * 2 + "pass" + LINE_BREAK
+            return
+    if all_peers and serialize_once and linked_message_classes:
+        # The packets do not depend on the receiving peer: serialize (and sign) them once, instead of once per peer.
+        if instrumented:
+            yield INDENT * 2 + "# Packed without counting, as the bytes are counted once per peer below." + LINE_BREAK
+        pack = "super().ezr_pack" if instrumented else "self.ezr_pack"
+        yield INDENT * 2 + "packets = [" + LINE_BREAK
+        for linked_message_class in linked_message_classes:
+            yield (INDENT * 3 + f"{pack}({linked_message_class}.msg_id, {linked_message_class}("
+                   + "NotImplementedError(\"Fill your message fields here\"))),") + LINE_BREAK
+        yield (INDENT * 2 + "]" + LINE_BREAK
+               + INDENT * 2 + "for peer in self.get_peers():" + LINE_BREAK)
+        if all(aggregator is None for aggregator in aggregators) and not instrumented:
+            yield (INDENT * 3 + "for packet in packets:" + LINE_BREAK
+                   + INDENT * 4 + "self.endpoint.send(peer.address, packet)" + LINE_BREAK)
+            return
+        for i, (linked_message_class, aggregator) in enumerate(zip(linked_message_classes, aggregators)):
+            if instrumented:
+                yield (INDENT * 3 + f"self.stats.bytes_out[{linked_message_class}.msg_id] += len(packets[{i}])"
+                       + LINE_BREAK)
+            sender = "self.endpoint.send" if aggregator is None else f"self.aggregator_{aggregator}.send_packet"
+            yield INDENT * 3 + f"{sender}(peer.address, packets[{i}])" + LINE_BREAK
+        return
     peers_inst_name = "peer" if all_peers else "random_peer"
     if all_peers:
-        out += INDENT * 2 + "for peer in self.get_peers():" + (LINE_BREAK if len(linked_message_classes) == 0 else "")
+        yield INDENT * 2 + "for peer in self.get_peers():" + (LINE_BREAK if len(linked_message_classes) == 0 else "")
     else:
-        out += (INDENT * 2 + "known_peers = self.get_peers()" + LINE_BREAK
-                + INDENT * 2 + "if known_peers:" + LINE_BREAK
-                + INDENT * 3 + f"{peers_inst_name} = sample(known_peers, 1)" + LINE_BREAK)
-    for linked_message_class in linked_message_classes:
-        out += LINE_BREAK
-        out += (INDENT * 3 + f"self.ez_send({peers_inst_name}, {linked_message_class}(NotImplementedError("
-                + "\"Fill your message fields here\")))" + LINE_BREAK)
-    return out
+        yield (INDENT * 2 + f"for random_peer in self.sample_peers({fan_out}):"
+               + (LINE_BREAK if len(linked_message_classes) == 0 else ""))
+    for linked_message_class, aggregator in zip(linked_message_classes, aggregators):
+        sender = "self.ez_send" if aggregator is None else f"self.aggregator_{aggregator}.send"
+        yield (LINE_BREAK
+               + INDENT * 3 + f"{sender}({peers_inst_name}, {linked_message_class}(NotImplementedError("
+               + "\"Fill your message fields here\")))" + LINE_BREAK)
 
 
 def produce_message_handler_block(message_class_name: str, input_cache: Optional[str] = None,
-                                  output_cache: Optional[str] = None, response: Optional[str] = None) -> str:
-    out = f"{INDENT}@lazy_wrapper({message_class_name})" + LINE_BREAK
+                                  output_cache: Optional[str] = None, response: Optional[str] = None,
+                                  handler_name: Optional[str] = None, instrumented=False,
+                                  rate_limiter: Optional[int] = None, offload: Optional[str] = None,
+                                  work_name: Optional[str] = None, done_name: Optional[str] = None,
+                                  response_aggregator: Optional[int] = None, memoizer: Optional[int] = None,
+                                  memo_fields: Optional[List[list]] = None) -> Iterator[str]:
+    """
+    With ``offload`` (``"thread"`` or ``"process"``), the handler only hands the message to ``work_name``, which runs on
+    that executor. The response and output cache are then sent and created by ``done_name``, back on the event loop.
+    With a ``response_aggregator``, the response is sent through that aggregator.
+    With a ``memoizer``, the serialized response is remembered per value of the ``memo_fields`` of the message (pairs
+    of a field name and whether it is a list) and sent again, without handling the message, for the same values.
+    """
+    if handler_name is None:
+        handler_name = f"on_{camel_to_joined_lower(message_class_name)}"
+    work_name = work_name or f"{handler_name}_work"
+    done_name = done_name or f"{handler_name}_done"
+    if rate_limiter is not None:
+        yield f"{INDENT}@rate_limited(\"rate_limiter_{rate_limiter}\")" + LINE_BREAK
+    if instrumented:
+        yield f"{INDENT}@instrumented(\"{handler_name}\", {message_class_name}.msg_id)" + LINE_BREAK
+    yield f"{INDENT}@lazy_wrapper({message_class_name})" + LINE_BREAK
     if input_cache:
-        out += f"{INDENT}@retrieve_cache({input_cache})" + LINE_BREAK
-    out += (f"{INDENT}def on_{camel_to_joined_lower(message_class_name)}"
-            f"(self, peer: Peer, message: {message_class_name}"
-            + (f", cache: {input_cache}" if input_cache else "")
-            + "):" + LINE_BREAK)
-    out += INDENT * 2 + "raise NotImplementedError(\"Fill this function with your handling logic\")" + LINE_BREAK
+        yield f"{INDENT}@retrieve_cache({input_cache})" + LINE_BREAK
+    yield (f"{INDENT}def {handler_name}"
+           f"(self, peer: Peer, message: {message_class_name}"
+           + (f", cache: {input_cache}" if input_cache else "")
+           + "):" + LINE_BREAK)
+    sender = ("self.endpoint.send" if response_aggregator is None
+              else f"self.aggregator_{response_aggregator}.send_packet")
+    if response is None:
+        memoizer = None
+    if memoizer is not None:
+        # Lists are not hashable, so list fields are part of the key as tuples.
+        key_parts = [f"{message_class_name}.msg_id"] + [f"tuple(message.{name})" if is_list_field else f"message.{name}"
+                                                        for name, is_list_field in memo_fields or []]
+        memo_key = "(" + ", ".join(key_parts) + ("," if len(key_parts) == 1 else "") + ")"
+        yield (INDENT * 2 + f"packet = self.memoizer_{memoizer}.get({memo_key})" + LINE_BREAK
+               + INDENT * 2 + "if packet is not None:" + LINE_BREAK
+               + (INDENT * 3 + f"self.stats.bytes_out[{response}.msg_id] += len(packet)" + LINE_BREAK
+                  if instrumented else "")
+               + INDENT * 3 + f"{sender}(peer.address, packet)" + LINE_BREAK
+               + INDENT * 3 + "return" + LINE_BREAK)
+    separator = LINE_BREAK
+    if offload is not None:
+        yield (INDENT * 2 + f"self.offload(self.{offload}_executor, self.{work_name}, self.{done_name}, peer, message"
+               + (", cache" if input_cache else "") + ")" + LINE_BREAK * 2
+               + INDENT + "@staticmethod" + LINE_BREAK
+               + INDENT + f"def {work_name}(message: {message_class_name}):" + LINE_BREAK
+               + INDENT * 2 + ("# Runs on a thread pool: do not use the community here." if offload == "thread"
+                               else "# Runs in a worker process: only use the message and module-level code here.")
+               + LINE_BREAK)
+    yield INDENT * 2 + "raise NotImplementedError(\"Fill this function with your handling logic\")" + LINE_BREAK
+    if offload is not None:
+        yield (LINE_BREAK
+               + f"{INDENT}def {done_name}(self, peer: Peer, message: {message_class_name}"
+               + (f", cache: {input_cache}" if input_cache else "") + ", result):" + LINE_BREAK
+               + INDENT * 2 + f"# Runs on the event loop, with the result of {work_name}." + LINE_BREAK)
+        if output_cache is None and response is None:
+            yield INDENT * 2 + "pass" + LINE_BREAK
+        separator = ""
     indents = 2
     if output_cache is not None:
-        out += LINE_BREAK
-        out += f"{INDENT * 2}cache = self.request_cache.add({output_cache}(self.request_cache, NotImplementedError("
-        out += "\"Fill your cache fields here\""
-        out += ")))" + LINE_BREAK
+        yield (separator
+               + f"{INDENT * 2}cache = self.request_cache.add({output_cache}(self.request_cache, NotImplementedError("
+               + "\"Fill your cache fields here\""
+               + ")))" + LINE_BREAK)
         if response is not None:
-            out += INDENT * 2 + "if cache is not None:" + LINE_BREAK
+            yield INDENT * 2 + "if cache is not None:" + LINE_BREAK
             indents += 1
-    if response is not None:
-        out += LINE_BREAK if output_cache is None else ""
-        out += (f"{INDENT * indents}self.ez_send(peer, {response}(NotImplementedError("
-                "\"Fill your response message here\""
-                f"))){LINE_BREAK}")
-    return out
+    if memoizer is not None:
+        yield ((separator if output_cache is None else "")
+               + INDENT * indents + f"packet = self.ezr_pack({response}.msg_id, {response}(NotImplementedError("
+               + "\"Fill your response message here\"" + ")))" + LINE_BREAK
+               + INDENT * indents + f"self.memoizer_{memoizer}.put({memo_key}, packet)" + LINE_BREAK
+               + INDENT * indents + f"{sender}(peer.address, packet)" + LINE_BREAK)
+    elif response is not None:
+        yield ((separator if output_cache is None else "")
+               + INDENT * indents
+               + ("self.ez_send" if response_aggregator is None else f"self.aggregator_{response_aggregator}.send")
+               + f"(peer, {response}(NotImplementedError("
+               + "\"Fill your response message here\""
+               + f"))){LINE_BREAK}")
+
+
+def join_blocks(blocks: Iterable[Iterable[str]], separator: str) -> Iterator[str]:
+    """
+    Stream the fragments of the given blocks, with the separator in between blocks.
+    """
+    first = True
+    for block in blocks:
+        if not first:
+            yield separator
+        first = False
+        yield from block
+
+
+class CodeWriter:
+    """
+    Buffers generated code fragments and flushes them to the underlying file in chunks of ``buffer_size`` characters.
+    If a ``digest`` is given, it is updated with everything that is written.
+    """
+
+    def __init__(self, fp: TextIO, buffer_size: int = 1 << 16, digest=None):
+        self.fp = fp
+        self.digest = digest
+        self.buffer_size = buffer_size
+        self.buffer: List[str] = []
+        self.buffered = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+
+    def write(self, fragment: str) -> None:
+        self.buffer.append(fragment)
+        self.buffered += len(fragment)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def write_all(self, fragments: Iterable[str]) -> None:
+        for fragment in fragments:
+            self.write(fragment)
+
+    def flush(self) -> None:
+        if self.buffer:
+            chunk = "".join(self.buffer)
+            self.fp.write(chunk)
+            if self.digest is not None:
+                self.digest.update(chunk.encode())
+            self.buffer.clear()
+            self.buffered = 0
+
+
+class SymbolTable:
+    """
+    Resolves every generated identifier once per export, in linear time.
+
+    Titles that map onto the same class or method name (e.g. ``FooBar`` and ``Foo_bar`` both map to ``on_foo_bar``)
+    are numbered, or cause a ``RuntimeError`` if ``rename_collisions`` is ``False``.
+    Every resolution that changed a name is recorded in ``renames``.
+    """
+
+    def __init__(self, message_nodes, cache_nodes, task_count: int, rename_collisions: bool = True,
+                 community_name: str = DEFAULT_COMMUNITY_NAME):
+        self.rename_collisions = rename_collisions
+        self.renames: List[str] = []
+        self.next_suffixes: Dict[str, int] = {}
+        self.class_names: Dict[object, str] = {}
+        self.handler_names: Dict[object, str] = {}
+        self.offload_names: Dict[object, Tuple[str, str]] = {}
+
+        module_names = set(RESERVED_MODULE_NAMES)
+        module_names.add(community_name)
+        method_names = set(RESERVED_METHOD_NAMES)
+        method_names.update(f"selector_{i}" for i in range(task_count))
+        for node in list(message_nodes) + list(cache_nodes):
+            self.class_names[node] = self.claim(to_identifier(node.display_title), module_names, node.display_title)
+        for node in message_nodes:
+            class_name = self.class_names[node]
+            handler_name = f"on_{camel_to_joined_lower(class_name)}"
+            self.handler_names[node] = self.claim(handler_name, method_names, handler_name)
+        for node in message_nodes:
+            if node.offload != "inline":
+                work_name = f"{self.handler_names[node]}_work"
+                done_name = f"{self.handler_names[node]}_done"
+                self.offload_names[node] = (self.claim(work_name, method_names, work_name),
+                                            self.claim(done_name, method_names, done_name))
+
+    def claim(self, name: str, taken: set, title: str) -> str:
+        """
+        Claim the given name, derived from the given title, in the namespace of the ``taken`` names.
+        """
+        resolved = name
+        if resolved in taken:
+            if not self.rename_collisions:
+                raise RuntimeError(f"\"{title}\" maps to the name \"{name}\", which is already in use!")
+            suffix = self.next_suffixes.get(name, 1)
+            while f"{name}_{suffix}" in taken:
+                suffix += 1
+            self.next_suffixes[name] = suffix + 1
+            resolved = f"{name}_{suffix}"
+        if resolved != title:
+            self.renames.append(f"\"{title}\" is exported as \"{resolved}\"")
+        taken.add(resolved)
+        return sys.intern(resolved)
+
+    def class_name(self, node) -> Optional[str]:
+        return None if node is None else self.class_names[node]
+
+
+class BlockCache:
+    """
+    Generated blocks of previous exports, for incremental exports.
+
+    The blocks of a node are stored under its ``graph.node_key`` (its id and edit version) and the names and ids that
+    they refer to, which are cheap to compare. Blocks that were not used by the last export are evicted. The state of
+    the graph that every file was last exported from is kept as well, so exporting an unchanged graph again does not
+    generate any code. Nodes that are edited in place must be marked with ``graph.touch``.
+    """
+
+    def __init__(self):
+        self.blocks: Dict[tuple, str] = {}
+        self.live_blocks: Dict[tuple, str] = {}
+        self.output_states: Dict[str, Tuple[bytes, int, int]] = {}
+        self.export_states: Dict[str, tuple] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def start_export(self) -> None:
+        self.live_blocks = {}
+        self.hits = 0
+        self.misses = 0
+
+    def finish_export(self) -> None:
+        self.blocks = self.live_blocks
+        self.live_blocks = {}
+
+    def get(self, key: tuple, produce: Callable[[], Iterable[str]]) -> str:
+        block = self.blocks.get(key)
+        if block is None:
+            block = "".join(produce())
+            self.misses += 1
+        else:
+            self.hits += 1
+        self.live_blocks[key] = block
+        return block
+
+    def output_changed(self, file_path: str, digest: bytes) -> bool:
+        """
+        Whether the given file does not already contain output with the given digest.
+        """
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return True
+        known = self.output_states.get(file_path)
+        if known is None or known[1:] != (stat.st_mtime_ns, stat.st_size):
+            with open(file_path, "rb") as fp:
+                known = (sha1(fp.read()).digest(), stat.st_mtime_ns, stat.st_size)
+            self.output_states[file_path] = known
+        return known[0] != digest
+
+    def export_unchanged(self, file_path: str, export_state: tuple) -> bool:
+        """
+        Whether the given file still holds the output of the last export, and that export was of the given state.
+        """
+        known = self.output_states.get(file_path)
+        if known is None or self.export_states.get(file_path) != export_state:
+            return False
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return False
+        return known[1:] == (stat.st_mtime_ns, stat.st_size)
+
+    def output_written(self, file_path: str, digest: bytes, export_state: tuple) -> None:
+        stat = os.stat(file_path)
+        self.output_states[file_path] = (digest, stat.st_mtime_ns, stat.st_size)
+        self.export_states[file_path] = export_state
 
 
 class Exporter:
 
-    def __init__(self, nodes):
+    def __init__(self, nodes, block_cache: Optional[BlockCache] = None, rename_collisions: bool = True,
+                 timer_mode: str = "per_task", start_jitter: float = 0.0, interval_jitter: float = 0.0,
+                 payload_style: str = "dataclass", instrument: bool = False,
+                 community_name: str = DEFAULT_COMMUNITY_NAME, offload_workers: int = 4, max_offloaded: int = 256):
+        """
+        Nodes are matched on their ``title``, so both Ryven nodes and the Qt-free ``graph.GraphNode`` can be exported.
+
+        If a ``BlockCache`` is given, only the blocks of changed nodes are regenerated and unchanged output is not
+        written again. The same cache should be passed to the ``Exporter`` of every subsequent export, and nodes that
+        are edited in between must be marked with ``graph.touch``.
+
+        Generated names that collide are numbered, unless ``rename_collisions`` is ``False``: then a ``RuntimeError``
+        is raised before any code is generated.
+
+        With the ``"coalesced"`` ``timer_mode``, periodic tasks with compatible intervals share one generated scheduler
+        loop. Tasks start after a random delay of up to ``start_jitter`` seconds and their intervals vary randomly by up
+        to ``interval_jitter`` (a fraction of the interval, below 1), so that peers do not fire in lockstep.
+
+        With the ``"compiled"`` ``payload_style``, messages become classes with ``__slots__``, without a per-instance
+        ``__dict__``, and (un)packing code in which the format of every field is resolved at export time. Messages with
+        fields that have no fixed serializer format (``object`` and lists), or with fields that the class itself uses
+        (see ``PAYLOAD_ATTRIBUTES``), remain dataclasses.
+
+        With ``instrument``, the generated handlers, selectors and request cache keep call counts, errors, latency
+        histograms, bytes per message type and cache occupancy, which ``MyCommunity.stats_snapshot()`` returns.
+        Without it, no instrumentation code is generated at all.
+
+        The community class is called ``community_name``. Its community id is derived from the messages and, unless it
+        is the default ``MyCommunity``, from the name: different communities with the same messages get different ids.
+
+        Messages with an ``offload`` other than ``"inline"`` are handled on a thread or process pool executor of
+        ``offload_workers`` workers. At most ``max_offloaded`` messages wait for an executor, later messages are
+        dropped.
+
+        The responses to messages that are connected to a memoizer are serialized once per value of the fields of the
+        message, and sent again until they expire. Messages with a cache (or with a response with a cache) are not
+        memoized, as every response carries a different cache identifier, and neither are messages with ``object``
+        fields, which may not be hashable.
+
+        Messages that are connected to an aggregator are sent through it, by every selector and handler that sends
+        them. The aggregator coalesces the packets to the same peer into batch packets, which are unpacked on arrival.
+        Batch packets have the fixed ``graph.BATCH_MSG_ID``: designs with so many messages that their ids would reach it
+        (or the ids of IPv8 itself) raise a ``RuntimeError``.
+        """
         super().__init__()
 
-        self.all_peer_selector_nodes: List[AllPeersNode] = []
-        self.random_peer_selector_nodes: List[RandomPeerNode] = []
-        self.cache_nodes: List[CacheNode] = []
-        self.message_nodes: List[MessageNode] = []
-        self.task_nodes: List[PeriodicTaskNode] = []
+        if timer_mode not in TIMER_MODES:
+            raise RuntimeError(f"Unknown timer mode: {timer_mode}!")
+        if payload_style not in PAYLOAD_STYLES:
+            raise RuntimeError(f"Unknown payload style: {payload_style}!")
+        if not 0 <= interval_jitter < 1:
+            raise RuntimeError(f"Interval jitter must be at least 0 and less than 1, got {interval_jitter}!")
+
+        self.nodes = list(nodes)
+        self.block_cache = block_cache
+        # Everything besides the nodes that the output depends on.
+        self.options = (rename_collisions, timer_mode, start_jitter, interval_jitter, payload_style, instrument,
+                        community_name, offload_workers, max_offloaded)
+        self.timer_mode = timer_mode
+        self.start_jitter = start_jitter
+        self.interval_jitter = interval_jitter
+        self.payload_style = payload_style
+        self.instrument = instrument
+        self.community_name = community_name
+        self.offload_workers = offload_workers
+        self.max_offloaded = max_offloaded
+
+        self.all_peer_selector_nodes = []
+        self.random_peer_selector_nodes = []
+        self.cache_nodes = []
+        self.message_nodes = []
+        self.task_nodes = []
+        self.rate_limiter_nodes = []
+        self.aggregator_nodes = []
+        self.memoizer_nodes = []
 
-        for node in nodes:
-            if isinstance(node, AllPeersNode):
+        for node in self.nodes:
+            if node.title == "Aggregator":
+                self.aggregator_nodes.append(node)
+            elif node.title == "Memoizer":
+                self.memoizer_nodes.append(node)
+            elif node.title == "AllPeers":
                 self.all_peer_selector_nodes.append(node)
-            elif isinstance(node, RandomPeerNode):
+            elif node.title == "RandomPeer":
                 self.random_peer_selector_nodes.append(node)
-            elif isinstance(node, CacheNode):
+            elif node.title == "Cache":
                 self.cache_nodes.append(node)
-            elif isinstance(node, MessageNode):
+            elif node.title == "Message":
                 self.message_nodes.append(node)
-            elif isinstance(node, PeriodicTaskNode):
+            elif node.title == "PeriodicTask":
                 self.task_nodes.append(node)
+            elif node.title == "RateLimiter":
+                self.rate_limiter_nodes.append(node)
             else:
                 raise RuntimeError("Unknown node found!")
 
-    def export(self, file_path):
-        has_caches = len(self.cache_nodes) > 0
-        has_random_selector = len(self.random_peer_selector_nodes) > 0
+        self.index = GraphIndex(self.nodes)
+        self.symbols = SymbolTable(self.message_nodes, self.cache_nodes, len(self.task_nodes), rename_collisions,
+                                   community_name)
+        self.rate_limiter_ids = {node: i for i, node in enumerate(
+            node for node in self.rate_limiter_nodes if self.index.targets(node, "limits"))}
+        self.aggregator_ids = {node: i for i, node in enumerate(
+            node for node in self.aggregator_nodes if self.index.targets(node, "aggregates"))}
+        self.memoizer_ids = {node: i for i, node in enumerate(
+            node for node in self.memoizer_nodes if any(self.memoizes(message_node)
+                                                        for message_node in self.index.targets(node, "memoizes")))}
+        # Messages are numbered in order, so they may not reach the ids that IPv8 or the aggregators use.
+        max_messages = BATCH_MSG_ID if self.aggregator_ids else FIRST_RESERVED_MSG_ID
+        if len(self.message_nodes) > max_messages:
+            raise RuntimeError(f"A community can have at most {max_messages} messages, "
+                               f"found {len(self.message_nodes)}!")
+
+    def node_block(self, node, produce: Callable[[], Iterable[str]], *key) -> Iterable[str]:
+        """
+        The block that ``produce()`` generates for the given node. The ``key`` holds the kind of block and the names
+        and ids of other nodes that the block refers to: everything else may only depend on the node itself.
+        """
+        if self.block_cache is None:
+            return produce()
+        return self.block_cache.get((*node_key(node), *key), produce),
+
+    def export_state(self) -> tuple:
+        """
+        Everything that the output is generated from: the ``node_key`` of every node and the options.
+        """
+        return self.options, tuple(node_key(node) for node in self.nodes)
 
-        code_import_block = produce_imports_block(has_caches, has_random_selector)
-        code_message_blocks = []
-        known_message_classes = []
-        message_signature = sha1()
+    def field_formats(self, message_node) -> Optional[Dict[str, str]]:
+        """
+        The serializer formats of the fields of a message, if it is to be exported as a compiled payload.
+        """
+        if self.payload_style != "compiled" or not PAYLOAD_ATTRIBUTES.isdisjoint(message_node.custom_fields_dict):
+            return None
+        formats = {name: serializer_format(field_type) for name, field_type in message_node.custom_fields_dict.items()}
+        return None if None in formats.values() else formats
+
+    def message_block(self, i: int, message_node, class_name: str, has_cache: bool) -> Iterable[str]:
+        field_formats = self.field_formats(message_node)
+        if field_formats is not None:
+            return produce_compiled_message_block(i, class_name, field_formats, has_cache)
+        return produce_message_block(i, class_name, fields_annotations(message_node.custom_fields_dict), has_cache)
+
+    def message_blocks(self, message_signature) -> Iterator[Iterable[str]]:
         for i, message_node in enumerate(self.message_nodes):
-            message_signature.update(f"{i}{dumps(message_node.custom_fields_dict)}".encode())
-            known_message_classes.append(message_node.display_title)
-            code_message_blocks.append(produce_message_block(i, message_node.display_title,
-                                                             message_node.custom_fields_dict, message_node.has_cache()))
-        code_cache_blocks = []
+            message_signature.update("".join(self.node_block(
+                message_node, lambda: (f"{i}{dumps(message_node.custom_fields_dict)}",), "signature", i)).encode())
+            class_name = self.symbols.class_name(message_node)
+            has_cache = self.index.has_cache(message_node)
+            yield self.node_block(message_node,
+                                  lambda: self.message_block(i, message_node, class_name, has_cache),
+                                  "message", i, class_name, has_cache, self.payload_style)
+
+    def cache_blocks(self) -> Iterator[Iterable[str]]:
         for cache_node in self.cache_nodes:
-            code_cache_blocks.append(produce_cache_block(cache_node.display_title, cache_node.custom_fields_dict))
-        code_community_block = produce_community_block(repr(message_signature.digest())[2:-1])
-        code_init_block = produce_init_block(known_message_classes,
-                                             [(i, node.interval) for i, node in enumerate(self.task_nodes)],
-                                             has_caches)
-        code_message_selector_blocks = []
+            class_name = self.symbols.class_name(cache_node)
+            yield self.node_block(cache_node,
+                                  lambda: produce_cache_block(
+                                      class_name, fields_annotations(cache_node.custom_fields_dict, serialized=False),
+                                      None if cache_node.timeout == DEFAULT_CACHE_TIMEOUT else cache_node.timeout,
+                                      cache_node.on_timeout),
+                                  "cache", class_name)
+
+    def cache_limits(self) -> Dict[str, int]:
+        return {self.symbols.class_name(cache_node): cache_node.max_outstanding for cache_node in self.cache_nodes
+                if cache_node.max_outstanding > 0}
+
+    def rate_limiters(self) -> List[list]:
+        return [[i, node.peer_rate, node.peer_burst, node.global_rate, node.global_burst, node.policy == "defer",
+                 node.max_peers, node.max_deferred] for node, i in self.rate_limiter_ids.items()]
+
+    def aggregators(self) -> List[list]:
+        return [[i, node.max_delay, node.max_bytes] for node, i in self.aggregator_ids.items()]
+
+    def aggregator_id(self, message_node) -> Optional[int]:
+        """
+        The aggregator that the given message is sent through, if any.
+        """
+        return self.aggregator_ids.get(self.index.first_source(message_node, "aggregate"))
+
+    def memoizes(self, message_node) -> bool:
+        """
+        Whether the responses to the given message can be memoized: the fields of the message make up the key of the
+        memoizer, so they must be hashable.
+        """
+        response_message = self.index.first_target(message_node, "response")
+        return (response_message is not None and not self.index.has_cache(message_node)
+                and not self.index.has_cache(response_message)
+                and all(is_hashable(field_type) for field_type in message_node.custom_fields_dict.values()))
+
+    def memoizers(self) -> List[list]:
+        return [[i, node.max_entries, node.ttl] for node, i in self.memoizer_ids.items()]
+
+    def memoizer_id(self, message_node) -> Optional[int]:
+        """
+        The memoizer of the responses to the given message, if any.
+        """
+        if not self.memoizes(message_node):
+            return None
+        return self.memoizer_ids.get(self.index.first_source(message_node, "memoize"))
+
+    def selector_blocks(self) -> Iterator[Iterator[str]]:
         for i, task_node in enumerate(self.task_nodes):
-            selector_port = [port for port in task_node.outputs if port.label_str == "on_timer_fire"]
-            if not selector_port:
-                code_message_selector_blocks.append(produce_selector_block(i, [], None))
+            selectors = self.index.targets(task_node, "on_timer_fire")
+            if not selectors:
+                yield produce_selector_block(i, [], None, True, False, 1, self.instrument)
                 continue
-            selectors = selector_port[0].connections
             first = True
-            for selector_connection in selectors:
-                all_peers_links = []
-                random_peers_links = []
-                selector = selector_connection.inp.node
-                links_to = [port.connections for port in selector.outputs if port.label_str == "message"][0]
-                links_to = [connection.inp.node.display_title for connection in links_to]
-                if selector.title == "AllPeers":
-                    all_peers_links.extend(links_to)
-                else:
-                    random_peers_links.extend(links_to)
-                if all_peers_links:
-                    code_message_selector_blocks.append(produce_selector_block(i, all_peers_links, True, first))
-                    first = False
-                if random_peers_links:
-                    code_message_selector_blocks.append(produce_selector_block(i, random_peers_links, False, first))
-                    first = False
-        code_message_handler_blocks = []
+            for selector in selectors:
+                message_nodes = self.index.targets(selector, "message")
+                links_to = [self.symbols.class_name(message_node) for message_node in message_nodes]
+                if not links_to:
+                    continue
+                all_peers = selector.title == "AllPeers"
+                yield produce_selector_block(i, links_to, all_peers, first, all_peers and selector.serialize_once,
+                                             1 if all_peers else selector.fan_out, self.instrument,
+                                             [self.aggregator_id(message_node) for message_node in message_nodes])
+                first = False
+
+    def message_handler_blocks(self) -> Iterator[Iterator[str]]:
         for message_node in self.message_nodes:
-            input_caches = [port.connections for port in message_node.inputs if port.label_str == "retrieve_cache"][0]
-            output_caches = [port.connections for port in message_node.outputs if port.label_str == "create_cache"][0]
-            response_messages = [port.connections for port in message_node.outputs if port.label_str == "response"][0]
-            input_cache = input_caches[0].inp.node.display_title if input_caches else None
-            output_cache = output_caches[0].inp.node.display_title if output_caches else None
-            response_message = response_messages[0].inp.node.display_title if response_messages else None
-            code_message_handler_blocks.append(produce_message_handler_block(message_node.display_title, input_cache,
-                                                                             output_cache, response_message))
-
-        out = code_import_block + LINE_BREAK * 2
-        if len(code_message_blocks):
-            out += (LINE_BREAK * 2).join(code_message_blocks) + LINE_BREAK * 2
-        if len(code_cache_blocks):
-            out += (LINE_BREAK * 2).join(code_cache_blocks) + LINE_BREAK * 2
-        out += code_community_block + LINE_BREAK
-        out += code_init_block + LINE_BREAK
-        out += LINE_BREAK.join(code_message_selector_blocks) + LINE_BREAK
-        out += LINE_BREAK.join(code_message_handler_blocks)
-
-        with open(file_path, "w") as fp:
-            fp.write(out)
+            input_cache = self.index.first_source(message_node, "retrieve_cache")
+            output_cache = self.index.first_target(message_node, "create_cache")
+            response_message = self.index.first_target(message_node, "response")
+            # Everything but the fields of the message, which are covered by its node key.
+            args = (self.symbols.class_name(message_node),
+                    self.symbols.class_name(input_cache),
+                    self.symbols.class_name(output_cache),
+                    self.symbols.class_name(response_message),
+                    self.symbols.handler_names[message_node],
+                    self.instrument,
+                    self.rate_limiter_ids.get(self.index.first_source(message_node, "rate_limit")),
+                    *((message_node.offload, *self.symbols.offload_names[message_node])
+                      if message_node in self.symbols.offload_names else (None, None, None)),
+                    None if response_message is None else self.aggregator_id(response_message),
+                    self.memoizer_id(message_node))
+            yield self.node_block(message_node,
+                                  lambda: produce_message_handler_block(
+                                      *args, [[name, is_list(field_type)]
+                                              for name, field_type in message_node.custom_fields_dict.items()]),
+                                  "handler", *args)
+
+    def executors(self) -> List[str]:
+        """
+        The kinds of executor (``"thread"`` and/or ``"process"``) that the offloaded handlers use.
+        """
+        return sorted({message_node.offload for message_node in self.symbols.offload_names})
+
+    def timer_plan(self) -> Tuple[List[Tuple[int, float]], List[Tuple[float, List[Tuple[int, int]]]]]:
+        """
+        Split the periodic tasks into tasks that are registered as plain interval tasks and scheduler loops.
+        """
+        tasks = [(i, node.interval) for i, node in enumerate(self.task_nodes)]
+        if self.timer_mode == "coalesced":
+            groups = coalesce_tasks(tasks)
+        else:
+            groups = [(interval, [(task_id, 1)]) for task_id, interval in tasks]
+        intervals = dict(tasks)
+        plain_tasks = []
+        schedulers = []
+        for interval, group_tasks in groups:
+            if len(group_tasks) == 1 and not self.interval_jitter:
+                task_id, _ = group_tasks[0]
+                plain_tasks.append((task_id, intervals[task_id]))
+            else:
+                schedulers.append((interval, group_tasks))
+        return sorted(plain_tasks), schedulers
+
+    def stdlib_imports(self, schedulers) -> Dict[str, List[str]]:
+        imports = {}
+        executors = self.executors()
+        if uses_lists(all_field_types(self.message_nodes + self.cache_nodes)):
+            imports["typing"] = ["List"]
+        if schedulers:
+            imports["asyncio"] = ["sleep"]
+        if self.start_jitter or (self.interval_jitter and schedulers):
+            imports["random"] = ["uniform"]
+        if any(cache_node.on_timeout == "log" for cache_node in self.cache_nodes):
+            imports["logging"] = ["getLogger"]
+        if self.instrument:
+            imports["collections"] = ["defaultdict"]
+            imports["functools"] = ["wraps"]
+            imports["time"] = ["perf_counter"]
+        if self.rate_limiter_ids:
+            imports["asyncio"] = sorted(set(imports.get("asyncio", [])) | {"get_running_loop"})
+            imports["functools"] = ["wraps"]
+        if self.rate_limiter_ids or self.memoizer_ids:
+            imports["collections"] = sorted(set(imports.get("collections", [])) | {"OrderedDict"})
+            imports["time"] = sorted(set(imports.get("time", [])) | {"monotonic"})
+        if executors or self.aggregator_ids:
+            imports["asyncio"] = sorted(set(imports.get("asyncio", [])) | {"get_running_loop"})
+        if self.aggregator_ids:
+            imports["struct"] = ["pack", "unpack_from"]
+        if executors:
+            imports["concurrent.futures"] = sorted("ThreadPoolExecutor" if executor == "thread"
+                                                   else "ProcessPoolExecutor" for executor in executors)
+        return imports
+
+    def fragments(self) -> Iterator[str]:
+        """
+        Stream the generated module as code fragments, without ever holding the complete module in memory.
+        """
+        has_caches = len(self.cache_nodes) > 0
+        has_random_selector = len(self.random_peer_selector_nodes) > 0
+        plain_tasks, schedulers = self.timer_plan()
+        dataclass_messages = [message_node for message_node in self.message_nodes
+                              if self.field_formats(message_node) is None]
+
+        if self.block_cache is not None:
+            self.block_cache.start_export()
+        yield from produce_imports_block(has_caches, has_random_selector, self.stdlib_imports(schedulers),
+                                         required_formats(all_field_types(dataclass_messages)))
+        yield LINE_BREAK * 2
+        # The default name is left out, so that existing single-community exports keep their community id.
+        message_signature = (sha1() if self.community_name == DEFAULT_COMMUNITY_NAME
+                             else sha1(self.community_name.encode()))
+        if self.message_nodes:
+            yield from join_blocks(self.message_blocks(message_signature), LINE_BREAK * 2)
+            yield LINE_BREAK * 2
+        if self.cache_nodes:
+            yield from join_blocks(self.cache_blocks(), LINE_BREAK * 2)
+            yield LINE_BREAK * 2
+        cache_limits = self.cache_limits()
+        if cache_limits:
+            yield from produce_bounded_request_cache_block(cache_limits)
+            yield LINE_BREAK * 2
+        if self.rate_limiter_ids:
+            yield from produce_rate_limiter_block()
+            yield LINE_BREAK * 2
+        if self.memoizer_ids:
+            yield from produce_memoizer_block()
+            yield LINE_BREAK * 2
+        if self.aggregator_ids:
+            yield from produce_aggregator_block(BATCH_MSG_ID)
+            yield LINE_BREAK * 2
+        if self.instrument:
+            yield from produce_instrumentation_block(has_caches, len(cache_limits) > 0)
+            yield LINE_BREAK * 2
+        # The id is generated as a b"..." literal, while ``repr`` only escapes the quotes that it delimits bytes with.
+        community_hash = repr(message_signature.digest())[2:-1].replace("\"", "\\\"")
+        yield from produce_community_block(community_hash, self.community_name)
+        yield LINE_BREAK
+        yield from produce_init_block([self.symbols.class_name(message_node) for message_node in self.message_nodes],
+                                      plain_tasks,
+                                      has_caches,
+                                      [self.symbols.handler_names[message_node] for message_node in self.message_nodes],
+                                      list(range(len(schedulers))),
+                                      self.start_jitter,
+                                      self.instrument,
+                                      len(cache_limits) > 0,
+                                      self.rate_limiters(),
+                                      self.executors(),
+                                      self.offload_workers,
+                                      self.aggregators(),
+                                      self.memoizers(),
+                                      has_random_selector)
+        yield LINE_BREAK
+        if self.instrument:
+            yield from produce_stats_methods_block(list(self.memoizer_ids.values()))
+            yield LINE_BREAK
+        if self.symbols.offload_names:
+            yield from produce_offload_methods_block(self.max_offloaded)
+            yield LINE_BREAK
+        if self.aggregator_ids:
+            yield from produce_batch_handler_block()
+            yield LINE_BREAK
+        if has_random_selector:
+            yield from produce_peer_sampling_block()
+            yield LINE_BREAK
+        for i, (interval, group_tasks) in enumerate(schedulers):
+            yield from produce_scheduler_block(i, interval, group_tasks, self.interval_jitter)
+            yield LINE_BREAK
+        yield from join_blocks(self.selector_blocks(), LINE_BREAK)
+        yield LINE_BREAK
+        yield from join_blocks(self.message_handler_blocks(), LINE_BREAK)
+        if self.block_cache is not None:
+            self.block_cache.finish_export()
+
+    def export(self, file_path) -> bool:
+        """
+        Write the generated module to the given file, returning whether the file was (re)written.
+        """
+        if self.block_cache is None:
+            with open(file_path, "w") as fp, CodeWriter(fp) as writer:
+                writer.write_all(self.fragments())
+            return True
+
+        export_state = self.export_state()
+        if self.block_cache.export_unchanged(file_path, export_state):
+            return False
+        # The output is streamed next to the file, which is only replaced if the output changed.
+        temp_path = file_path + ".tmp"
+        digest = sha1()
+        try:
+            with open(temp_path, "w") as fp, CodeWriter(fp, digest=digest) as writer:
+                writer.write_all(self.fragments())
+            changed = self.block_cache.output_changed(file_path, digest.digest())
+            if changed:
+                os.replace(temp_path, file_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.block_cache.output_written(file_path, digest.digest(), export_state)
+        return changed
@@ -0,0 +1,302 @@
+"""
+Lightweight, Qt-free model of a saved project.
+
+The classes in this module mimic the parts of the Ryven node, port and connection API that the ``Exporter`` uses.
+This allows projects to be exported without a ``QApplication`` or any of the node widgets.
+"""
+import json
+from copy import deepcopy
+from itertools import count
+from typing import Dict, FrozenSet, Iterator, List, Optional, Tuple
+
+
+NODE_PORTS: Dict[str, Tuple[List[str], List[str]]] = {
+    "Aggregator": ([], ["aggregates"]),
+    "AllPeers": (["select"], ["message"]),
+    "Cache": (["belongs_to"], ["received_by"]),
+    "Memoizer": ([], ["memoizes"]),
+    "Message": (["received_by", "retrieve_cache", "rate_limit", "aggregate", "memoize"], ["response", "create_cache"]),
+    "PeriodicTask": ([], ["on_timer_fire"]),
+    "RandomPeer": (["select"], ["message"]),
+    "RateLimiter": ([], ["limits"])
+}
+# The ports that accept at most one connection.
+SINGLETON_PORTS: Dict[str, FrozenSet[str]] = {
+    "Aggregator": frozenset(),
+    "AllPeers": frozenset(),
+    "Cache": frozenset({"belongs_to", "received_by"}),
+    "Memoizer": frozenset(),
+    "Message": frozenset({"received_by", "retrieve_cache", "rate_limit", "aggregate", "memoize", "response",
+                          "create_cache"}),
+    "PeriodicTask": frozenset(),
+    "RandomPeer": frozenset(),
+    "RateLimiter": frozenset()
+}
+# IPv8's ``NumberCache.get_timeout_delay()``.
+DEFAULT_CACHE_TIMEOUT = 10.0
+# What a cache does when it times out: nothing, log a warning or call a stub to fill in.
+ON_TIMEOUT_BEHAVIOURS = ["ignore", "log", "implement"]
+# Where a message handler runs: on the event loop, on a thread pool or on a process pool.
+OFFLOAD_MODES = ["inline", "thread", "process"]
+# IPv8's ``Community`` handles the message ids from this one on: introductions, punctures and deprecated messages.
+FIRST_RESERVED_MSG_ID = 235
+# The message id of batches of aggregated packets, which messages cannot use in communities with an aggregator.
+BATCH_MSG_ID = FIRST_RESERVED_MSG_ID - 1
+# The largest payload of a UDP packet, which a batch of aggregated packets may not exceed.
+MAX_BATCH_BYTES = 65507
+# What a rate limiter does with messages that exceed its limits.
+RATE_LIMIT_POLICIES = ["drop", "defer"]
+# The additional data that every node type stores in the project, with the defaults for projects that predate it.
+NODE_OPTIONS: Dict[str, Dict[str, object]] = {
+    "Aggregator": {"max_delay": 0.05, "max_bytes": 1200},
+    "AllPeers": {"serialize_once": False},
+    "Cache": {"custom_fields_dict": {}, "timeout": DEFAULT_CACHE_TIMEOUT, "max_outstanding": 0, "on_timeout": "ignore"},
+    "Memoizer": {"max_entries": 1024, "ttl": 10.0},
+    "Message": {"custom_fields_dict": {}, "offload": "inline"},
+    "PeriodicTask": {"interval": 1.0},
+    "RandomPeer": {"fan_out": 1},
+    "RateLimiter": {"peer_rate": 10.0, "peer_burst": 20.0, "global_rate": 0.0, "global_burst": 100.0, "policy": "drop",
+                    "max_peers": 1024, "max_deferred": 256}
+}
+# The ids that ``node_key`` hands out to nodes, once per node.
+NODE_IDS = count()
+
+
+def node_key(node) -> Tuple[int, int]:
+    """
+    The id and edit version of a (Ryven or graph) node, on which exports cache the code generated for the node.
+    """
+    uid = getattr(node, "export_uid", None)
+    if uid is None:
+        uid = node.export_uid = next(NODE_IDS)
+    return uid, getattr(node, "edit_version", 0)
+
+
+def touch(node) -> None:
+    """
+    Mark a node as edited: its title, options or connections changed.
+    """
+    node.edit_version = getattr(node, "edit_version", 0) + 1
+
+
+class GraphPort:
+
+    def __init__(self, node: "GraphNode", label_str: str):
+        self.node = node
+        self.label_str = label_str
+        self.connections: List[GraphConnection] = []
+
+
+class GraphConnection:
+
+    def __init__(self, out: GraphPort, inp: GraphPort):
+        self.out = out
+        self.inp = inp
+
+
+class GraphNode:
+
+    def __init__(self, title: str, display_title: str, additional_data: Optional[dict] = None):
+        self.title = title
+        self.display_title = display_title
+
+        input_labels, output_labels = NODE_PORTS[title]
+        self.inputs = [GraphPort(self, label) for label in input_labels]
+        self.outputs = [GraphPort(self, label) for label in output_labels]
+
+        additional_data = additional_data or {}
+        for key, default in NODE_OPTIONS[title].items():
+            setattr(self, key, additional_data[key] if key in additional_data else deepcopy(default))
+
+    def additional_data(self) -> dict:
+        return {key: getattr(self, key) for key in NODE_OPTIONS[self.title]}
+
+    def has_cache(self):
+        for port in self.inputs + self.outputs:
+            if port.label_str in ("retrieve_cache", "create_cache") and len(port.connections) > 0:
+                return True
+        return False
+
+
+def connect(out: GraphPort, inp: GraphPort) -> GraphConnection:
+    connection = GraphConnection(out, inp)
+    out.connections.append(connection)
+    inp.connections.append(connection)
+    return connection
+
+
+def snapshot_nodes(nodes) -> List[GraphNode]:
+    """
+    Copy (Ryven) nodes and their connections into ``GraphNode`` objects that no longer share any state with the
+    originals, so they can be exported from another thread or process. The copies keep the ``node_key`` of their
+    originals.
+    """
+    copies = {node: GraphNode(node.title, node.display_title, deepcopy(node.additional_data())) for node in nodes}
+    for node, copy in copies.items():
+        copy.export_uid, copy.edit_version = node_key(node)
+        copy_outputs = {port.label_str: port for port in copy.outputs}
+        for port in node.outputs:
+            for connection in port.connections:
+                target = copies.get(connection.inp.node)
+                if target is not None:
+                    target_inputs = {target_port.label_str: target_port for target_port in target.inputs}
+                    connect(copy_outputs[port.label_str], target_inputs[connection.inp.label_str])
+    return list(copies.values())
+
+
+def node_title_from_data(node_data: dict) -> str:
+    """
+    Ryven stores the node class as an identifier, which may carry a package prefix (e.g. ``nodes.MessageNode``).
+    """
+    identifier = node_data.get("identifier", node_data.get("title", ""))
+    class_name = identifier.split(".")[-1]
+    title = class_name[:-len("Node")] if class_name.endswith("Node") else class_name
+    if title not in NODE_PORTS:
+        raise RuntimeError(f"Unknown node found: {identifier}!")
+    return title
+
+
+class FlowBuilder:
+    """
+    Builds the nodes of a flow from Ryven's node and connection data, one item at a time.
+    """
+
+    def __init__(self):
+        self.nodes: List[GraphNode] = []
+        self.unique_nums = {"Message": 0, "Cache": 0}
+
+    def add_node(self, node_data: dict) -> GraphNode:
+        title = node_title_from_data(node_data)
+        display_title = title
+        if title in self.unique_nums:
+            display_title = f"{title}{self.unique_nums[title]}"
+            self.unique_nums[title] += 1
+        display_title = node_data.get("display title", display_title)
+        node = GraphNode(title, display_title, node_data.get("additional data"))
+        self.nodes.append(node)
+        return node
+
+    def add_connection(self, connection_data: dict) -> GraphConnection:
+        out_node = self.nodes[connection_data["parent node index"]]
+        inp_node = self.nodes[connection_data["connected node"]]
+        return connect(out_node.outputs[connection_data["output port index"]],
+                       inp_node.inputs[connection_data["connected input port index"]])
+
+
+def load_flow(flow_data: dict) -> List[GraphNode]:
+    builder = FlowBuilder()
+    for node_data in flow_data["nodes"]:
+        builder.add_node(node_data)
+    for connection_data in flow_data.get("connections", []):
+        builder.add_connection(connection_data)
+    return builder.nodes
+
+
+def script_settings(script_data: dict) -> dict:
+    """
+    The data of a script without the nodes and connections of its flow, but with its variables and flow settings (such
+    as the algorithm mode), from which Ryven creates an empty script that the nodes can then be added to.
+    """
+    flow_data = dict(script_data["flow"], nodes=[], connections=[])
+    return dict(script_data, flow=flow_data)
+
+
+def flow_batches(flow_data: dict, batch_size: int) -> Iterator[Tuple[str, list]]:
+    """
+    Split a flow into batches of at most ``batch_size`` nodes or connections, as ``("nodes", batch)`` or
+    ``("connections", batch)`` pairs. Connections refer to nodes by their index in the flow data, so all nodes come
+    first.
+    """
+    nodes_data = flow_data["nodes"]
+    connections_data = flow_data.get("connections", [])
+    for start in range(0, len(nodes_data), batch_size):
+        yield "nodes", nodes_data[start:start + batch_size]
+    for start in range(0, len(connections_data), batch_size):
+        yield "connections", connections_data[start:start + batch_size]
+
+
+def load_scripts(project: dict) -> Dict[str, List[GraphNode]]:
+    return {script_data["title"]: load_flow(script_data["flow"]) for script_data in project["scripts"]}
+
+
+def load_project(file_path: str) -> Dict[str, List[GraphNode]]:
+    with open(file_path, "r") as fp:
+        return load_scripts(json.load(fp))
+
+
+def dump_flow(nodes: List[GraphNode]) -> dict:
+    """
+    The inverse of ``load_flow``: the subset of Ryven's flow data that is needed to load the nodes again.
+    """
+    node_indices = {node: i for i, node in enumerate(nodes)}
+    connections = []
+    for i, node in enumerate(nodes):
+        for j, port in enumerate(node.outputs):
+            for connection in port.connections:
+                inp_node = connection.inp.node
+                connections.append({
+                    "parent node index": i,
+                    "output port index": j,
+                    "connected node": node_indices[inp_node],
+                    "connected input port index": inp_node.inputs.index(connection.inp)
+                })
+    return {
+        "nodes": [{"identifier": f"{node.title}Node",
+                   "display title": node.display_title,
+                   "additional data": node.additional_data()} for node in nodes],
+        "connections": connections
+    }
+
+
+def project_data(scripts: Dict[str, List[GraphNode]]) -> dict:
+    return {"scripts": [{"title": title, "flow": dump_flow(nodes)} for title, nodes in scripts.items()]}
+
+
+def load_nodes(file_path: str) -> List[GraphNode]:
+    """
+    Load all nodes of all scripts, equivalent to ``session.all_node_objects()`` in the GUI.
+    """
+    return [node for nodes in load_project(file_path).values() for node in nodes]
+
+
+class GraphIndex:
+    """
+    One-pass index of the connections of a set of nodes.
+
+    Building the index is O(V+E), after which every lookup of a port's connected nodes is O(1).
+    """
+
+    def __init__(self, nodes):
+        self.successors: Dict[object, Dict[str, list]] = {}
+        self.predecessors: Dict[object, Dict[str, list]] = {}
+
+        for node in nodes:
+            self.successors[node] = successors = {}
+            for port in node.outputs:
+                successors[port.label_str] = [connection.inp.node for connection in port.connections]
+            self.predecessors[node] = predecessors = {}
+            for port in node.inputs:
+                predecessors[port.label_str] = [connection.out.node for connection in port.connections]
+
+    def targets(self, node, label: str) -> list:
+        """
+        The nodes connected to the output port with the given label.
+        """
+        return self.successors[node].get(label, [])
+
+    def sources(self, node, label: str) -> list:
+        """
+        The nodes connected to the input port with the given label.
+        """
+        return self.predecessors[node].get(label, [])
+
+    def first_target(self, node, label: str):
+        targets = self.targets(node, label)
+        return targets[0] if targets else None
+
+    def first_source(self, node, label: str):
+        sources = self.sources(node, label)
+        return sources[0] if sources else None
+
+    def has_cache(self, node) -> bool:
+        return len(self.sources(node, "retrieve_cache")) > 0 or len(self.targets(node, "create_cache")) > 0
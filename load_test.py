@@ -0,0 +1,225 @@
+"""
+Generates a companion load-test module for an exported community.
+
+The generated module starts N in-process peers of the community on IPv8's mock endpoint, lets their periodic tasks (and
+optionally an extra driver) run for a while and reports the throughput, round-trip latency and cache occupancy per
+message type.
+"""
+from typing import Iterator, List, Tuple
+
+from exporter import LINE_BREAK, CodeWriter, Exporter
+
+LOAD_TEST_BODY = '''
+MESSAGE_NAMES = {payload_class.msg_id: payload_class.__name__ for payload_class in MESSAGE_CLASSES}
+
+
+class LoadTestMonitor:
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.received = defaultdict(int)
+        self.sent = defaultdict(int)
+        self.bytes_in = defaultdict(int)
+        self.bytes_out = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.selector_errors = defaultdict(int)
+        self.last_errors = {}
+        self.sent_at = {}
+        self.round_trips = defaultdict(list)
+        self.cache_samples = defaultdict(list)
+
+    def instrument(self, overlay):
+        original_send = overlay.endpoint.send
+        # A packet starts with the community prefix, followed by the message id.
+        prefix_length = len(overlay._prefix)
+
+        def send(address, packet):
+            if len(packet) <= prefix_length:
+                return original_send(address, packet)
+            msg_id = packet[prefix_length]
+            self.sent[msg_id] += 1
+            self.bytes_out[msg_id] += len(packet)
+            if msg_id in REQUEST_IDS:
+                self.sent_at[(id(overlay), address, msg_id)] = time.perf_counter()
+            return original_send(address, packet)
+
+        overlay.endpoint.send = send
+        for payload_class in MESSAGE_CLASSES:
+            overlay.decode_map[payload_class.msg_id] = self.wrap_handler(overlay, payload_class.msg_id,
+                                                                         overlay.decode_map[payload_class.msg_id])
+
+    def wrap_handler(self, overlay, msg_id, handler):
+        def monitored_handler(source_address, data):
+            now = time.perf_counter()
+            self.received[msg_id] += 1
+            self.bytes_in[msg_id] += len(data)
+            for request_id in RESPONSE_TO.get(msg_id, []):
+                sent_at = self.sent_at.pop((id(overlay), source_address, request_id), None)
+                if sent_at is not None:
+                    self.round_trips[msg_id].append(now - sent_at)
+            try:
+                return handler(source_address, data)
+            except Exception as e:
+                self.errors[msg_id] += 1
+                self.last_errors[f"handler of {MESSAGE_NAMES[msg_id]}"] = repr(e)
+                raise
+        return monitored_handler
+
+    def call_selector(self, overlay, selector):
+        try:
+            getattr(overlay, selector)()
+        except Exception as e:
+            self.selector_errors[selector] += 1
+            self.last_errors[selector] = repr(e)
+
+    def sample_caches(self, overlays):
+        for cache_name in CACHE_NAMES:
+            self.cache_samples[cache_name].append(0)
+        for overlay in overlays:
+            request_cache = getattr(overlay, "request_cache", None)
+            for identifier in getattr(request_cache, "_identifiers", {}):
+                cache_name = identifier.split(":")[0]
+                if cache_name in self.cache_samples:
+                    self.cache_samples[cache_name][-1] += 1
+
+    def report(self, peer_count):
+        duration = time.perf_counter() - self.start
+        report = {"peers": peer_count, "duration_s": duration, "messages": {}, "caches": {},
+                  "selector_errors": dict(self.selector_errors), "last_errors": dict(self.last_errors)}
+        for payload_class in MESSAGE_CLASSES:
+            msg_id = payload_class.msg_id
+            round_trips = sorted(self.round_trips[msg_id])
+            percentiles = {}
+            if len(round_trips) >= 2:
+                cut_points = quantiles(round_trips, n=100)
+                percentiles = {"p50_ms": cut_points[49] * 1000, "p90_ms": cut_points[89] * 1000,
+                               "p99_ms": cut_points[98] * 1000}
+            report["messages"][payload_class.__name__] = {
+                "sent_per_s": self.sent[msg_id] / duration,
+                "received_per_s": self.received[msg_id] / duration,
+                "bytes_out_per_s": self.bytes_out[msg_id] / duration,
+                "bytes_in_per_s": self.bytes_in[msg_id] / duration,
+                "handler_errors": self.errors[msg_id],
+                "round_trips": len(round_trips),
+                **percentiles
+            }
+        for cache_name, samples in self.cache_samples.items():
+            report["caches"][cache_name] = {"mean_outstanding": sum(samples) / len(samples) if samples else 0,
+                                            "max_outstanding": max(samples, default=0)}
+        return report
+
+
+def print_report(report):
+    print(f"{report['peers']} peers, {report['duration_s']:.1f}s")
+    print(f"{'message':<30} {'sent/s':>10} {'recv/s':>10} {'out B/s':>12} {'in B/s':>12} "
+          f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, stats in report["messages"].items():
+        print(f"{name:<30} {stats['sent_per_s']:>10.1f} {stats['received_per_s']:>10.1f} "
+              f"{stats['bytes_out_per_s']:>12.1f} {stats['bytes_in_per_s']:>12.1f} "
+              f"{stats.get('p50_ms', float('nan')):>8.2f} {stats.get('p90_ms', float('nan')):>8.2f} "
+              f"{stats.get('p99_ms', float('nan')):>8.2f} {stats['handler_errors']:>7}")
+    for name, stats in report["caches"].items():
+        print(f"{name:<30} outstanding: {stats['mean_outstanding']:.1f} mean, {stats['max_outstanding']} max")
+    for name, errors in report["selector_errors"].items():
+        print(f"{name:<30} failed {errors} times")
+    for name, error in report["last_errors"].items():
+        print(f"last error of {name}: {error}")
+
+
+async def run_load_test(peer_count, duration, drive_interval, sample_interval):
+    nodes = [MockIPv8("curve25519", COMMUNITY) for _ in range(peer_count)]
+    for node in nodes:
+        for other in nodes:
+            if other is not node:
+                node.network.add_verified_peer(other.my_peer)
+                node.network.discover_services(other.my_peer, [node.overlay.community_id])
+    overlays = [node.overlay for node in nodes]
+    monitor = LoadTestMonitor()
+    for overlay in overlays:
+        monitor.instrument(overlay)
+
+    end = time.perf_counter() + duration
+    next_drive = time.perf_counter()
+    while time.perf_counter() < end:
+        if drive_interval > 0 and time.perf_counter() >= next_drive:
+            next_drive += drive_interval
+            for overlay in overlays:
+                for selector in SELECTORS:
+                    monitor.call_selector(overlay, selector)
+        monitor.sample_caches(overlays)
+        await sleep(sample_interval)
+
+    report = monitor.report(peer_count)
+    await gather(*[node.stop() for node in nodes])
+    return report
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=f"Load test {COMMUNITY.__name__} on in-process mock peers.")
+    parser.add_argument("-n", "--peers", type=int, default=10, help="number of peers")
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="duration of the test in seconds")
+    parser.add_argument("--drive-interval", type=float, default=0.0,
+                        help="also call every selector of every peer at this interval (0: only the periodic tasks)")
+    parser.add_argument("--sample-interval", type=float, default=0.1, help="cache occupancy sampling interval")
+    parser.add_argument("--json", default=None, help="write the report to this JSON file")
+    parsed = parser.parse_args(args)
+
+    report = run(run_load_test(parsed.peers, parsed.duration, parsed.drive_interval, parsed.sample_interval))
+    print_report(report)
+    if parsed.json is not None:
+        with open(parsed.json, "w") as fp:
+            json.dump(report, fp, indent=2)
+
+
+if __name__ == "__main__":
+    main()
+'''
+
+
+def produce_load_test_block(community_module: str, community_class: str, message_classes: List[str],
+                            responses: List[Tuple[str, str]], selectors: List[str],
+                            cache_classes: List[str]) -> Iterator[str]:
+    imported = ", ".join([community_class] + message_classes + cache_classes)
+    yield ("import argparse" + LINE_BREAK
+           + "import json" + LINE_BREAK
+           + "import time" + LINE_BREAK
+           + "from asyncio import gather, run, sleep" + LINE_BREAK
+           + "from collections import defaultdict" + LINE_BREAK
+           + "from statistics import quantiles" + LINE_BREAK
+           + LINE_BREAK
+           + "from ipv8.test.mocking.ipv8 import MockIPv8" + LINE_BREAK
+           + LINE_BREAK
+           + f"from {community_module} import {imported}" + LINE_BREAK
+           + LINE_BREAK
+           + f"COMMUNITY = {community_class}" + LINE_BREAK
+           + f"MESSAGE_CLASSES = [{', '.join(message_classes)}]" + LINE_BREAK
+           + "SELECTORS = [" + ", ".join(f"\"{selector}\"" for selector in selectors) + "]" + LINE_BREAK
+           + f"CACHE_NAMES = [{', '.join(f'{cache_class}.name' for cache_class in cache_classes)}]" + LINE_BREAK)
+    response_to = {}
+    for request, response in responses:
+        response_to.setdefault(response, []).append(request)
+    yield ("# Message id of a response -> message ids of the requests it answers." + LINE_BREAK
+           + "RESPONSE_TO = {" + ", ".join(f"{response}.msg_id: [{', '.join(f'{r}.msg_id' for r in requests)}]"
+                                           for response, requests in response_to.items()) + "}" + LINE_BREAK
+           + "REQUEST_IDS = {request_id for request_ids in RESPONSE_TO.values() for request_id in request_ids}"
+           + LINE_BREAK)
+    yield LOAD_TEST_BODY
+
+
+def export_load_test(exporter: Exporter, file_path: str, community_module: str) -> None:
+    """
+    Write the load test of the community of the given ``Exporter``, which is importable as ``community_module``.
+    """
+    class_name = exporter.symbols.class_name
+    responses = []
+    for message_node in exporter.message_nodes:
+        response_node = exporter.index.first_target(message_node, "response")
+        if response_node is not None:
+            responses.append((class_name(message_node), class_name(response_node)))
+    selectors = [f"selector_{i}" for i, task_node in enumerate(exporter.task_nodes)
+                 if exporter.index.targets(task_node, "on_timer_fire")]
+    with open(file_path, "w") as fp, CodeWriter(fp) as writer:
+        writer.write_all(produce_load_test_block(community_module, exporter.community_name,
+                                                 [class_name(message_node) for message_node in exporter.message_nodes],
+                                                 responses, selectors,
+                                                 [class_name(cache_node) for cache_node in exporter.cache_nodes]))
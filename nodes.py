@@ -1,17 +1,47 @@
 from functools import reduce
 
 import PySide2
-from PySide2.QtCore import Signal, Qt
-from PySide2.QtGui import QDoubleValidator, QFont, QFontMetrics, QValidator
-from PySide2.QtWidgets import QWidget, QVBoxLayout, QLabel, QLineEdit, QComboBox, QHBoxLayout
+from PySide2.QtCore import QObject, Signal, Qt
+from PySide2.QtGui import QDoubleValidator, QFont, QFontMetrics, QIntValidator, QValidator
+from PySide2.QtWidgets import QWidget, QVBoxLayout, QLabel, QLineEdit, QComboBox, QHBoxLayout, QCheckBox
 from ryven import init_node_env, export_nodes
 from ryven.NWENV import export_widgets, init_node_widget_env
 from ryvencore_qt import Node, NodeInputBP, NodeOutputBP
 
+from graph import (DEFAULT_CACHE_TIMEOUT, MAX_BATCH_BYTES, NODE_OPTIONS, OFFLOAD_MODES, ON_TIMEOUT_BEHAVIOURS,
+                   RATE_LIMIT_POLICIES, SINGLETON_PORTS)
+from wire_types import FIELD_TYPES
+
 init_node_env()
 init_node_widget_env()
 
 
+class GraphEvents(QObject):
+    """
+    Notifies listeners (like the code preview) of edits that Ryven does not signal itself.
+    """
+    changed = Signal(object)
+
+    # Set while a project is loading, widgets then postpone building the parts that are not visible at a glance.
+    loading_project = False
+
+
+graph_events = GraphEvents()
+
+
+def edited_number(line_edit: QLineEdit, number_type, default):
+    """
+    The number in a line edit: ``default`` if it is empty and ``None`` if its validator does not accept the text (yet),
+    like the partial input "1e" or "-".
+    """
+    text = line_edit.text()
+    if not text:
+        return default
+    if not line_edit.hasAcceptableInput():
+        return None
+    return number_type(text)
+
+
 class QClickableLabel(QLabel):
     clicked=Signal()
 
@@ -105,11 +135,9 @@ class DataTypeRowWidget(QWidget):
 
         self.type_edit = QComboBox()
         self.type_edit.setFont(QFont('source code pro', 10))
-        self.type_edit.addItem("str")
-        self.type_edit.addItem("int")
-        self.type_edit.addItem("float")
-        self.type_edit.addItem("object")
-        self.type_edit.setMinimumContentsLength(7)
+        for field_type in FIELD_TYPES:
+            self.type_edit.addItem(field_type)
+        self.type_edit.setMinimumContentsLength(max(len(field_type) for field_type in FIELD_TYPES))
 
         if field_name is not None:
             self.line_edit.setText(field_name)
@@ -119,12 +147,13 @@ class DataTypeRowWidget(QWidget):
         self.layout().addWidget(self.line_edit)
         self.layout().addWidget(self.type_edit)
 
-        self.setMinimumWidth(QFontMetrics(QFont('source code pro', 10)).width("field name" + " "*10 + "object"))
+        self.setMinimumWidth(QFontMetrics(QFont('source code pro', 10)).width("field name" + " "*10
+                                                                              + max(FIELD_TYPES, key=len)))
         self.line_edit.show()
         self.type_edit.show()
 
-        self.last_field_value = ""
-        self.last_type_value = "str"
+        self.last_field_value = "" if field_name is None else field_name
+        self.last_type_value = "str" if field_type is None else field_type
 
         self.line_edit.editingFinished.connect(self.field_updated)
         self.type_edit.currentIndexChanged.connect(self.field_updated)
@@ -142,6 +171,7 @@ class DataTypeRowWidget(QWidget):
         # 3. Update new last values
         self.last_field_value = new_field_value
         self.last_type_value = new_type_value
+        graph_events.changed.emit(node)
 
 
 class DataTypeTableWidget(QWidget):
@@ -193,11 +223,20 @@ class DataTypeTableWidget(QWidget):
             self.layout().removeWidget(to_remove)
             if len(self.rows) == 0:
                 self.remove_button.hide()
+            self.parent().node.custom_fields_dict.pop(to_remove.last_field_value, None)
             to_remove.deleteLater()
             self.refresh()
+            graph_events.changed.emit(self.parent().node)
+
 
+class FieldsWidgetBase(CustomWidgetBase):
+    """
+    Edits the ``custom_fields_dict`` of a node in a ``DataTypeTableWidget``.
+
+    Every field is a widget tree of its own. Nodes of a project that is being loaded therefore only show a summary of
+    their fields, the table is built when the summary is clicked.
+    """
 
-class MessageWidget(CustomWidgetBase):
     def __init__(self, params):
         super().__init__()
 
@@ -207,35 +246,84 @@ class MessageWidget(CustomWidgetBase):
         self.setAttribute(Qt.WA_NoSystemBackground, True)
 
         self.setLayout(QVBoxLayout())
-        self.fields_table = DataTypeTableWidget(parent=self)
+        self.fields_table = None
+        self.fields_summary = None
+        if graph_events.loading_project:
+            self.fields_summary = QClickableLabel(parent=self)
+            self.fields_summary.setToolTip("Click to edit the fields")
+            self.fields_summary.clicked.connect(self.open_fields_table)
+            self.layout().addWidget(self.fields_summary)
+            self.summarize_fields()
+        else:
+            self.fields_table = DataTypeTableWidget(parent=self)
+            self.layout().addWidget(self.fields_table)
+
+    def summarize_fields(self):
+        field_count = len(self.node.custom_fields_dict)
+        self.fields_summary.setText(f"{field_count} field{'' if field_count == 1 else 's'} ...")
+
+    def open_fields_table(self):
+        if self.fields_table is not None:
+            return
+        self.layout().removeWidget(self.fields_summary)
+        self.fields_summary.deleteLater()
+        self.fields_summary = None
+        self.fields_table = DataTypeTableWidget(parent=self, field_items=list(self.node.custom_fields_dict.items()))
         self.layout().addWidget(self.fields_table)
+        self.node_item.update_shape()
 
     def get_state(self):
         return self.node.custom_fields_dict
 
     def set_state(self, state):
         self.node.custom_fields_dict = state
+        if self.fields_table is None:
+            self.summarize_fields()
+            return
         for item in state.items():
             field_name, field_type = item
             self.fields_table.add_row(field_name, field_type)
 
 
+class MessageWidget(FieldsWidgetBase):
+    def __init__(self, params):
+        super().__init__(params)
+
+        self.offload_edit = QComboBox()
+        self.offload_edit.setFont(QFont('source code pro', 10))
+        for mode in OFFLOAD_MODES:
+            self.offload_edit.addItem(mode)
+        self.offload_edit.setToolTip("Handle this message on the event loop, in a thread pool or in a process pool")
+        self.show_offload()
+        self.offload_edit.currentIndexChanged.connect(self.offload_updated)
+        self.layout().insertWidget(0, self.offload_edit)
+
+    def show_offload(self):
+        self.offload_edit.setCurrentIndex(self.offload_edit.findText(self.node.offload))
+
+    def offload_updated(self):
+        self.node.set_offload(self.offload_edit.itemText(self.offload_edit.currentIndex()))
+        graph_events.changed.emit(self.node)
+
+    def set_state(self, state):
+        super().set_state(state)
+        self.show_offload()
+
+
 class MessageNode(Node):
     title = 'Message'
     init_inputs = [
         NodeInputBP("received_by", type_="peer"),
-        NodeInputBP("retrieve_cache", type_="cache")
+        NodeInputBP("retrieve_cache", type_="cache"),
+        NodeInputBP("rate_limit", type_="limit"),
+        NodeInputBP("aggregate", type_="aggregate"),
+        NodeInputBP("memoize", type_="memo")
     ]
     init_outputs = [
         NodeOutputBP("response", type_="peer"),
         NodeOutputBP("create_cache", type_="message")
     ]
-    singleton_ports = [
-        "received_by",
-        "retrieve_cache",
-        "response",
-        "create_cache"
-    ]
+    singleton_ports = SINGLETON_PORTS["Message"]
     color = '#A9D5EF'
     __class_codes__ = None
     main_widget_class = MessageWidget
@@ -248,6 +336,7 @@ class MessageNode(Node):
         MessageNode.unique_message_num += 1
 
         self.custom_fields_dict = {}
+        self.offload = "inline"
 
     def init_default_actions(self) -> dict:
         actions = {
@@ -257,15 +346,24 @@ class MessageNode(Node):
         }
         return actions
 
+    def set_display_title(self, t: str):
+        super().set_display_title(t)
+        graph_events.changed.emit(self)
+
     def additional_data(self) -> dict:
         out = super().additional_data()
         out["custom_fields_dict"] = self.custom_fields_dict
+        out["offload"] = self.offload
         return out
 
     def load_additional_data(self, data):
         super().load_additional_data(data)
 
         self.custom_fields_dict = data["custom_fields_dict"]
+        self.offload = data.get("offload", "inline")
+
+    def set_offload(self, value):
+        self.offload = value
 
     def has_cache(self):
         connected = False
@@ -278,27 +376,74 @@ class MessageNode(Node):
         return connected
 
 
-class CacheWidget(CustomWidgetBase):
-    def __init__(self, params):
-        super().__init__()
+class CacheSettingsWidget(QWidget):
 
-        self.node, self.node_item = params
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
 
         self.setAttribute(Qt.WA_TranslucentBackground, True)
         self.setAttribute(Qt.WA_NoSystemBackground, True)
+        self.setLayout(QHBoxLayout())
 
-        self.setLayout(QVBoxLayout())
-        self.fields_table = DataTypeTableWidget(parent=self)
-        self.layout().addWidget(self.fields_table)
+        timeout_validator = LoggingDoubleValidator(parent=self)
+        timeout_validator.setBottom(0.0)
+        self.timeout_edit = QLineEdit()
+        self.timeout_edit.setFont(QFont('source code pro', 10))
+        self.timeout_edit.setValidator(timeout_validator)
+        self.timeout_edit.setPlaceholderText(str(DEFAULT_CACHE_TIMEOUT))
+        self.timeout_edit.setToolTip("Seconds before an outstanding cache times out")
+
+        max_outstanding_validator = LoggingIntValidator(parent=self, description="maximum number of caches")
+        max_outstanding_validator.setBottom(0)
+        self.max_outstanding_edit = QLineEdit()
+        self.max_outstanding_edit.setFont(QFont('source code pro', 10))
+        self.max_outstanding_edit.setValidator(max_outstanding_validator)
+        self.max_outstanding_edit.setPlaceholderText('0')
+        self.max_outstanding_edit.setToolTip("Maximum number of outstanding caches of this type (0 is unbounded)")
+
+        self.on_timeout_edit = QComboBox()
+        self.on_timeout_edit.setFont(QFont('source code pro', 10))
+        for behaviour in ON_TIMEOUT_BEHAVIOURS:
+            self.on_timeout_edit.addItem(behaviour)
+        self.on_timeout_edit.setToolTip("What to do when a cache times out")
+
+        self.layout().addWidget(self.timeout_edit)
+        self.layout().addWidget(self.max_outstanding_edit)
+        self.layout().addWidget(self.on_timeout_edit)
+
+        self.timeout_edit.editingFinished.connect(self.settings_updated)
+        self.max_outstanding_edit.editingFinished.connect(self.settings_updated)
+        self.on_timeout_edit.currentIndexChanged.connect(self.settings_updated)
+
+    def show_settings(self, node):
+        self.timeout_edit.setText("" if node.timeout == DEFAULT_CACHE_TIMEOUT else str(node.timeout))
+        self.max_outstanding_edit.setText("" if node.max_outstanding == 0 else str(node.max_outstanding))
+        self.on_timeout_edit.setCurrentIndex(self.on_timeout_edit.findText(node.on_timeout))
+
+    def settings_updated(self):
+        node = self.parent().node
+        # A setting that is partially edited keeps its current value until the text is a valid number.
+        timeout = edited_number(self.timeout_edit, float, DEFAULT_CACHE_TIMEOUT)
+        if timeout is not None:
+            node.set_timeout(timeout)
+        max_outstanding = edited_number(self.max_outstanding_edit, int, 0)
+        if max_outstanding is not None:
+            node.set_max_outstanding(max_outstanding)
+        node.set_on_timeout(self.on_timeout_edit.itemText(self.on_timeout_edit.currentIndex()))
+        graph_events.changed.emit(node)
+
+
+class CacheWidget(FieldsWidgetBase):
+    def __init__(self, params):
+        super().__init__(params)
 
-    def get_state(self):
-        return self.node.custom_fields_dict
+        self.settings = CacheSettingsWidget(parent=self)
+        self.settings.show_settings(self.node)
+        self.layout().insertWidget(0, self.settings)
 
     def set_state(self, state):
-        self.node.custom_fields_dict = state
-        for item in state.items():
-            field_name, field_type = item
-            self.fields_table.add_row(field_name, field_type)
+        super().set_state(state)
+        self.settings.show_settings(self.node)
 
 
 class CacheNode(Node):
@@ -309,10 +454,7 @@ class CacheNode(Node):
     init_outputs = [
         NodeOutputBP("received_by", type_="cache")
     ]
-    singleton_ports = [
-        "belongs_to",
-        "received_by"
-    ]
+    singleton_ports = SINGLETON_PORTS["Cache"]
     color = '#448aff'
     __class_codes__ = None
     main_widget_class = CacheWidget
@@ -325,6 +467,9 @@ class CacheNode(Node):
         CacheNode.unique_cache_num += 1
 
         self.custom_fields_dict = {}
+        self.timeout = DEFAULT_CACHE_TIMEOUT
+        self.max_outstanding = 0
+        self.on_timeout = "ignore"
 
     def init_default_actions(self) -> dict:
         actions = {
@@ -334,15 +479,62 @@ class CacheNode(Node):
         }
         return actions
 
+    def set_display_title(self, t: str):
+        super().set_display_title(t)
+        graph_events.changed.emit(self)
+
     def additional_data(self) -> dict:
         out = super().additional_data()
         out["custom_fields_dict"] = self.custom_fields_dict
+        out["timeout"] = self.timeout
+        out["max_outstanding"] = self.max_outstanding
+        out["on_timeout"] = self.on_timeout
         return out
 
     def load_additional_data(self, data):
         super().load_additional_data(data)
 
         self.custom_fields_dict = data["custom_fields_dict"]
+        self.timeout = data.get("timeout", DEFAULT_CACHE_TIMEOUT)
+        self.max_outstanding = data.get("max_outstanding", 0)
+        self.on_timeout = data.get("on_timeout", "ignore")
+
+    def set_timeout(self, value):
+        self.timeout = value
+
+    def set_max_outstanding(self, value):
+        self.max_outstanding = value
+
+    def set_on_timeout(self, value):
+        self.on_timeout = value
+
+
+class AllPeersWidget(CustomWidgetBase):
+    def __init__(self, params):
+        super().__init__()
+
+        self.node, self.node_item = params
+
+        self.setAttribute(Qt.WA_TranslucentBackground, True)
+        self.setAttribute(Qt.WA_NoSystemBackground, True)
+
+        self.setLayout(QVBoxLayout())
+        check_box = QCheckBox("serialize once")
+        check_box.setFont(QFont('source code pro', 10))
+        check_box.setToolTip("Serialize each message once and send the same packet to every peer")
+        check_box.stateChanged.connect(self.serialize_once_updated)
+        self.editor = check_box
+        self.layout().addWidget(check_box)
+
+    def serialize_once_updated(self):
+        self.node.set_serialize_once(self.editor.isChecked())
+        graph_events.changed.emit(self.node)
+
+    def get_state(self):
+        return self.editor.isChecked()
+
+    def set_state(self, state):
+        self.editor.setChecked(state)
 
 
 class AllPeersNode(Node):
@@ -353,10 +545,28 @@ class AllPeersNode(Node):
     init_outputs = [
         NodeOutputBP("message", type_="peer")
     ]
-    singleton_ports = [
-    ]
+    singleton_ports = SINGLETON_PORTS["AllPeers"]
     color = '#8aff44'
     __class_codes__ = None
+    main_widget_class = AllPeersWidget
+
+    def __init__(self, params):
+        super().__init__(params)
+
+        self.serialize_once = False
+
+    def additional_data(self) -> dict:
+        out = super().additional_data()
+        out["serialize_once"] = self.serialize_once
+        return out
+
+    def load_additional_data(self, data):
+        super().load_additional_data(data)
+
+        self.serialize_once = data.get("serialize_once", False)
+
+    def set_serialize_once(self, value):
+        self.serialize_once = value
 
     def init_default_actions(self) -> dict:
         actions = {
@@ -366,6 +576,56 @@ class AllPeersNode(Node):
         return actions
 
 
+class LoggingIntValidator(QIntValidator, LogInParentMixIn):
+
+    def __init__(self, parent=None, description="number of peers"):
+        super().__init__(parent=parent)
+
+        self.description = description
+
+    def validate(self, arg__1:str, arg__2:int) -> PySide2.QtGui.QValidator.State:
+        out = super().validate(arg__1, arg__2)
+        if isinstance(out, tuple) and out[0] == QValidator.Invalid:
+            self.log_error(f"\"{arg__1}\" is not a valid {self.description}!")
+        return out
+
+
+class RandomPeerWidget(CustomWidgetBase):
+    def __init__(self, params):
+        super().__init__()
+
+        self.node, self.node_item = params
+
+        self.setAttribute(Qt.WA_TranslucentBackground, True)
+        self.setAttribute(Qt.WA_NoSystemBackground, True)
+
+        self.setLayout(QVBoxLayout())
+        validator = LoggingIntValidator(parent=self)
+        validator.setBottom(1)
+        line_edit = QLineEdit()
+        line_edit.setFont(QFont('source code pro', 10))
+        line_edit.setValidator(validator)
+        line_edit.setPlaceholderText('1')
+        line_edit.setToolTip("Number of distinct peers to select")
+        line_edit.editingFinished.connect(self.fan_out_updated)
+        self.editor = line_edit
+        self.layout().addWidget(line_edit)
+
+    def fan_out_updated(self):
+        text = self.editor.text()
+        if text and not self.editor.hasAcceptableInput():
+            # Partially edited, e.g. "0": keep the current fan-out until the text is a valid number.
+            return
+        self.node.set_fan_out(int(text) if text else NODE_OPTIONS["RandomPeer"]["fan_out"])
+        graph_events.changed.emit(self.node)
+
+    def get_state(self):
+        return self.editor.text()
+
+    def set_state(self, state):
+        self.editor.setText(state)
+
+
 class RandomPeerNode(Node):
     title = 'RandomPeer'
     init_inputs = [
@@ -374,10 +634,28 @@ class RandomPeerNode(Node):
     init_outputs = [
         NodeOutputBP("message", type_="peer")
     ]
-    singleton_ports = [
-    ]
+    singleton_ports = SINGLETON_PORTS["RandomPeer"]
     color = '#8aff44'
     __class_codes__ = None
+    main_widget_class = RandomPeerWidget
+
+    def __init__(self, params):
+        super().__init__(params)
+
+        self.fan_out = 1
+
+    def additional_data(self) -> dict:
+        out = super().additional_data()
+        out["fan_out"] = self.fan_out
+        return out
+
+    def load_additional_data(self, data):
+        super().load_additional_data(data)
+
+        self.fan_out = data.get("fan_out", 1)
+
+    def set_fan_out(self, value):
+        self.fan_out = value
 
     def init_default_actions(self) -> dict:
         actions = {
@@ -417,6 +695,7 @@ class PeriodicTaskWidget(CustomWidgetBase):
 
     def interval_updated(self):
         self.node.set_interval(float(self.editor.text()))
+        graph_events.changed.emit(self.node)
 
     def get_state(self):
         return self.editor.text()
@@ -432,6 +711,7 @@ class PeriodicTaskNode(Node):
     init_outputs = [
         NodeOutputBP("on_timer_fire", type_="task")
     ]
+    singleton_ports = SINGLETON_PORTS["PeriodicTask"]
     color = '#ff448a'
     __class_codes__ = None
     main_widget_class = PeriodicTaskWidget
@@ -462,7 +742,300 @@ class PeriodicTaskNode(Node):
         return actions
 
 
-nodes = [AllPeersNode, CacheNode, MessageNode, PeriodicTaskNode, RandomPeerNode]
-widgets = [CacheWidget, MessageWidget, PeriodicTaskWidget]
+class RateLimiterWidget(CustomWidgetBase):
+    # The limits that are edited as a number, with their tooltips.
+    LIMITS = [
+        ("peer_rate", "Messages per second per peer (0 is unlimited)"),
+        ("peer_burst", "Messages a peer can send in a burst"),
+        ("global_rate", "Messages per second from all peers combined (0 is unlimited)"),
+        ("global_burst", "Messages all peers combined can send in a burst"),
+        ("max_peers", "Number of peers to remember the rate of, least recently seen peers are forgotten first"),
+        ("max_deferred", "Maximum number of deferred messages")
+    ]
+
+    def __init__(self, params):
+        super().__init__()
+
+        self.node, self.node_item = params
+
+        self.setAttribute(Qt.WA_TranslucentBackground, True)
+        self.setAttribute(Qt.WA_NoSystemBackground, True)
+
+        self.setLayout(QVBoxLayout())
+        self.editors = {}
+        for option, tooltip in self.LIMITS:
+            default = NODE_OPTIONS["RateLimiter"][option]
+            if isinstance(default, int):
+                validator = LoggingIntValidator(parent=self, description=option.replace("_", " "))
+                validator.setBottom(1)
+            else:
+                validator = LoggingDoubleValidator(parent=self)
+                validator.setBottom(0.0)
+            line_edit = QLineEdit()
+            line_edit.setFont(QFont('source code pro', 10))
+            line_edit.setValidator(validator)
+            line_edit.setPlaceholderText(f"{option}: {default}")
+            line_edit.setToolTip(tooltip)
+            line_edit.editingFinished.connect(self.limits_updated)
+            self.editors[option] = line_edit
+            self.layout().addWidget(line_edit)
+
+        self.policy_edit = QComboBox()
+        self.policy_edit.setFont(QFont('source code pro', 10))
+        for policy in RATE_LIMIT_POLICIES:
+            self.policy_edit.addItem(policy)
+        self.policy_edit.setToolTip("Drop messages that exceed the limits or handle them later")
+        self.policy_edit.currentIndexChanged.connect(self.limits_updated)
+        self.layout().addWidget(self.policy_edit)
+
+    def limits_updated(self):
+        for option, line_edit in self.editors.items():
+            default = NODE_OPTIONS["RateLimiter"][option]
+            # A limit that is partially edited keeps its current value until the text is a valid number.
+            value = edited_number(line_edit, type(default), default)
+            if value is not None:
+                self.node.set_limit(option, value)
+        self.node.set_limit("policy", self.policy_edit.itemText(self.policy_edit.currentIndex()))
+        graph_events.changed.emit(self.node)
+
+    def get_state(self):
+        return {option: line_edit.text() for option, line_edit in self.editors.items()}
+
+    def set_state(self, state):
+        for option, text in state.items():
+            if option in self.editors:
+                self.editors[option].setText(text)
+        self.policy_edit.setCurrentIndex(self.policy_edit.findText(self.node.policy))
+
+
+class RateLimiterNode(Node):
+    title = 'RateLimiter'
+    init_inputs = [
+    ]
+    init_outputs = [
+        NodeOutputBP("limits", type_="limit")
+    ]
+    singleton_ports = SINGLETON_PORTS["RateLimiter"]
+    color = '#ffb344'
+    __class_codes__ = None
+    main_widget_class = RateLimiterWidget
+
+    def __init__(self, params):
+        super().__init__(params)
+
+        for option, default in NODE_OPTIONS["RateLimiter"].items():
+            setattr(self, option, default)
+
+    def additional_data(self) -> dict:
+        out = super().additional_data()
+        for option in NODE_OPTIONS["RateLimiter"]:
+            out[option] = getattr(self, option)
+        return out
+
+    def load_additional_data(self, data):
+        super().load_additional_data(data)
+
+        for option, default in NODE_OPTIONS["RateLimiter"].items():
+            setattr(self, option, data.get(option, default))
+
+    def set_limit(self, option, value):
+        setattr(self, option, value)
+
+    def init_default_actions(self) -> dict:
+        actions = {
+            'update shape': {'method': self.update_shape},
+            'hide unconnected ports': {'method': self.hide_unconnected_ports}
+        }
+        return actions
+
+
+class AggregatorWidget(CustomWidgetBase):
+    def __init__(self, params):
+        super().__init__()
+
+        self.node, self.node_item = params
+
+        self.setAttribute(Qt.WA_TranslucentBackground, True)
+        self.setAttribute(Qt.WA_NoSystemBackground, True)
+
+        self.setLayout(QVBoxLayout())
+        delay_validator = LoggingDoubleValidator(parent=self)
+        delay_validator.setBottom(0.0)
+        self.delay_edit = QLineEdit()
+        self.delay_edit.setFont(QFont('source code pro', 10))
+        self.delay_edit.setValidator(delay_validator)
+        self.delay_edit.setPlaceholderText(f"max_delay: {NODE_OPTIONS['Aggregator']['max_delay']}")
+        self.delay_edit.setToolTip("Seconds that a packet waits for other packets to the same peer")
+        self.delay_edit.editingFinished.connect(self.window_updated)
+        self.layout().addWidget(self.delay_edit)
+
+        bytes_validator = LoggingIntValidator(parent=self, description="batch size")
+        bytes_validator.setRange(1, MAX_BATCH_BYTES)
+        self.bytes_edit = QLineEdit()
+        self.bytes_edit.setFont(QFont('source code pro', 10))
+        self.bytes_edit.setValidator(bytes_validator)
+        self.bytes_edit.setPlaceholderText(f"max_bytes: {NODE_OPTIONS['Aggregator']['max_bytes']}")
+        self.bytes_edit.setToolTip("Bytes after which a batch is sent without waiting")
+        self.bytes_edit.editingFinished.connect(self.window_updated)
+        self.layout().addWidget(self.bytes_edit)
+
+    def window_updated(self):
+        # A setting that is partially edited keeps its current value until the text is a valid number.
+        max_delay = edited_number(self.delay_edit, float, NODE_OPTIONS["Aggregator"]["max_delay"])
+        if max_delay is not None:
+            self.node.set_max_delay(max_delay)
+        max_bytes = edited_number(self.bytes_edit, int, NODE_OPTIONS["Aggregator"]["max_bytes"])
+        if max_bytes is not None:
+            self.node.set_max_bytes(max_bytes)
+        graph_events.changed.emit(self.node)
+
+    def get_state(self):
+        return {"max_delay": self.delay_edit.text(), "max_bytes": self.bytes_edit.text()}
+
+    def set_state(self, state):
+        self.delay_edit.setText(state.get("max_delay", ""))
+        self.bytes_edit.setText(state.get("max_bytes", ""))
+
+
+class AggregatorNode(Node):
+    title = 'Aggregator'
+    init_inputs = [
+    ]
+    init_outputs = [
+        NodeOutputBP("aggregates", type_="aggregate")
+    ]
+    singleton_ports = SINGLETON_PORTS["Aggregator"]
+    color = '#8bc34a'
+    __class_codes__ = None
+    main_widget_class = AggregatorWidget
+
+    def __init__(self, params):
+        super().__init__(params)
+
+        self.max_delay = NODE_OPTIONS["Aggregator"]["max_delay"]
+        self.max_bytes = NODE_OPTIONS["Aggregator"]["max_bytes"]
+
+    def additional_data(self) -> dict:
+        out = super().additional_data()
+        out["max_delay"] = self.max_delay
+        out["max_bytes"] = self.max_bytes
+        return out
+
+    def load_additional_data(self, data):
+        super().load_additional_data(data)
+
+        self.max_delay = data.get("max_delay", NODE_OPTIONS["Aggregator"]["max_delay"])
+        self.max_bytes = data.get("max_bytes", NODE_OPTIONS["Aggregator"]["max_bytes"])
+
+    def set_max_delay(self, value):
+        self.max_delay = value
+
+    def set_max_bytes(self, value):
+        self.max_bytes = value
+
+    def init_default_actions(self) -> dict:
+        actions = {
+            'update shape': {'method': self.update_shape},
+            'hide unconnected ports': {'method': self.hide_unconnected_ports}
+        }
+        return actions
+
+
+class MemoizerWidget(CustomWidgetBase):
+    def __init__(self, params):
+        super().__init__()
+
+        self.node, self.node_item = params
+
+        self.setAttribute(Qt.WA_TranslucentBackground, True)
+        self.setAttribute(Qt.WA_NoSystemBackground, True)
+
+        self.setLayout(QVBoxLayout())
+        entries_validator = LoggingIntValidator(parent=self, description="number of responses")
+        entries_validator.setBottom(1)
+        self.entries_edit = QLineEdit()
+        self.entries_edit.setFont(QFont('source code pro', 10))
+        self.entries_edit.setValidator(entries_validator)
+        self.entries_edit.setPlaceholderText(f"max_entries: {NODE_OPTIONS['Memoizer']['max_entries']}")
+        self.entries_edit.setToolTip("Number of responses to remember, the least recently used are forgotten first")
+        self.entries_edit.editingFinished.connect(self.limits_updated)
+        self.layout().addWidget(self.entries_edit)
+
+        ttl_validator = LoggingDoubleValidator(parent=self)
+        ttl_validator.setBottom(0.0)
+        self.ttl_edit = QLineEdit()
+        self.ttl_edit.setFont(QFont('source code pro', 10))
+        self.ttl_edit.setValidator(ttl_validator)
+        self.ttl_edit.setPlaceholderText(f"ttl: {NODE_OPTIONS['Memoizer']['ttl']}")
+        self.ttl_edit.setToolTip("Seconds before a remembered response is computed again")
+        self.ttl_edit.editingFinished.connect(self.limits_updated)
+        self.layout().addWidget(self.ttl_edit)
+
+    def limits_updated(self):
+        # A limit that is partially edited keeps its current value until the text is a valid number.
+        max_entries = edited_number(self.entries_edit, int, NODE_OPTIONS["Memoizer"]["max_entries"])
+        if max_entries is not None:
+            self.node.set_max_entries(max_entries)
+        ttl = edited_number(self.ttl_edit, float, NODE_OPTIONS["Memoizer"]["ttl"])
+        if ttl is not None:
+            self.node.set_ttl(ttl)
+        graph_events.changed.emit(self.node)
+
+    def get_state(self):
+        return {"max_entries": self.entries_edit.text(), "ttl": self.ttl_edit.text()}
+
+    def set_state(self, state):
+        self.entries_edit.setText(state.get("max_entries", ""))
+        self.ttl_edit.setText(state.get("ttl", ""))
+
+
+class MemoizerNode(Node):
+    title = 'Memoizer'
+    init_inputs = [
+    ]
+    init_outputs = [
+        NodeOutputBP("memoizes", type_="memo")
+    ]
+    singleton_ports = SINGLETON_PORTS["Memoizer"]
+    color = '#b388ff'
+    __class_codes__ = None
+    main_widget_class = MemoizerWidget
+
+    def __init__(self, params):
+        super().__init__(params)
+
+        self.max_entries = NODE_OPTIONS["Memoizer"]["max_entries"]
+        self.ttl = NODE_OPTIONS["Memoizer"]["ttl"]
+
+    def additional_data(self) -> dict:
+        out = super().additional_data()
+        out["max_entries"] = self.max_entries
+        out["ttl"] = self.ttl
+        return out
+
+    def load_additional_data(self, data):
+        super().load_additional_data(data)
+
+        self.max_entries = data.get("max_entries", NODE_OPTIONS["Memoizer"]["max_entries"])
+        self.ttl = data.get("ttl", NODE_OPTIONS["Memoizer"]["ttl"])
+
+    def set_max_entries(self, value):
+        self.max_entries = value
+
+    def set_ttl(self, value):
+        self.ttl = value
+
+    def init_default_actions(self) -> dict:
+        actions = {
+            'update shape': {'method': self.update_shape},
+            'hide unconnected ports': {'method': self.hide_unconnected_ports}
+        }
+        return actions
+
+
+nodes = [AggregatorNode, AllPeersNode, CacheNode, MemoizerNode, MessageNode, PeriodicTaskNode, RandomPeerNode,
+         RateLimiterNode]
+widgets = [AggregatorWidget, AllPeersWidget, CacheWidget, MemoizerWidget, MessageWidget, PeriodicTaskWidget,
+           RandomPeerWidget, RateLimiterWidget]
 export_nodes(*nodes)
 export_widgets(*widgets)
@@ -0,0 +1,249 @@
+"""
+Compact project format: gzip-compressed JSON lines.
+
+Every line is one record, so a project can be read (and its graph built) while it is being decompressed:
+
+- ``{"format": "ipv8-project", "version": 1, "x": {...}}``: the header, with the other top-level keys of the project.
+- ``{"script": title, "x": {...}, "fx": {...}}``: starts a script, with the other keys of the script and its flow.
+- ``{"template": identifier, "x": {...}}``: the node data (ports, widget state, ...) of the first node of a type.
+- ``{"n": identifier, "t": display title, "d": additional data, "x": {...}, "r": [...]}``: a node. ``x`` holds only
+  the node data that differs from the template of its type and ``r`` the template keys that the node does not have.
+- ``{"c": [parent node, output port, connected node, input port], "x": {...}}``: a connection.
+
+Empty ``x`` and ``r`` values and a missing display title are left out.
+
+Usage: ``python project_format.py compact project.json``, ``python project_format.py expand project.ipv8z`` or
+``python project_format.py compare project1.json project2.json``.
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterator, List
+
+from graph import FlowBuilder, GraphNode, load_scripts
+
+FORMAT_NAME = "ipv8-project"
+FORMAT_VERSION = 1
+COMPACT_EXTENSION = ".ipv8z"
+
+NODE_KEYS = ("identifier", "display title", "additional data")
+CONNECTION_KEYS = ("parent node index", "output port index", "connected node", "connected input port index")
+
+
+def is_compact(file_path: str) -> bool:
+    with open(file_path, "rb") as fp:
+        return fp.read(2) == b"\x1f\x8b"
+
+
+def compact_records(project: dict) -> Iterator[dict]:
+    """
+    The records of the compact encoding of the given (Ryven JSON) project.
+    """
+    yield {"format": FORMAT_NAME, "version": FORMAT_VERSION,
+           "x": {key: value for key, value in project.items() if key != "scripts"}}
+    for script_data in project["scripts"]:
+        flow_data = script_data["flow"]
+        yield {"script": script_data["title"],
+               "x": {key: value for key, value in script_data.items() if key not in ("title", "flow")},
+               "fx": {key: value for key, value in flow_data.items() if key not in ("nodes", "connections")}}
+        templates = {}
+        for node_data in flow_data["nodes"]:
+            identifier = node_data["identifier"]
+            extra = {key: value for key, value in node_data.items() if key not in NODE_KEYS}
+            template = templates.get(identifier)
+            if template is None:
+                templates[identifier] = template = extra
+                yield {"template": identifier, "x": extra}
+            record = {"n": identifier, "d": node_data.get("additional data", {})}
+            if "display title" in node_data:
+                record["t"] = node_data["display title"]
+            different = {key: value for key, value in extra.items() if key not in template or template[key] != value}
+            if different:
+                record["x"] = different
+            removed = [key for key in template if key not in extra]
+            if removed:
+                record["r"] = removed
+            yield record
+        for connection_data in flow_data.get("connections", []):
+            record = {"c": [connection_data[key] for key in CONNECTION_KEYS]}
+            extra = {key: value for key, value in connection_data.items() if key not in CONNECTION_KEYS}
+            if extra:
+                record["x"] = extra
+            yield record
+
+
+def write_compact(project: dict, file_path: str) -> None:
+    with gzip.open(file_path, "wt", encoding="utf-8") as fp:
+        for record in compact_records(project):
+            fp.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+
+def read_records(file_path: str) -> Iterator[dict]:
+    """
+    Stream the records of a compact project, decompressing it line by line.
+    """
+    with gzip.open(file_path, "rt", encoding="utf-8") as fp:
+        header = json.loads(fp.readline() or "{}")
+        if header.get("format") != FORMAT_NAME:
+            raise RuntimeError(f"{file_path} is not a compact project file!")
+        if header["version"] > FORMAT_VERSION:
+            raise RuntimeError(f"{file_path} uses version {header['version']} of the compact project format, "
+                               f"only versions up to {FORMAT_VERSION} are supported!")
+        yield header
+        for line in fp:
+            yield json.loads(line)
+
+
+def node_data_from_record(record: dict, template: dict) -> dict:
+    node_data = {"identifier": record["n"]}
+    if "t" in record:
+        node_data["display title"] = record["t"]
+    node_data["additional data"] = record["d"]
+    removed = record.get("r", [])
+    node_data.update((key, value) for key, value in template.items() if key not in removed)
+    node_data.update(record.get("x", {}))
+    return node_data
+
+
+def connection_data_from_record(record: dict) -> dict:
+    connection_data = dict(zip(CONNECTION_KEYS, record["c"]))
+    connection_data.update(record.get("x", {}))
+    return connection_data
+
+
+def read_compact(file_path: str) -> dict:
+    """
+    The inverse of ``write_compact``: the project as Ryven JSON.
+    """
+    project = {}
+    flow_data = None
+    templates = {}
+    for record in read_records(file_path):
+        if "format" in record:
+            project.update(record["x"])
+            project["scripts"] = []
+        elif "script" in record:
+            flow_data = dict(record["fx"], nodes=[], connections=[])
+            project["scripts"].append(dict({"title": record["script"]}, **record["x"], flow=flow_data))
+            templates = {}
+        elif "template" in record:
+            templates[record["template"]] = record["x"]
+        elif "n" in record:
+            flow_data["nodes"].append(node_data_from_record(record, templates[record["n"]]))
+        elif "c" in record:
+            flow_data["connections"].append(connection_data_from_record(record))
+    return project
+
+
+def load_compact_scripts(file_path: str) -> Dict[str, List[GraphNode]]:
+    """
+    Build the graph of every script while the compact project is being read, without holding its JSON in memory.
+    """
+    scripts = {}
+    builder = None
+    for record in read_records(file_path):
+        if "script" in record:
+            builder = FlowBuilder()
+            scripts[record["script"]] = builder.nodes
+        elif "n" in record:
+            builder.add_node({"identifier": record["n"], "display title": record["t"], "additional data": record["d"]}
+                             if "t" in record else {"identifier": record["n"], "additional data": record["d"]})
+        elif "c" in record:
+            builder.add_connection(connection_data_from_record(record))
+    return scripts
+
+
+def read_project(file_path: str) -> dict:
+    """
+    Read a project as Ryven JSON, from either format.
+    """
+    if is_compact(file_path):
+        return read_compact(file_path)
+    with open(file_path, "r") as fp:
+        return json.load(fp)
+
+
+def load_project_scripts(file_path: str) -> Dict[str, List[GraphNode]]:
+    """
+    Load the nodes of every script of a project in either format, like ``graph.load_project``.
+    """
+    if is_compact(file_path):
+        return load_compact_scripts(file_path)
+    with open(file_path, "r") as fp:
+        return load_scripts(json.load(fp))
+
+
+def load_nodes(file_path: str) -> List[GraphNode]:
+    """
+    Load all nodes of all scripts of a project in either format, like ``graph.load_nodes``.
+    """
+    return [node for nodes in load_project_scripts(file_path).values() for node in nodes]
+
+
+def compare(file_path: str, repeat: int = 5) -> Dict[str, float]:
+    """
+    Compare the size of a JSON project with its compact encoding, and the time it takes to load both into graphs.
+    """
+    with open(file_path, "r") as fp:
+        project = json.load(fp)
+    compact_path = os.path.splitext(file_path)[0] + COMPACT_EXTENSION
+    write_compact(project, compact_path)
+
+    def best_time(load):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            load()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    def load_json():
+        with open(file_path, "r") as json_fp:
+            load_scripts(json.load(json_fp))
+
+    try:
+        return {
+            "json_bytes": os.path.getsize(file_path),
+            "compact_bytes": os.path.getsize(compact_path),
+            "json_load_s": best_time(load_json),
+            "compact_load_s": best_time(lambda: load_compact_scripts(compact_path))
+        }
+    finally:
+        os.remove(compact_path)
+
+
+def run(args=None) -> int:
+    parser = argparse.ArgumentParser(description="Convert projects between Ryven JSON and the compact format.")
+    parser.add_argument("command", choices=["compact", "expand", "compare"])
+    parser.add_argument("projects", nargs="+", help="project files")
+    parser.add_argument("-o", "--output-dir", default=None, help="directory to write converted projects to")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed loads per format (the best is kept)")
+    parsed = parser.parse_args(args)
+
+    if parsed.output_dir is not None:
+        os.makedirs(parsed.output_dir, exist_ok=True)
+    for project_path in parsed.projects:
+        if parsed.command == "compare":
+            result = compare(project_path, parsed.repeat)
+            print(f"{project_path}: {result['json_bytes']} -> {result['compact_bytes']} bytes "
+                  f"({result['compact_bytes'] / result['json_bytes']:.1%}), "
+                  f"load {result['json_load_s'] * 1000:.2f} -> {result['compact_load_s'] * 1000:.2f} ms")
+            continue
+        stem = os.path.splitext(os.path.basename(project_path))[0]
+        output_dir = parsed.output_dir or os.path.dirname(project_path)
+        if parsed.command == "compact":
+            output_path = os.path.join(output_dir, stem + COMPACT_EXTENSION)
+            write_compact(read_project(project_path), output_path)
+        else:
+            output_path = os.path.join(output_dir, stem + ".json")
+            with open(output_path, "w") as fp:
+                json.dump(read_compact(project_path), fp, indent=4)
+        print(f"{project_path} -> {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
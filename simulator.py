@@ -0,0 +1,415 @@
+"""
+Discrete-event simulation of a design on thousands of virtual peers, on a simulated clock and without any sockets.
+
+Every peer runs the periodic tasks of the design, its selectors send to all or to a random sample of its neighbours,
+messages arrive after a random latency and are handled one at a time (taking ``handler_time`` each), handlers send
+their ``response`` back and create and retrieve caches that time out like IPv8's ``RequestCache`` does. Rate limiters
+drop or defer messages like the generated ``TokenBucketLimiter``. A cache belongs to the peer that sent the message that
+creates it, and is retrieved by a response that comes back to that peer.
+
+Every script of a project is simulated as a separate community, in an overlay of its own.
+
+Large overlays are split into shards that are simulated in separate processes. Every shard simulates its own peers
+exactly; messages to peers of other shards are delivered to a stand-in peer of the same shard, which keeps the load of
+every peer the same (a mean-field approximation). Every stand-in keeps separate rate limiter buckets per peer that it
+stands in for, of which (like in the generated limiter) only those of the ``max_peers`` most recent senders are kept.
+
+Usage: ``python simulator.py project.json -n 5000 --max-peers 30 --duration 60 --shards 8``
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from heapq import heappop, heappush
+from itertools import count
+from random import Random
+from typing import Dict, List, Optional
+
+from exporter import Exporter
+from project_format import load_project_scripts
+
+TASK, ARRIVE, HANDLE, TIMEOUT, SAMPLE = range(5)
+# Rounding may leave a bucket just short of a token at the (simulated) time that the token was expected.
+TOKEN_EPSILON = 1e-9
+
+
+def build_plan(nodes) -> dict:
+    """
+    The parts of a design that the simulation needs, as plain data that can be sent to the worker processes.
+    """
+    exporter = Exporter(nodes)
+    index = exporter.index
+    class_name = exporter.symbols.class_name
+    message_ids = {node: i for i, node in enumerate(exporter.message_nodes)}
+    cache_ids = {node: i for i, node in enumerate(exporter.cache_nodes)}
+    limiter_ids = {node: i for i, node in enumerate(exporter.rate_limiter_nodes)}
+
+    def lookup(ids, node):
+        return None if node is None else ids[node]
+
+    tasks = []
+    for task_node in exporter.task_nodes:
+        selectors = [(selector.title == "AllPeers", 1 if selector.title == "AllPeers" else selector.fan_out,
+                      [message_ids[message_node] for message_node in index.targets(selector, "message")])
+                     for selector in index.targets(task_node, "on_timer_fire")]
+        if task_node.interval > 0 and selectors:
+            tasks.append((task_node.interval, selectors))
+    return {
+        "messages": [class_name(message_node) for message_node in exporter.message_nodes],
+        "responses": [lookup(message_ids, index.first_target(message_node, "response"))
+                      for message_node in exporter.message_nodes],
+        "creates": [lookup(cache_ids, index.first_target(message_node, "create_cache"))
+                    for message_node in exporter.message_nodes],
+        "retrieves": [lookup(cache_ids, index.first_source(message_node, "retrieve_cache"))
+                      for message_node in exporter.message_nodes],
+        "limited_by": [lookup(limiter_ids, index.first_source(message_node, "rate_limit"))
+                       for message_node in exporter.message_nodes],
+        "limiters": [(node.peer_rate, node.peer_burst, node.global_rate, node.global_burst, node.policy == "defer",
+                      node.max_deferred, node.max_peers) for node in exporter.rate_limiter_nodes],
+        "caches": [class_name(cache_node) for cache_node in exporter.cache_nodes],
+        "cache_timeouts": [cache_node.timeout for cache_node in exporter.cache_nodes],
+        "cache_limits": [cache_node.max_outstanding for cache_node in exporter.cache_nodes],
+        "tasks": tasks
+    }
+
+
+class ShardSimulation:
+    """
+    The simulation of the peers ``first`` up to (but not including) ``last`` of an overlay of ``peers`` peers.
+    """
+
+    def __init__(self, plan: dict, peers: int, first: int, last: int, max_peers: Optional[int], duration: float,
+                 latency: tuple, handler_time: float, sample_interval: float, seed: int):
+        self.plan = plan
+        self.peers = peers
+        self.first = first
+        self.size = last - first
+        self.duration = duration
+        self.latency = latency
+        self.handler_time = handler_time
+        self.sample_interval = sample_interval
+        self.rng = Random(seed)
+
+        self.events = []
+        self.sequence = count()
+        self.now = 0.0
+        self.busy_until = [0.0] * self.size
+        self.backlog = [0] * self.size
+        # Every peer knows all other peers, or a fixed random sample of ``max_peers`` of them.
+        self.all_known = max_peers is None or max_peers >= peers - 1
+        self.neighbours = None if self.all_known else [
+            [x if x < first + i else x + 1 for x in self.rng.sample(range(peers - 1), max_peers)]
+            for i in range(self.size)]
+        self.caches = [{} for _ in plan["caches"]]
+        self.outstanding = [[0] * self.size for _ in plan["caches"]]
+        self.cache_numbers = count()
+        self.peer_buckets = {}
+        self.global_buckets = {}
+        self.deferred = {}
+
+        message_count = len(plan["messages"])
+        cache_count = len(plan["caches"])
+        self.sent = [0] * message_count
+        self.handled = [0] * message_count
+        self.dropped = [0] * message_count
+        self.created = [0] * cache_count
+        self.timeouts = [0] * cache_count
+        self.full = [0] * cache_count
+        self.samples = {
+            "time": [],
+            "messages": {name: {"sent": [], "handled": [], "dropped": []} for name in plan["messages"]},
+            "queue": {"total": [], "max": [], "deferred": []},
+            "caches": {name: {"outstanding": [], "created": [], "timeouts": [], "full": []} for name in plan["caches"]}
+        }
+
+    def schedule(self, at: float, kind: int, data: tuple) -> None:
+        heappush(self.events, (at, next(self.sequence), kind, data))
+
+    def local(self, peer: int) -> int:
+        """
+        The index of the peer of this shard that stands in for the given peer of the overlay.
+        """
+        local = peer - self.first
+        return local if 0 <= local < self.size else peer % self.size
+
+    def send(self, message_id: int, sender: int, receiver: int, token: Optional[tuple]) -> None:
+        self.sent[message_id] += 1
+        self.schedule(self.now + self.rng.uniform(*self.latency), ARRIVE, (message_id, sender, receiver, token, False))
+
+    def fire(self, local: int, task_id: int) -> None:
+        interval, selectors = self.plan["tasks"][task_id]
+        self.schedule(self.now + interval, TASK, (local, task_id))
+        sender = self.first + local
+        for all_peers, fan_out, message_ids in selectors:
+            if self.all_known:
+                receivers = ([x for x in range(self.peers) if x != sender] if all_peers
+                             else [x if x < sender else x + 1
+                                   for x in self.rng.sample(range(self.peers - 1), min(fan_out, self.peers - 1))])
+            else:
+                known = self.neighbours[local]
+                receivers = known if all_peers else self.rng.sample(known, min(fan_out, len(known)))
+            for receiver in receivers:
+                for message_id in message_ids:
+                    self.send(message_id, sender, receiver, None)
+
+    def acquire(self, limiter_id: int, receiver: int, sender: int) -> float:
+        """
+        Take a token of a rate limiter of the given receiver, like ``TokenBucketLimiter.acquire``.
+
+        The global bucket belongs to the stand-in peer, which receives the load of one peer, and the per-address buckets
+        to the peer that it stands in for, which receives the messages of one sender.
+        """
+        peer_rate, peer_burst, global_rate, global_burst, _, _, max_peers = self.plan["limiters"][limiter_id]
+        wait = 0.0
+        global_bucket = None
+        if global_rate:
+            global_bucket = self.global_buckets.setdefault((limiter_id, self.local(receiver)),
+                                                           [global_burst, self.now])
+            global_bucket[0] = min(global_burst, global_bucket[0] + (self.now - global_bucket[1]) * global_rate)
+            global_bucket[1] = self.now
+            if global_bucket[0] < 1 - TOKEN_EPSILON:
+                wait = (1 - global_bucket[0]) / global_rate
+        bucket = None
+        if peer_rate:
+            buckets = self.peer_buckets.setdefault((limiter_id, receiver), OrderedDict())
+            bucket = buckets.get(sender)
+            if bucket is None:
+                bucket = buckets[sender] = [peer_burst, self.now]
+                if len(buckets) > max_peers:
+                    buckets.popitem(last=False)
+            else:
+                buckets.move_to_end(sender)
+                bucket[0] = min(peer_burst, bucket[0] + (self.now - bucket[1]) * peer_rate)
+                bucket[1] = self.now
+            if bucket[0] < 1 - TOKEN_EPSILON:
+                wait = max(wait, (1 - bucket[0]) / peer_rate)
+        if wait == 0.0:
+            if global_bucket is not None:
+                global_bucket[0] -= 1
+            if bucket is not None:
+                bucket[0] -= 1
+        return wait
+
+    def arrive(self, message_id: int, sender: int, receiver: int, token: Optional[tuple], deferred: bool) -> None:
+        limiter_id = self.plan["limited_by"][message_id]
+        if limiter_id is not None:
+            key = (limiter_id, self.local(receiver))
+            if deferred:
+                self.deferred[key] -= 1
+            wait = self.acquire(limiter_id, receiver, sender)
+            if wait > 0.0:
+                _, _, _, _, defer, max_deferred, _ = self.plan["limiters"][limiter_id]
+                if defer and self.deferred.get(key, 0) < max_deferred:
+                    self.deferred[key] = self.deferred.get(key, 0) + 1
+                    self.schedule(self.now + wait, ARRIVE, (message_id, sender, receiver, token, True))
+                else:
+                    self.dropped[message_id] += 1
+                return
+        local = self.local(receiver)
+        self.backlog[local] += 1
+        self.busy_until[local] = max(self.now, self.busy_until[local]) + self.handler_time
+        self.schedule(self.busy_until[local], HANDLE, (message_id, sender, receiver, token))
+
+    def handle(self, message_id: int, sender: int, receiver: int, token: Optional[tuple]) -> None:
+        local = self.local(receiver)
+        self.backlog[local] -= 1
+        cache_id = self.plan["retrieves"][message_id]
+        if cache_id is not None:
+            # Like ``retrieve_cache``: without a matching cache, the handler is never called.
+            if token is None or token[0] != cache_id or token[1] != receiver \
+                    or self.caches[cache_id].pop(token[2], None) is None:
+                self.dropped[message_id] += 1
+                return
+            self.outstanding[cache_id][local] -= 1
+            token = None
+        self.handled[message_id] += 1
+        cache_id = self.plan["creates"][message_id]
+        if cache_id is not None:
+            # The cache belongs to the sender of the request, which the response goes back to.
+            owner = self.local(sender)
+            limit = self.plan["cache_limits"][cache_id]
+            if limit and self.outstanding[cache_id][owner] >= limit:
+                self.full[cache_id] += 1
+                return
+            number = next(self.cache_numbers)
+            self.caches[cache_id][number] = owner
+            self.outstanding[cache_id][owner] += 1
+            self.created[cache_id] += 1
+            self.schedule(self.now + self.plan["cache_timeouts"][cache_id], TIMEOUT, (cache_id, number))
+            token = (cache_id, sender, number)
+        response_id = self.plan["responses"][message_id]
+        if response_id is not None:
+            self.send(response_id, receiver, sender, token)
+
+    def timeout(self, cache_id: int, number: int) -> None:
+        local = self.caches[cache_id].pop(number, None)
+        if local is not None:
+            self.outstanding[cache_id][local] -= 1
+            self.timeouts[cache_id] += 1
+
+    def sample(self) -> None:
+        self.schedule(self.now + self.sample_interval, SAMPLE, ())
+        samples = self.samples
+        samples["time"].append(self.now)
+        for i, name in enumerate(self.plan["messages"]):
+            samples["messages"][name]["sent"].append(self.sent[i])
+            samples["messages"][name]["handled"].append(self.handled[i])
+            samples["messages"][name]["dropped"].append(self.dropped[i])
+        samples["queue"]["total"].append(sum(self.backlog))
+        samples["queue"]["max"].append(max(self.backlog, default=0))
+        samples["queue"]["deferred"].append(sum(self.deferred.values()))
+        for i, name in enumerate(self.plan["caches"]):
+            samples["caches"][name]["outstanding"].append(sum(self.outstanding[i]))
+            samples["caches"][name]["created"].append(self.created[i])
+            samples["caches"][name]["timeouts"].append(self.timeouts[i])
+            samples["caches"][name]["full"].append(self.full[i])
+        message_count = len(self.plan["messages"])
+        cache_count = len(self.plan["caches"])
+        self.sent, self.handled, self.dropped = [0] * message_count, [0] * message_count, [0] * message_count
+        self.created, self.timeouts, self.full = [0] * cache_count, [0] * cache_count, [0] * cache_count
+
+    def run(self) -> dict:
+        for local in range(self.size):
+            for task_id, (interval, _) in enumerate(self.plan["tasks"]):
+                self.schedule(self.rng.uniform(0, interval), TASK, (local, task_id))
+        self.schedule(self.sample_interval, SAMPLE, ())
+        handlers = {TASK: self.fire, ARRIVE: self.arrive, HANDLE: self.handle, TIMEOUT: self.timeout,
+                    SAMPLE: self.sample}
+        while self.events and self.events[0][0] <= self.duration:
+            self.now, _, kind, data = heappop(self.events)
+            handlers[kind](*data)
+        return self.samples
+
+
+def simulate_shard(plan: dict, peers: int, first: int, last: int, max_peers: Optional[int], duration: float,
+                   latency: tuple, handler_time: float, sample_interval: float, seed: int) -> dict:
+    return ShardSimulation(plan, peers, first, last, max_peers, duration, latency, handler_time, sample_interval,
+                           seed).run()
+
+
+def merge_samples(plan: dict, shard_samples: List[dict], sample_interval: float, peers: int) -> dict:
+    """
+    Combine the samples of all shards into time series of rates per second, queue depths and cache occupancy.
+    """
+    length = min(len(samples["time"]) for samples in shard_samples)
+
+    def total(select):
+        return [sum(select(samples)[i] for samples in shard_samples) for i in range(length)]
+
+    def per_second(values):
+        return [value / sample_interval for value in values]
+
+    report = {"peers": peers, "time": shard_samples[0]["time"][:length], "messages": {}, "caches": {}}
+    for name in plan["messages"]:
+        report["messages"][name] = {
+            key + "_per_s": per_second(total(lambda samples: samples["messages"][name][key]))
+            for key in ("sent", "handled", "dropped")
+        }
+    report["queue"] = {
+        "mean_depth": [value / peers for value in total(lambda samples: samples["queue"]["total"])],
+        "max_depth": [max(samples["queue"]["max"][i] for samples in shard_samples) for i in range(length)],
+        "deferred": total(lambda samples: samples["queue"]["deferred"])
+    }
+    for name in plan["caches"]:
+        report["caches"][name] = {
+            "outstanding": total(lambda samples: samples["caches"][name]["outstanding"]),
+            "created_per_s": per_second(total(lambda samples: samples["caches"][name]["created"])),
+            "timeouts_per_s": per_second(total(lambda samples: samples["caches"][name]["timeouts"])),
+            "full_per_s": per_second(total(lambda samples: samples["caches"][name]["full"]))
+        }
+    return report
+
+
+def simulate(nodes, peers: int, max_peers: Optional[int] = None, duration: float = 60.0,
+             latency: tuple = (0.02, 0.1), handler_time: float = 0.0005, sample_interval: float = 1.0,
+             shards: int = 1, jobs: Optional[int] = None, seed: int = 42) -> dict:
+    """
+    Simulate a design on ``peers`` peers for ``duration`` simulated seconds, in ``shards`` worker processes.
+    """
+    plan = build_plan(nodes)
+    shards = max(1, min(shards, peers))
+    bounds = [peers * i // shards for i in range(shards + 1)]
+    arguments = [(plan, peers, bounds[i], bounds[i + 1], max_peers, duration, latency, handler_time, sample_interval,
+                  seed + i) for i in range(shards)]
+    if shards == 1:
+        shard_samples = [simulate_shard(*arguments[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=max(1, min(jobs or os.cpu_count(), shards))) as executor:
+            shard_samples = list(executor.map(simulate_shard, *zip(*arguments)))
+    return merge_samples(plan, shard_samples, sample_interval, peers)
+
+
+def summarize(report: dict, warmup: float) -> Dict[str, dict]:
+    """
+    The means (and maxima) of the time series, after the first ``warmup`` simulated seconds.
+    """
+    start = next((i for i, at in enumerate(report["time"]) if at >= warmup), len(report["time"]))
+
+    def mean(values):
+        values = values[start:]
+        return sum(values) / len(values) if values else 0.0
+
+    return {
+        "messages": {name: {key: mean(values) for key, values in series.items()}
+                     for name, series in report["messages"].items()},
+        "queue": {"mean_depth": mean(report["queue"]["mean_depth"]),
+                  "max_depth": max(report["queue"]["max_depth"][start:], default=0),
+                  "deferred": mean(report["queue"]["deferred"])},
+        "caches": {name: {key: mean(values) for key, values in series.items()}
+                   for name, series in report["caches"].items()}
+    }
+
+
+def print_summary(report: dict, summary: dict) -> None:
+    print(f"{report['peers']} peers, {report['time'][-1] if report['time'] else 0:.0f} simulated seconds")
+    print(f"{'message':<30} {'sent/s':>12} {'handled/s':>12} {'dropped/s':>12}")
+    for name, stats in summary["messages"].items():
+        print(f"{name:<30} {stats['sent_per_s']:>12.1f} {stats['handled_per_s']:>12.1f} "
+              f"{stats['dropped_per_s']:>12.1f}")
+    print(f"queue depth: {summary['queue']['mean_depth']:.3f} mean per peer, {summary['queue']['max_depth']} max, "
+          f"{summary['queue']['deferred']:.1f} messages deferred by rate limiters")
+    for name, stats in summary["caches"].items():
+        print(f"{name:<30} outstanding: {stats['outstanding']:.1f}, created: {stats['created_per_s']:.1f}/s, "
+              f"timeouts: {stats['timeouts_per_s']:.1f}/s, full: {stats['full_per_s']:.1f}/s")
+
+
+def run(args=None) -> int:
+    parser = argparse.ArgumentParser(description="Simulate saved IPv8 community designs on virtual peers.")
+    parser.add_argument("project", help="saved project file (JSON or compact)")
+    parser.add_argument("-n", "--peers", type=int, default=1000, help="number of peers in the overlay")
+    parser.add_argument("--max-peers", type=int, default=None,
+                        help="number of peers that every peer knows (default: all other peers)")
+    parser.add_argument("-d", "--duration", type=float, default=60.0, help="simulated seconds")
+    parser.add_argument("--latency", type=float, nargs=2, default=[0.02, 0.1],
+                        help="minimum and maximum one-way latency in seconds")
+    parser.add_argument("--handler-time", type=float, default=0.0005, help="seconds that every handler call takes")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="simulated seconds between samples")
+    parser.add_argument("--warmup", type=float, default=10.0, help="simulated seconds to leave out of the summary")
+    parser.add_argument("--shards", type=int, default=os.cpu_count(), help="number of shards of the overlay")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--seed", type=int, default=42, help="random seed")
+    parser.add_argument("--json", default=None, help="write the time series to this JSON file")
+    parsed = parser.parse_args(args)
+
+    reports = {}
+    # Every script is a community of its own, with its own overlay.
+    for title, nodes in load_project_scripts(parsed.project).items():
+        start = time.perf_counter()
+        report = simulate(nodes, parsed.peers, parsed.max_peers, parsed.duration, tuple(parsed.latency),
+                          parsed.handler_time, parsed.sample_interval, parsed.shards, parsed.jobs, parsed.seed)
+        summary = summarize(report, parsed.warmup)
+        print(f"{parsed.project}: {title}")
+        print_summary(report, summary)
+        print(f"Simulated in {time.perf_counter() - start:.1f}s")
+        reports[title] = dict(report, summary=summary)
+    if parsed.json is not None:
+        with open(parsed.json, "w") as fp:
+            json.dump(reports, fp, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,116 @@
+import os
+import sys
+
+import pytest
+
+# The modules of the editor are not installed as a package, they are imported from the root of the repository.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from graph import GraphNode, connect  # noqa: E402
+
+
+def port(node, label: str):
+    for candidate in node.inputs + node.outputs:
+        if candidate.label_str == label:
+            return candidate
+    raise KeyError(label)
+
+
+def link(out_node, out_label: str, in_node, in_label: str):
+    return connect(port(out_node, out_label), port(in_node, in_label))
+
+
+def build_design():
+    """
+    A design that uses every node type and most options: compiled and dataclass payloads, a cache with a limit, a
+    deferring rate limiter, offloaded handlers, an aggregator and a memoizer.
+    """
+    ping = GraphNode("Message", "Ping", {"custom_fields_dict": {"sequence": "int", "text": "str",
+                                                                "ports": "List[uint16]"}})
+    pong = GraphNode("Message", "Pong", {"custom_fields_dict": {"sequence": "uint32", "name": "str"}})
+    announce = GraphNode("Message", "Announce", {"custom_fields_dict": {"blob": "bytes"}, "offload": "thread"})
+    query = GraphNode("Message", "Query", {"custom_fields_dict": {"key": "str", "keys": "List[str]"}})
+    answer = GraphNode("Message", "Answer", {"custom_fields_dict": {"value": "object"}, "offload": "process"})
+    cache = GraphNode("Cache", "PingCache", {"custom_fields_dict": {"start": "float"}, "timeout": 5.0,
+                                             "max_outstanding": 100, "on_timeout": "log"})
+    ping_task = GraphNode("PeriodicTask", "PeriodicTask", {"interval": 1.0})
+    announce_task = GraphNode("PeriodicTask", "PeriodicTask", {"interval": 2.0})
+    query_task = GraphNode("PeriodicTask", "PeriodicTask", {"interval": 4.0})
+    ping_selector = GraphNode("RandomPeer", "RandomPeer", {"fan_out": 3})
+    announce_selector = GraphNode("AllPeers", "AllPeers", {"serialize_once": True})
+    query_selector = GraphNode("RandomPeer", "RandomPeer")
+    limiter = GraphNode("RateLimiter", "RateLimiter", {"policy": "defer"})
+    aggregator = GraphNode("Aggregator", "Aggregator")
+    memoizer = GraphNode("Memoizer", "Memoizer")
+
+    link(ping_task, "on_timer_fire", ping_selector, "select")
+    link(ping_selector, "message", ping, "received_by")
+    link(ping, "response", pong, "received_by")
+    link(ping, "create_cache", cache, "belongs_to")
+    link(cache, "received_by", pong, "retrieve_cache")
+    link(limiter, "limits", ping, "rate_limit")
+    link(announce_task, "on_timer_fire", announce_selector, "select")
+    link(announce_selector, "message", announce, "received_by")
+    link(aggregator, "aggregates", announce, "aggregate")
+    link(aggregator, "aggregates", pong, "aggregate")
+    link(query_task, "on_timer_fire", query_selector, "select")
+    link(query_selector, "message", query, "received_by")
+    link(query, "response", answer, "received_by")
+    link(memoizer, "memoizes", query, "memoize")
+
+    return [ping, pong, announce, query, answer, cache, ping_task, announce_task, query_task, ping_selector,
+            announce_selector, query_selector, limiter, aggregator, memoizer]
+
+
+@pytest.fixture
+def design():
+    return build_design()
+
+
+class FakePeer:
+
+    def __init__(self, address):
+        self.address = address
+
+
+class FakeCommunity:
+    """
+    The parts of IPv8's ``Community`` that the generated methods use, which record what they are asked to send.
+    A packet is only the id of its message.
+    """
+
+    def __init__(self, peers=()):
+        self.peers = list(peers)
+        self.endpoint = self
+        self.packed = []
+        self.sent = []
+
+    def get_peers(self):
+        return list(self.peers)
+
+    def ezr_pack(self, msg_num, *payloads, **kwargs):
+        self.packed.append(msg_num)
+        return bytes((msg_num,))
+
+    def ez_send(self, peer, *payloads, **kwargs):
+        self.send(peer.address, self.ezr_pack(payloads[0].msg_id, *payloads))
+
+    def send(self, address, packet):
+        self.sent.append((address, packet))
+
+
+def payload_class(name, msg_id):
+    """
+    A stand-in for a generated message, which ignores the placeholder that the generated code constructs it with.
+    """
+    return type(name, (), {"msg_id": msg_id, "__init__": lambda self, *args: None})
+
+
+def generated_class(fragments, base=FakeCommunity, namespace=None):
+    """
+    Execute generated methods as the body of a class that derives from ``base``. Their annotations are not evaluated,
+    so the IPv8 types that they refer to are not needed.
+    """
+    namespace = dict(namespace or {}, Base=base)
+    exec("from __future__ import annotations\n" + "class Generated(Base):\n" + "".join(fragments), namespace)
+    return namespace["Generated"]
@@ -0,0 +1,160 @@
+from struct import pack, unpack_from
+
+import pytest
+
+from benchmark import SCRIPT_MESSAGES, benchmark_project, build_synthetic_graph, build_synthetic_project
+from conftest import FakeCommunity, FakePeer, generated_class, payload_class
+from exporter import Exporter, produce_aggregator_block, produce_batch_handler_block
+from graph import BATCH_MSG_ID, FIRST_RESERVED_MSG_ID, GraphNode
+from validator import ERROR, GraphLinter
+
+PREFIX = b"PREFIX"
+ADDRESS = ("1.2.3.4", 5)
+
+
+class Timer:
+
+    def __init__(self, delay, callback, args):
+        self.delay = delay
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeLoop:
+
+    def __init__(self):
+        self.timers = []
+
+    def call_later(self, delay, callback, *args):
+        self.timers.append(Timer(delay, callback, args))
+        return self.timers[-1]
+
+    def fire(self):
+        for timer in self.timers:
+            if not timer.cancelled:
+                timer.callback(*timer.args)
+        self.timers = []
+
+
+class BatchCommunity(FakeCommunity):
+
+    def __init__(self):
+        super().__init__()
+        self._prefix = PREFIX
+        self.handled = []
+
+    def ezr_pack(self, msg_num, *payloads, **kwargs):
+        return PREFIX + super().ezr_pack(msg_num, *payloads, **kwargs)
+
+    def on_packet(self, packet):
+        self.handled.append(packet)
+
+
+@pytest.fixture
+def aggregator_module():
+    loop = FakeLoop()
+    namespace = {"pack": pack, "get_running_loop": lambda: loop}
+    exec("".join(produce_aggregator_block(BATCH_MSG_ID)), namespace)
+    namespace["loop"] = loop
+    return namespace
+
+
+def test_batch_after_delay(aggregator_module):
+    community = BatchCommunity()
+    aggregator = aggregator_module["MessageAggregator"](community, 0.05, 1200)
+    aggregator.send_packet(ADDRESS, PREFIX + b"\x01one")
+    aggregator.send_packet(ADDRESS, PREFIX + b"\x02two")
+    assert community.sent == []
+
+    aggregator_module["loop"].fire()
+    assert community.sent == [(ADDRESS, PREFIX + bytes((BATCH_MSG_ID,)) + b"\x00\x04\x01one\x00\x04\x02two")]
+    assert aggregator.batches == {}
+
+
+def test_single_packet_is_sent_as_it_is(aggregator_module):
+    community = BatchCommunity()
+    aggregator = aggregator_module["MessageAggregator"](community, 0.05, 1200)
+    aggregator.send(FakePeer(ADDRESS), payload_class("Ping", 1)())
+    aggregator.send_packet(("5.6.7.8", 9), PREFIX + b"\x02")
+    aggregator_module["loop"].fire()
+
+    assert community.sent == [(ADDRESS, PREFIX + b"\x01"), (("5.6.7.8", 9), PREFIX + b"\x02")]
+
+
+def test_full_batch_is_sent_at_once(aggregator_module):
+    community = BatchCommunity()
+    # The prefix, the batch id and two packets of 2 + 4 bytes.
+    aggregator = aggregator_module["MessageAggregator"](community, 0.05, len(PREFIX) + 1 + 12)
+    for i in range(3):
+        aggregator.send_packet(ADDRESS, PREFIX + bytes((i,)) + b"abc")
+
+    assert len(community.sent) == 1
+    assert aggregator_module["loop"].timers[0].cancelled
+    aggregator.flush_all()
+    assert community.sent[1] == (ADDRESS, PREFIX + b"\x02abc")
+
+
+def test_on_batch(aggregator_module):
+    sender = BatchCommunity()
+    aggregator = aggregator_module["MessageAggregator"](sender, 0.05, 1200)
+    packets = [PREFIX + b"\x01one", PREFIX + b"\x02two", PREFIX + bytes((BATCH_MSG_ID,)) + b"\x00\x01\x01"]
+    for packet in packets:
+        aggregator.send_packet(ADDRESS, packet)
+    aggregator.flush_all()
+    (_, batch), = sender.sent
+
+    receiver = generated_class(produce_batch_handler_block(), BatchCommunity,
+                               {"unpack_from": unpack_from, "BATCH_MSG_ID": BATCH_MSG_ID})()
+    # A truncated last packet is dropped, as are batches in the batch.
+    receiver.on_batch(ADDRESS, batch + b"\x00\x09\x03")
+    assert receiver.handled == [(ADDRESS, packets[0]), (ADDRESS, packets[1])]
+
+
+def test_message_limit():
+    nodes = build_synthetic_graph(FIRST_RESERVED_MSG_ID, 0, 0)
+    linter = GraphLinter(nodes)
+    assert linter.error_count == 0
+    Exporter(nodes)
+
+    aggregator = GraphNode("Aggregator", "Aggregator")
+    nodes.append(aggregator)
+    linter.node_added(aggregator)
+    assert linter.error_count == FIRST_RESERVED_MSG_ID
+    assert all(diagnostic.severity == ERROR for diagnostic in linter.errors())
+
+    message = nodes.pop(0)
+    linter.node_removed(message)
+    assert len(nodes) - 1 == BATCH_MSG_ID
+    assert linter.error_count == 0
+
+
+def test_exporter_message_limit(design):
+    with pytest.raises(RuntimeError):
+        Exporter(build_synthetic_graph(FIRST_RESERVED_MSG_ID + 1, 0, 0))
+    # With the aggregator of the design, the last message would get the id of the batches.
+    synthetic = build_synthetic_graph(FIRST_RESERVED_MSG_ID - 5, 0, 0)
+    Exporter(design[:5] + synthetic)
+    with pytest.raises(RuntimeError):
+        Exporter(design + synthetic)
+
+
+def test_synthetic_project():
+    scripts = build_synthetic_project(1000, 250, 100, 2)
+
+    assert len(scripts) == 5
+    assert all(len(Exporter(nodes).message_nodes) <= SCRIPT_MESSAGES for nodes in scripts.values())
+    assert sum(len(Exporter(nodes).message_nodes) for nodes in scripts.values()) == 1000
+    assert sum(len(Exporter(nodes).cache_nodes) for nodes in scripts.values()) == 250
+    assert all(GraphLinter(nodes).error_count == 0 for nodes in scripts.values())
+
+    with pytest.raises(RuntimeError):
+        build_synthetic_project(1000, 0, 0, script_messages=FIRST_RESERVED_MSG_ID + 1)
+
+
+def test_benchmark_refuses_invalid_projects(tmp_path):
+    with pytest.raises(RuntimeError, match="errors"):
+        benchmark_project({"synthetic": build_synthetic_graph(FIRST_RESERVED_MSG_ID + 1, 0, 0)}, 1, str(tmp_path))
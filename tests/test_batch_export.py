@@ -0,0 +1,73 @@
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from batch_export import export_flow, run, script_jobs
+from conftest import link
+from exporter import script_names
+from graph import GraphNode, dump_flow, project_data
+
+
+def test_script_names():
+    assert script_names(["ping pong", "Ping-Pong", "", "json", "ipv8"]) == [
+        ("ping_pong", "PingPongCommunity"),
+        ("ping_pong_2", "PingPongCommunity2"),
+        ("script", "ScriptCommunity"),
+        ("json_community", "JsonCommunity"),
+        ("ipv8_community", "Ipv8Community")
+    ]
+
+
+def project_file(tmp_path, scripts):
+    project_path = tmp_path / "project.json"
+    project_path.write_text(json.dumps(project_data(scripts)))
+    return project_path
+
+
+def test_script_jobs(design, tmp_path):
+    project_path = project_file(tmp_path, {"ping pong": design, "other": [GraphNode("Message", "Ping")]})
+    jobs = list(script_jobs(str(project_path), "out"))
+
+    assert [(label, output_path, community_name) for label, _, output_path, community_name in jobs] == [
+        (f"{project_path}:ping pong", "out/project_ping_pong.py", "PingPongCommunity"),
+        (f"{project_path}:other", "out/project_other.py", "OtherCommunity")
+    ]
+    assert jobs[0][1] == dump_flow(design)
+
+
+def test_per_script_export(design, tmp_path, capsys):
+    project_path = project_file(tmp_path, {"ping pong": design, "other": [GraphNode("Message", "Ping")]})
+    output_dir = tmp_path / "out"
+
+    assert run([str(project_path), "-o", str(output_dir), "-j", "2", "--per-script"]) == 0
+    assert sorted(path.name for path in output_dir.iterdir()) == ["project_other.py", "project_ping_pong.py"]
+    assert "class PingPongCommunity(Community):" in (output_dir / "project_ping_pong.py").read_text()
+    other = (output_dir / "project_other.py").read_text()
+    assert "class OtherCommunity(Community):" in other and "Pong" not in other
+    assert "Exported 2/2 scripts" in capsys.readouterr().out
+
+
+def test_per_script_export_failure(design, tmp_path, capsys):
+    cache = GraphNode("Cache", "OrphanCache")
+    pong = GraphNode("Message", "Pong")
+    link(cache, "received_by", pong, "retrieve_cache")
+    project_path = project_file(tmp_path, {"ping pong": design, "broken": [cache, pong]})
+    output_dir = tmp_path / "out"
+
+    # The script with an error fails, the other one is still exported.
+    assert run([str(project_path), "-o", str(output_dir), "-j", "1", "--per-script"]) == 1
+    assert [path.name for path in output_dir.iterdir()] == ["project_ping_pong.py"]
+    output = capsys.readouterr()
+    assert f"{project_path}:broken FAILED" in output.err
+    assert "Exported 1/2 scripts" in output.out
+
+
+def test_export_flow_in_spawned_process(design, tmp_path):
+    # Like the export of the editor, which must not fork its Qt application.
+    output_path = str(tmp_path / "community.py")
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        label, written_path, _, written, _ = executor.submit(export_flow, "design", dump_flow(design), output_path,
+                                                             "DesignCommunity").result()
+
+    assert (label, written_path, written) == ("design", output_path, True)
+    assert "class DesignCommunity(Community):" in (tmp_path / "community.py").read_text()
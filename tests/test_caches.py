@@ -0,0 +1,115 @@
+import logging
+from collections import defaultdict
+from functools import wraps
+from itertools import count
+from time import perf_counter
+
+import pytest
+
+from exporter import produce_bounded_request_cache_block, produce_cache_block, produce_instrumentation_block
+from graph import GraphNode
+from validator import ERROR, lint_node
+
+
+class FakeNumberCache:
+    """
+    IPv8's ``RandomNumberCache``, which draws a number for every cache.
+    """
+    numbers = count()
+
+    def __init__(self, request_cache, prefix):
+        self.prefix = prefix
+        self.number = next(self.numbers)
+
+    def get_timeout_delay(self):
+        return 10.0
+
+
+class FakeRequestCache:
+
+    def __init__(self):
+        self.caches = {}
+
+    def add(self, cache):
+        self.caches[(cache.prefix, cache.number)] = cache
+        return cache
+
+    def pop(self, prefix, number):
+        return self.caches.pop((prefix, number))
+
+    def _on_timeout(self, cache):
+        self.pop(cache.prefix, cache.number)
+        cache.on_timeout()
+
+
+def generated_caches(timeout=5.0, on_timeout="ignore", limit=2, instrumented=False):
+    namespace = {"RandomNumberCache": FakeNumberCache, "RequestCache": FakeRequestCache,
+                 "getLogger": logging.getLogger, "defaultdict": defaultdict, "wraps": wraps,
+                 "perf_counter": perf_counter}
+    exec("".join(produce_cache_block("PingCache", {"start": "float"}, timeout, on_timeout)), namespace)
+    exec("".join(produce_bounded_request_cache_block({"PingCache": limit})), namespace)
+    if instrumented:
+        exec("".join(produce_instrumentation_block(True, True)), namespace)
+    return namespace
+
+
+def test_cache_settings():
+    namespace = generated_caches()
+    cache = namespace["PingCache"](None, 1.5)
+
+    assert cache.start == 1.5
+    assert cache.get_timeout_delay() == 5.0
+    assert cache.on_timeout() is None
+    assert generated_caches(timeout=None)["PingCache"](None, 1.5).get_timeout_delay() == 10.0
+
+
+def test_cache_on_timeout(caplog):
+    cache = generated_caches(on_timeout="log")["PingCache"](None, 1.5)
+    with caplog.at_level(logging.WARNING):
+        cache.on_timeout()
+    assert caplog.messages == [f"PingCache:{cache.number} timed out after 5.0s"]
+
+    with pytest.raises(NotImplementedError):
+        generated_caches(on_timeout="implement")["PingCache"](None, 1.5).on_timeout()
+
+
+def test_bounded_request_cache():
+    namespace = generated_caches()
+    request_cache = namespace["BoundedRequestCache"]()
+    first, second, third = [namespace["PingCache"](request_cache, 0.0) for _ in range(3)]
+
+    assert request_cache.add(first) is first
+    assert request_cache.add(second) is second
+    assert request_cache.add(third) is None
+    assert len(request_cache.caches) == 2
+
+    # Both a retrieved and a timed out cache make room for another.
+    request_cache.pop(first.prefix, first.number)
+    assert request_cache.add(third) is third
+    request_cache._on_timeout(second)
+    assert request_cache.add(first) is first
+    assert set(request_cache.caches.values()) == {first, third}
+
+
+def test_instrumented_bounded_request_cache():
+    namespace = generated_caches(instrumented=True)
+    stats = namespace["CommunityStats"]({})
+    request_cache = namespace["InstrumentedRequestCache"](stats)
+    caches = [namespace["PingCache"](request_cache, 0.0) for _ in range(3)]
+    for cache in caches:
+        request_cache.add(cache)
+    request_cache.pop(caches[0].prefix, caches[0].number)
+    request_cache._on_timeout(caches[1])
+
+    # The refused cache is not counted, the timed out cache is not counted as popped.
+    assert stats.snapshot()["caches"] == {"PingCache": {"added": 2, "popped": 1, "timed_out": 1, "outstanding": 0}}
+
+
+@pytest.mark.parametrize("settings,valid", [({"timeout": 5.0, "max_outstanding": 0}, True),
+                                            ({"timeout": 0.0}, False),
+                                            ({"timeout": -1.0}, False),
+                                            ({"max_outstanding": -1}, False)])
+def test_lint_cache_settings(settings, valid):
+    errors = [diagnostic for diagnostic in lint_node(GraphNode("Cache", "PingCache", settings))
+              if diagnostic.severity == ERROR]
+    assert (errors == []) == valid
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from conftest import link
+from estimator import estimate, run
+from graph import GraphNode, project_data
+
+
+def test_design(design):
+    report = estimate(design, 50)
+    messages = report["messages"]
+
+    assert report["neighbours"] == 49
+    # Three random peers per second, which all respond.
+    assert messages["Ping"]["sent_per_s"] == messages["Pong"]["handled_per_s"] == 3.0
+    # Announce goes to all peers every 2 seconds, but is serialized once per run.
+    assert messages["Announce"]["sent_per_s"] == 24.5
+    assert messages["Announce"]["serialized_per_s"] == 0.5
+    assert report["caches"]["PingCache"]["timeouts_per_s"] == 0.0
+    assert report["warnings"] == ["the traffic of Announce grows as O(N^2): it is sent to all peers, or in response "
+                                  "to a message that is"]
+    assert len(report["notes"]) == 1 and "Query" in report["notes"][0]
+
+
+def test_rate_limited(design):
+    design[12].peer_rate = 0.0
+    design[12].global_rate = 1.0
+    messages = estimate(design, 50)["messages"]
+
+    assert messages["Ping"]["handled_per_s"] == 1.0
+    assert messages["Ping"]["dropped_per_s"] == 2.0
+    assert messages["Pong"]["sent_per_s"] == 1.0
+
+
+def chain(*titles):
+    """
+    A task that sends the first message to one random peer, which every other message responds to in turn.
+    """
+    task = GraphNode("PeriodicTask", "PeriodicTask", {"interval": 1.0})
+    selector = GraphNode("RandomPeer", "RandomPeer")
+    messages = [GraphNode("Message", title) for title in titles]
+    link(task, "on_timer_fire", selector, "select")
+    link(selector, "message", messages[0], "received_by")
+    for request, response in zip(messages, messages[1:]):
+        link(request, "response", response, "received_by")
+    return [task, selector] + messages
+
+
+def test_cache_retrieved_by_the_wrong_peer():
+    nodes = chain("Request", "Response", "Confirmation")
+    cache = GraphNode("Cache", "ConfirmationCache")
+    link(nodes[2], "create_cache", cache, "belongs_to")
+    link(cache, "received_by", nodes[4], "retrieve_cache")
+    report = estimate(nodes + [cache], 10)
+
+    # The confirmation goes to the peer that sent the response, not to the one that sent the request.
+    assert report["messages"]["Confirmation"]["handled_per_s"] == 0.0
+    assert report["caches"]["ConfirmationCache"]["timeouts_per_s"] == 1.0
+    assert any("Confirmation is not sent back" in warning for warning in report["warnings"])
+
+
+def test_response_loop_is_null_in_json(tmp_path):
+    nodes = chain("Ping", "Pong")
+    link(nodes[3], "response", nodes[2], "received_by")
+    project_path = tmp_path / "loop.json"
+    project_path.write_text(json.dumps(project_data({"loop": nodes})))
+    json_path = tmp_path / "estimate.json"
+
+    assert run([str(project_path), "-n", "10", "--json", str(json_path)]) == 0
+    # Strict JSON, without Infinity.
+    report = json.loads(json_path.read_text(), parse_constant=pytest.fail)[str(project_path)]["loop"]
+    assert report["messages"]["Ping"]["sent_per_s"] is None
+    assert any("grows without bound" in warning for warning in report["warnings"])
+
+
+def test_scripts_are_estimated_separately(design, tmp_path, capsys):
+    project_path = tmp_path / "project.json"
+    project_path.write_text(json.dumps(project_data({"design": design, "ping": chain("Ping", "Pong")})))
+    json_path = tmp_path / "estimate.json"
+
+    assert run([str(project_path), "-n", "10", "--json", str(json_path)]) == 0
+    reports = json.loads(json_path.read_text())[str(project_path)]
+    assert list(reports) == ["design", "ping"]
+    # Both scripts have a Ping, which is neither renamed nor merged with the other.
+    assert list(reports["ping"]["messages"]) == ["Ping", "Pong"]
+    assert reports["ping"]["messages"]["Ping"]["sent_per_s"] == 1.0
+    assert reports["design"]["messages"]["Ping"]["sent_per_s"] == 3.0
+    assert f"{project_path}: ping" in capsys.readouterr().out
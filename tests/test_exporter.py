@@ -0,0 +1,73 @@
+import os
+
+from exporter import BlockCache, Exporter
+from graph import touch
+
+
+def read(file_path):
+    with open(file_path) as fp:
+        return fp.read()
+
+
+def full_export(nodes, file_path, **options):
+    Exporter(nodes, **options).export(file_path)
+    return read(file_path)
+
+
+def test_incremental_export_unchanged(design, tmp_path):
+    output_path = str(tmp_path / "community.py")
+    block_cache = BlockCache()
+    assert Exporter(design, block_cache).export(output_path)
+    mtime = os.stat(output_path).st_mtime_ns
+    hits, misses = block_cache.hits, block_cache.misses
+
+    # An unchanged graph is not generated again (which would reset the counters of the cache), let alone written.
+    assert not Exporter(design, block_cache).export(output_path)
+    assert (block_cache.hits, block_cache.misses) == (hits, misses)
+    assert os.stat(output_path).st_mtime_ns == mtime
+    assert os.listdir(str(tmp_path)) == ["community.py"]
+    assert read(output_path) == full_export(design, str(tmp_path / "full.py"))
+
+
+def test_incremental_export_touched_without_changes(design, tmp_path):
+    output_path = str(tmp_path / "community.py")
+    block_cache = BlockCache()
+    Exporter(design, block_cache).export(output_path)
+    mtime = os.stat(output_path).st_mtime_ns
+
+    # Only the blocks of the touched node are generated again, the output is the same, so the file is not written.
+    touch(design[0])
+    assert not Exporter(design, block_cache).export(output_path)
+    assert block_cache.misses > 0 and block_cache.hits > 0
+    assert os.stat(output_path).st_mtime_ns == mtime
+    assert os.listdir(str(tmp_path)) == ["community.py"]
+
+
+def test_incremental_export_changed(design, tmp_path):
+    output_path = str(tmp_path / "community.py")
+    block_cache = BlockCache()
+    Exporter(design, block_cache).export(output_path)
+
+    design[0].custom_fields_dict["extra"] = "bool"
+    touch(design[0])
+    assert Exporter(design, block_cache).export(output_path)
+    assert read(output_path) == full_export(design, str(tmp_path / "full.py"))
+
+    assert Exporter(design, block_cache, instrument=True).export(output_path)
+    assert read(output_path) == full_export(design, str(tmp_path / "full.py"), instrument=True)
+
+
+def test_incremental_export_file_changed(design, tmp_path):
+    output_path = str(tmp_path / "community.py")
+    block_cache = BlockCache()
+    Exporter(design, block_cache).export(output_path)
+    expected = read(output_path)
+
+    with open(output_path, "a") as fp:
+        fp.write("# Edited by hand\n")
+    assert Exporter(design, block_cache).export(output_path)
+    assert read(output_path) == expected
+
+    os.remove(output_path)
+    assert Exporter(design, block_cache).export(output_path)
+    assert read(output_path) == expected
@@ -0,0 +1,38 @@
+from graph import FlowBuilder, dump_flow, flow_batches, load_flow, script_settings
+
+
+def test_flow_batches(design):
+    flow_data = dump_flow(design)
+    batches = list(flow_batches(flow_data, 4))
+
+    kinds = [kind for kind, _ in batches]
+    assert kinds == sorted(kinds, key=["nodes", "connections"].index)
+    assert all(0 < len(batch) <= 4 for _, batch in batches)
+    assert [item for kind, batch in batches if kind == "nodes" for item in batch] == flow_data["nodes"]
+    assert [item for kind, batch in batches if kind == "connections" for item in batch] == flow_data["connections"]
+
+
+def test_flow_batches_load_the_flow(design):
+    flow_data = dump_flow(design)
+    builder = FlowBuilder()
+    for kind, batch in flow_batches(flow_data, 3):
+        add = builder.add_node if kind == "nodes" else builder.add_connection
+        for item in batch:
+            add(item)
+
+    assert dump_flow(builder.nodes) == dump_flow(load_flow(flow_data)) == flow_data
+
+
+def test_flow_batches_without_connections():
+    assert list(flow_batches({"nodes": []}, 50)) == []
+
+
+def test_script_settings(design):
+    script_data = {"title": "workspace", "variables": {"peers": 10},
+                   "flow": dict(dump_flow(design), **{"algorithm mode": "exec"})}
+    settings = script_settings(script_data)
+
+    assert settings == {"title": "workspace", "variables": {"peers": 10},
+                        "flow": {"algorithm mode": "exec", "nodes": [], "connections": []}}
+    # The project itself still has the nodes and connections that are added in batches.
+    assert len(script_data["flow"]["nodes"]) == len(design)
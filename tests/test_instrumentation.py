@@ -0,0 +1,76 @@
+from collections import defaultdict
+from functools import wraps
+from time import perf_counter
+
+import pytest
+
+from conftest import FakePeer, generated_class, payload_class
+from exporter import (PAYLOAD_STYLES, TIMER_MODES, Exporter, produce_instrumentation_block,
+                      produce_selector_block, produce_stats_methods_block)
+from load_test import export_load_test
+
+PEERS = [FakePeer(("1.2.3.4", i)) for i in range(5)]
+
+
+def instrumented_community(serialize_once):
+    namespace = {"defaultdict": defaultdict, "wraps": wraps, "perf_counter": perf_counter,
+                 "Ping": payload_class("Ping", 1), "Pong": payload_class("Pong", 2)}
+    exec("".join(produce_instrumentation_block(False)), namespace)
+    community = generated_class(list(produce_stats_methods_block())
+                                + list(produce_selector_block(0, ["Ping", "Pong"], True, serialize_once=serialize_once,
+                                                              instrumented=True)),
+                                namespace=namespace)(PEERS)
+    community.stats = namespace["CommunityStats"]({1: "Ping", 2: "Pong"})
+    return community
+
+
+@pytest.mark.parametrize("serialize_once", [False, True])
+def test_bytes_out_per_send(serialize_once):
+    community = instrumented_community(serialize_once)
+    community.selector_0()
+    snapshot = community.stats_snapshot()
+
+    # Every packet that is sent is counted, also when it was serialized once for all peers.
+    assert len(community.sent) == 2 * len(PEERS)
+    assert snapshot["bytes_out"] == {"Ping": len(PEERS), "Pong": len(PEERS)}
+    assert snapshot["calls"] == {"selector_0": 1}
+    assert snapshot["errors"] == {}
+
+
+def test_selector_errors():
+    community = instrumented_community(False)
+    community.peers.append(None)
+    with pytest.raises(AttributeError):
+        community.selector_0()
+    snapshot = community.stats_snapshot()
+
+    assert snapshot["calls"] == {"selector_0": 1}
+    assert snapshot["errors"] == {"selector_0": 1}
+    assert sum(snapshot["latency_histograms_us"]["selector_0"]) == 1
+
+
+@pytest.mark.parametrize("timer_mode", TIMER_MODES)
+@pytest.mark.parametrize("payload_style", PAYLOAD_STYLES)
+@pytest.mark.parametrize("instrument", [False, True])
+@pytest.mark.parametrize("interval_jitter", [0.0, 0.2])
+def test_generated_module_compiles(design, tmp_path, timer_mode, payload_style, instrument, interval_jitter):
+    output_path = str(tmp_path / "community.py")
+    exporter = Exporter(design, timer_mode=timer_mode, payload_style=payload_style, instrument=instrument,
+                        start_jitter=0.5, interval_jitter=interval_jitter)
+
+    assert exporter.export(output_path)
+    with open(output_path) as fp:
+        compile(fp.read(), output_path, "exec")
+
+    load_test_path = str(tmp_path / "community_load_test.py")
+    export_load_test(exporter, load_test_path, "community")
+    with open(load_test_path) as fp:
+        compile(fp.read(), load_test_path, "exec")
+
+
+@pytest.mark.parametrize("instrument", [False, True])
+def test_empty_design_compiles(tmp_path, instrument):
+    output_path = str(tmp_path / "community.py")
+    Exporter([], instrument=instrument).export(output_path)
+    with open(output_path) as fp:
+        compile(fp.read(), output_path, "exec")
@@ -0,0 +1,81 @@
+import pytest
+
+from conftest import FakeCommunity, payload_class
+from exporter import Exporter
+from load_test import export_load_test
+
+PREFIX = b"\x00" * 22
+ADDRESS = ("1.2.3.4", 5)
+
+
+class FakeOverlay:
+
+    def __init__(self):
+        self._prefix = PREFIX
+        self.endpoint = FakeCommunity()
+        self.handled = []
+        self.decode_map = {msg_id: self.handle for msg_id in range(5)}
+
+    def handle(self, source_address, data):
+        if data[len(PREFIX)] == 2:
+            raise ValueError("announce")
+        self.handled.append(data)
+
+    def selector_0(self):
+        raise KeyError("selector")
+
+
+@pytest.fixture
+def load_test(design, tmp_path):
+    """
+    The namespace of the generated load test, without IPv8 and the community, of which it gets stand-ins instead.
+    """
+    file_path = tmp_path / "community_load_test.py"
+    export_load_test(Exporter(design), str(file_path), "community")
+    code = "\n".join(line for line in file_path.read_text().splitlines()
+                     if not line.startswith(("from ipv8.", "from community ")))
+    namespace = {name: payload_class(name, msg_id)
+                 for msg_id, name in enumerate(["Ping", "Pong", "Announce", "Query", "Answer"])}
+    namespace.update(MyCommunity=FakeCommunity, PingCache=type("PingCache", (), {"name": "PingCache"}),
+                     __name__="community_load_test")
+    exec(code, namespace)
+    return namespace
+
+
+def test_responses(load_test):
+    assert load_test["RESPONSE_TO"] == {1: [0], 4: [3]}
+    assert load_test["REQUEST_IDS"] == {0, 3}
+    assert load_test["SELECTORS"] == ["selector_0", "selector_1", "selector_2"]
+
+
+def test_monitor(load_test, capsys):
+    overlay = FakeOverlay()
+    monitor = load_test["LoadTestMonitor"]()
+    monitor.instrument(overlay)
+
+    overlay.endpoint.send(ADDRESS, PREFIX + b"\x00ping")
+    overlay.endpoint.send(ADDRESS, PREFIX)
+    overlay.decode_map[1](ADDRESS, PREFIX + b"\x01pong")
+    with pytest.raises(ValueError):
+        overlay.decode_map[2](ADDRESS, PREFIX + b"\x02")
+    monitor.call_selector(overlay, "selector_0")
+    overlay.request_cache = type("RequestCache", (), {"_identifiers": {"PingCache:1": None, "PingCache:2": None}})
+    monitor.sample_caches([overlay])
+    report = monitor.report(1)
+
+    # Every packet is sent, also the one that is too short to carry a message id, which is not counted.
+    assert overlay.endpoint.sent == [(ADDRESS, PREFIX + b"\x00ping"), (ADDRESS, PREFIX)]
+    assert overlay.handled == [PREFIX + b"\x01pong"]
+    messages = report["messages"]
+    assert messages["Ping"]["sent_per_s"] > 0 and messages["Ping"]["bytes_out_per_s"] > 0
+    assert messages["Pong"]["round_trips"] == 1 and messages["Pong"]["received_per_s"] > 0
+    assert messages["Announce"]["handler_errors"] == 1
+    assert report["selector_errors"] == {"selector_0": 1}
+    assert report["last_errors"] == {"handler of Announce": "ValueError('announce')",
+                                     "selector_0": "KeyError('selector')"}
+    assert report["caches"] == {"PingCache": {"mean_outstanding": 2, "max_outstanding": 2}}
+
+    load_test["print_report"](report)
+    output = capsys.readouterr().out
+    assert "selector_0" in output and "failed 1 times" in output
+    assert "last error of handler of Announce: ValueError('announce')" in output
@@ -0,0 +1,99 @@
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import FakeCommunity, FakePeer, generated_class, link, payload_class
+from exporter import Exporter, produce_memoizer_block, produce_message_handler_block
+from graph import GraphNode
+from validator import ERROR, lint_node
+
+PEER = FakePeer(("1.2.3.4", 5))
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def memoizer_module():
+    namespace = {"OrderedDict": OrderedDict, "monotonic": Clock()}
+    exec("".join(produce_memoizer_block()), namespace)
+    return namespace
+
+
+def test_get_and_put(memoizer_module):
+    memoizer = memoizer_module["ResponseMemoizer"](2, 10.0)
+    assert memoizer.get("a") is None
+    memoizer.put("a", b"A")
+
+    assert memoizer.get("a") == b"A"
+    assert memoizer.snapshot() == {"entries": 1, "hits": 1, "misses": 1, "hit_rate": 0.5, "evictions": 0,
+                                   "expirations": 0}
+
+
+def test_ttl(memoizer_module):
+    memoizer = memoizer_module["ResponseMemoizer"](2, 10.0)
+    memoizer.put("a", b"A")
+    memoizer_module["monotonic"].now = 10.0
+
+    assert memoizer.get("a") is None
+    assert (memoizer.expirations, len(memoizer.entries)) == (1, 0)
+
+
+def test_least_recently_used_is_evicted(memoizer_module):
+    memoizer = memoizer_module["ResponseMemoizer"](2, 10.0)
+    memoizer.put("a", b"A")
+    memoizer.put("b", b"B")
+    memoizer.get("a")
+    memoizer.put("c", b"C")
+
+    assert list(memoizer.entries) == ["a", "c"]
+    assert memoizer.evictions == 1
+
+
+def test_handler(memoizer_module):
+    namespace = {"lazy_wrapper": lambda payload_class: lambda func: func,
+                 "Query": payload_class("Query", 3), "Answer": payload_class("Answer", 4)}
+    community = generated_class(produce_message_handler_block("Query", response="Answer", memoizer=0,
+                                                              memo_fields=[["key", False], ["keys", True]]),
+                                FakeCommunity, namespace)()
+    community.memoizer_0 = memoizer_module["ResponseMemoizer"](8, 10.0)
+    community.memoizer_0.put((3, "key", ("a", "b")), b"answer")
+
+    # The list field is part of the key as a tuple, so the same values hit the memoized response.
+    community.on_query(PEER, SimpleNamespace(key="key", keys=["a", "b"]))
+    assert community.sent == [(PEER.address, b"answer")]
+
+    # Other values are handled, which the stub of the generated handler leaves to be filled in.
+    with pytest.raises(NotImplementedError):
+        community.on_query(PEER, SimpleNamespace(key="key", keys=["a"]))
+    assert (community.memoizer_0.hits, community.memoizer_0.misses) == (1, 1)
+
+
+def memoized_query(field_type):
+    query = GraphNode("Message", "Query", {"custom_fields_dict": {"key": field_type}})
+    answer = GraphNode("Message", "Answer")
+    memoizer = GraphNode("Memoizer", "Memoizer")
+    link(query, "response", answer, "received_by")
+    link(memoizer, "memoizes", query, "memoize")
+    return [query, answer, memoizer]
+
+
+def test_object_fields_are_not_memoized():
+    nodes = memoized_query("str")
+    exporter = Exporter(nodes)
+    assert exporter.memoizer_id(nodes[0]) == 0
+    assert not [diagnostic for diagnostic in lint_node(nodes[0]) if diagnostic[0] == ERROR]
+
+    # A list or dictionary in an object field cannot be part of the key of the memoizer.
+    nodes = memoized_query("object")
+    exporter = Exporter(nodes)
+    assert exporter.memoizer_id(nodes[0]) is None
+    assert exporter.memoizer_ids == {}
+    assert [diagnostic for diagnostic in lint_node(nodes[0]) if diagnostic[0] == ERROR]
@@ -0,0 +1,91 @@
+from asyncio import ensure_future, gather, get_running_loop, run
+from concurrent.futures import ThreadPoolExecutor
+from threading import current_thread
+
+import pytest
+
+from conftest import FakeCommunity, FakePeer, generated_class, payload_class
+from exporter import produce_init_block, produce_message_handler_block, produce_offload_methods_block
+
+PEER = FakePeer(("1.2.3.4", 5))
+
+
+class OffloadCommunity(FakeCommunity):
+
+    def __init__(self, my_peer, endpoint, network):
+        super().__init__()
+        self.tasks = []
+        self.unloaded = False
+
+    def register_anonymous_task(self, name, task, *args):
+        self.tasks.append(ensure_future(task(*args)))
+
+    async def unload(self):
+        self.unloaded = True
+
+
+def offload_community(max_offloaded, work):
+    namespace = {"ThreadPoolExecutor": ThreadPoolExecutor, "get_running_loop": get_running_loop,
+                 "lazy_wrapper": lambda payload_class: lambda func: func,
+                 "Ping": payload_class("Ping", 1), "Pong": payload_class("Pong", 2)}
+    community_class = generated_class(list(produce_init_block([], [], executors=["thread"], offload_workers=2))
+                                      + list(produce_offload_methods_block(max_offloaded))
+                                      + list(produce_message_handler_block("Ping", response="Pong", offload="thread")),
+                                      OffloadCommunity, namespace)
+    return type("Implemented", (community_class,), {"on_ping_work": staticmethod(work)})(None, None, None)
+
+
+def test_offloaded_handler():
+    threads = []
+
+    def work(message):
+        threads.append(current_thread())
+        return message
+
+    async def handle():
+        community = offload_community(8, work)
+        community.on_ping(PEER, "ping")
+        # The handler returns before the work is done, which is then run on the thread pool.
+        assert community.offloaded == 1 and community.sent == []
+        await gather(*community.tasks)
+        await community.unload()
+        return community
+
+    community = run(handle())
+    assert threads and threads[0] is not current_thread()
+    assert community.offloaded == 0
+    # The response is sent back on the event loop.
+    assert community.sent == [(PEER.address, b"\x02")]
+    assert community.unloaded and community.thread_executor._shutdown
+
+
+def test_offload_drops_when_full():
+    async def handle():
+        community = offload_community(2, lambda message: message)
+        for _ in range(3):
+            community.on_ping(PEER, "ping")
+        assert community.offloaded == 2
+        await gather(*community.tasks)
+        return community
+
+    community = run(handle())
+    assert len(community.tasks) == 2
+    assert community.sent == [(PEER.address, b"\x02")] * 2
+    assert community.offloaded == 0
+
+
+def test_failing_work():
+    def work(message):
+        raise ValueError(message)
+
+    async def handle():
+        community = offload_community(2, work)
+        community.on_ping(PEER, "ping")
+        with pytest.raises(ValueError):
+            await gather(*community.tasks)
+        return community
+
+    community = run(handle())
+    # A failing handler sends nothing and does not take the place of another message.
+    assert community.sent == []
+    assert community.offloaded == 0
@@ -0,0 +1,65 @@
+import sys
+
+from exporter import Exporter, produce_compiled_message_block, produce_message_block
+
+
+def compiled_class(field_formats, has_cache=False):
+    namespace = {}
+    exec("".join(produce_compiled_message_block(7, "Pong", field_formats, has_cache)), namespace)
+    return namespace["Pong"]
+
+
+def test_compiled_payload_round_trip():
+    pong_class = compiled_class({"sequence": "I", "name": "varlenHutf8"}, has_cache=True)
+    pong = pong_class(1, "pong", 42)
+
+    assert pong_class.msg_id == 7
+    assert pong_class.format_list == ["I", "varlenHutf8", "I"]
+    assert pong_class.names == ["sequence", "name", "identifier"]
+    # What IPv8's serializer packs, given the format of every value, and unpacks into the arguments of the class.
+    assert pong.to_pack_list() == [("I", 1), ("varlenHutf8", "pong"), ("I", 42)]
+    copy = pong_class.from_unpack_list(*[value for _, value in pong.to_pack_list()])
+    assert (copy.sequence, copy.name, copy.identifier) == (1, "pong", 42)
+
+
+def test_compiled_payload_has_no_dict():
+    pong_class = compiled_class({"sequence": "I", "name": "varlenHutf8"})
+    pong = pong_class(1, "pong")
+
+    assert not hasattr(pong, "__dict__")
+    plain = type("Plain", (), {})()
+    plain.sequence, plain.name = 1, "pong"
+    assert sys.getsizeof(pong) < sys.getsizeof(plain) + sys.getsizeof(plain.__dict__)
+
+
+def test_compiled_payload_without_fields():
+    empty_class = compiled_class({})
+
+    assert empty_class().to_pack_list() == []
+    assert isinstance(empty_class.from_unpack_list(), empty_class)
+
+
+def test_compiled_payload_fallback(design):
+    exporter = Exporter(design, payload_style="compiled")
+    ping, pong, announce, query, answer = exporter.message_nodes
+
+    assert exporter.field_formats(pong) == {"sequence": "I", "name": "varlenHutf8"}
+    assert exporter.field_formats(announce) == {"blob": "varlenH"}
+    # Lists, ``object`` and fields that the payload class uses itself have no place in a compiled payload.
+    assert exporter.field_formats(ping) is None
+    assert exporter.field_formats(answer) is None
+    pong.custom_fields_dict["names"] = "str"
+    assert exporter.field_formats(pong) is None
+    assert Exporter(design).field_formats(announce) is None
+
+
+def test_compiled_payload_module(design, tmp_path):
+    output_path = str(tmp_path / "community.py")
+    Exporter(design, payload_style="compiled").export(output_path)
+    with open(output_path) as fp:
+        code = fp.read()
+
+    assert "".join(produce_compiled_message_block(1, "Pong", {"sequence": "I", "name": "varlenHutf8"}, True)) in code
+    assert "".join(produce_message_block(0, "Ping", {"sequence": "int", "text": "str", "ports": "List[UInt16]"},
+                                         True)) in code
+    assert "VariablePayload" not in code
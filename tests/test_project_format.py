@@ -0,0 +1,68 @@
+import gzip
+import json
+
+import pytest
+
+from benchmark import build_synthetic_graph
+from exporter import Exporter
+from graph import dump_flow, load_scripts, project_data
+from project_format import is_compact, load_compact_scripts, load_nodes, read_compact, read_project, write_compact
+
+
+@pytest.fixture
+def project(design):
+    project = project_data({"design": design, "synthetic": build_synthetic_graph(40, 10, 6, 2)})
+    # Node data that Ryven stores besides the identifier, title and additional data, which differs between nodes of a
+    # type and is missing from some of them.
+    for i, node_data in enumerate(project["scripts"][0]["flow"]["nodes"]):
+        node_data["pos x"] = 10.0 * i
+        node_data["pos y"] = 0.0
+        if i % 3:
+            node_data["special actions"] = {}
+    project["scripts"][0]["flow"]["connections"][0]["GID"] = 7
+    project["scripts"][0]["flow"]["algorithm mode"] = "data"
+    project["scripts"][1]["variables"] = {"x": 1}
+    project["general info"] = {"type": "Ryven project file"}
+    return project
+
+
+def test_round_trip(project, tmp_path):
+    compact_path = str(tmp_path / "project.ipv8z")
+    write_compact(project, compact_path)
+
+    assert is_compact(compact_path)
+    assert read_compact(compact_path) == project
+
+
+def test_round_trip_exports_the_same(project, tmp_path):
+    json_path = str(tmp_path / "project.json")
+    compact_path = str(tmp_path / "project.ipv8z")
+    with open(json_path, "w") as fp:
+        json.dump(project, fp)
+    write_compact(read_project(json_path), compact_path)
+
+    assert not is_compact(json_path)
+    assert read_project(compact_path) == read_project(json_path)
+    Exporter(load_nodes(json_path)).export(str(tmp_path / "from_json.py"))
+    Exporter(load_nodes(compact_path)).export(str(tmp_path / "from_compact.py"))
+    with open(str(tmp_path / "from_json.py")) as json_fp, open(str(tmp_path / "from_compact.py")) as compact_fp:
+        assert json_fp.read() == compact_fp.read()
+
+
+def test_load_compact_scripts(project, tmp_path):
+    compact_path = str(tmp_path / "project.ipv8z")
+    write_compact(project, compact_path)
+    scripts = load_compact_scripts(compact_path)
+
+    assert list(scripts) == ["design", "synthetic"]
+    assert ({title: dump_flow(nodes) for title, nodes in scripts.items()}
+            == {title: dump_flow(nodes) for title, nodes in load_scripts(project).items()})
+
+
+def test_newer_version_is_refused(tmp_path):
+    compact_path = str(tmp_path / "project.ipv8z")
+    with gzip.open(compact_path, "wt", encoding="utf-8") as fp:
+        fp.write(json.dumps({"format": "ipv8-project", "version": 2, "x": {}}) + "\n")
+
+    with pytest.raises(RuntimeError):
+        read_compact(compact_path)
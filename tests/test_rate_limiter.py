@@ -0,0 +1,145 @@
+from collections import OrderedDict
+from functools import wraps
+
+import pytest
+
+from conftest import FakePeer, build_design
+from exporter import produce_rate_limiter_block
+from validator import ERROR, lint_node
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeLoop:
+
+    def __init__(self):
+        self.scheduled = []
+
+    def call_later(self, delay, callback, *args):
+        self.scheduled.append((delay, callback, args))
+
+    def run_scheduled(self):
+        scheduled, self.scheduled = self.scheduled, []
+        for _, callback, args in scheduled:
+            callback(*args)
+
+
+@pytest.fixture
+def limiter_module():
+    """
+    The namespace of the generated rate limiter, with a clock and an event loop that the tests control.
+    """
+    loop = FakeLoop()
+    namespace = {"OrderedDict": OrderedDict, "wraps": wraps, "monotonic": Clock(), "get_running_loop": lambda: loop}
+    exec("".join(produce_rate_limiter_block()), namespace)
+    namespace["loop"] = loop
+    return namespace
+
+
+def limiter(namespace, peer_rate=10.0, peer_burst=2.0, global_rate=0.0, global_burst=100.0, defer=False, max_peers=8,
+            max_deferred=4):
+    return namespace["TokenBucketLimiter"](peer_rate, peer_burst, global_rate, global_burst, defer, max_peers,
+                                           max_deferred)
+
+
+def test_peer_bucket(limiter_module):
+    bucket_limiter = limiter(limiter_module)
+    handled = []
+
+    for _ in range(3):
+        bucket_limiter.submit("a", handled.append, "a")
+    bucket_limiter.submit("b", handled.append, "b")
+
+    # The burst of a lets two messages through, the bucket of b is separate.
+    assert handled == ["a", "a", "b"]
+    assert bucket_limiter.dropped == 1
+
+    limiter_module["monotonic"].now = 0.1
+    bucket_limiter.submit("a", handled.append, "a")
+    assert handled == ["a", "a", "b", "a"]
+
+
+def test_global_bucket(limiter_module):
+    bucket_limiter = limiter(limiter_module, peer_rate=0.0, global_rate=1.0, global_burst=2.0)
+    handled = []
+
+    for address in "abc":
+        bucket_limiter.submit(address, handled.append, address)
+
+    assert handled == ["a", "b"]
+    assert bucket_limiter.peers == {}
+    assert bucket_limiter.acquire("d") == pytest.approx(1.0)
+
+
+def test_defer(limiter_module):
+    bucket_limiter = limiter(limiter_module, peer_burst=1.0, defer=True, max_deferred=2)
+    handled = []
+
+    for i in range(4):
+        bucket_limiter.submit("a", handled.append, i)
+
+    # One message passes, two wait for a token and the last one finds no room to wait.
+    assert handled == [0]
+    assert [delay for delay, _, _ in limiter_module["loop"].scheduled] == [pytest.approx(0.1)] * 2
+    assert (bucket_limiter.deferred, bucket_limiter.dropped) == (2, 1)
+
+    limiter_module["monotonic"].now = 0.1
+    limiter_module["loop"].run_scheduled()
+    assert handled == [0, 1]
+    assert bucket_limiter.deferred == 1
+
+    limiter_module["monotonic"].now = 0.2
+    limiter_module["loop"].run_scheduled()
+    assert handled == [0, 1, 2]
+    assert bucket_limiter.deferred == 0
+
+
+def test_max_peers(limiter_module):
+    bucket_limiter = limiter(limiter_module, peer_burst=1.0, max_peers=2)
+
+    for address in "abac":
+        bucket_limiter.acquire(address)
+
+    # a was seen more recently than b, so the bucket of b makes room for c.
+    assert list(bucket_limiter.peers) == ["a", "c"]
+    # A peer whose bucket was forgotten starts with a full burst again.
+    assert bucket_limiter.acquire("b") == 0.0
+
+
+def test_rate_limited(limiter_module):
+    class Community:
+        def __init__(self):
+            self.rate_limiter_0 = limiter(limiter_module, peer_burst=1.0)
+            self.handled = []
+
+        @limiter_module["rate_limited"]("rate_limiter_0")
+        def on_ping(self, source_address, data):
+            self.handled.append((source_address, data))
+
+    community = Community()
+    peer = FakePeer(("1.2.3.4", 5))
+    community.on_ping(peer.address, b"1")
+    community.on_ping(peer.address, b"2")
+
+    assert community.handled == [(peer.address, b"1")]
+    assert community.on_ping.__name__ == "on_ping"
+
+
+@pytest.mark.parametrize("limits", [{"max_peers": 0}, {"peer_burst": 0.5}, {"global_burst": 0.0},
+                                    {"peer_rate": -1.0}, {"peer_rate": 0.0, "global_rate": 0.0},
+                                    {"max_deferred": -1}])
+def test_lint_rate_limiter(limits):
+    design = build_design()
+    rate_limiter = design[12]
+    assert not [issue for issue in lint_node(rate_limiter) if issue[0] == ERROR]
+
+    for option, value in limits.items():
+        setattr(rate_limiter, option, value)
+    assert [issue for issue in lint_node(rate_limiter) if issue[0] == ERROR]
@@ -0,0 +1,121 @@
+from random import sample, seed
+
+from conftest import FakeCommunity, FakePeer, generated_class, payload_class
+from exporter import produce_init_block, produce_peer_sampling_block, produce_selector_block
+
+PEERS = [FakePeer(("1.2.3.4", i)) for i in range(5)]
+MESSAGES = {"Ping": payload_class("Ping", 1), "Pong": payload_class("Pong", 2)}
+
+
+def test_all_peers_serialize_once():
+    community = generated_class(produce_selector_block(0, ["Ping", "Pong"], True, serialize_once=True),
+                                namespace=MESSAGES)(PEERS)
+    community.selector_0()
+
+    assert community.packed == [1, 2]
+    assert community.sent == [(peer.address, bytes((msg_id,))) for peer in PEERS for msg_id in (1, 2)]
+
+
+def test_all_peers_serialize_per_peer():
+    community = generated_class(produce_selector_block(0, ["Ping", "Pong"], True), namespace=MESSAGES)(PEERS)
+    community.selector_0()
+
+    assert community.packed == [1, 2] * len(PEERS)
+    assert community.sent == [(peer.address, bytes((msg_id,))) for peer in PEERS for msg_id in (1, 2)]
+
+
+def test_all_peers_serialize_once_aggregated():
+    class Aggregator:
+        def __init__(self):
+            self.sent = []
+
+        def send_packet(self, address, packet):
+            self.sent.append((address, packet))
+
+    community = generated_class(produce_selector_block(0, ["Ping", "Pong"], True, serialize_once=True,
+                                                       aggregators=[None, 0]), namespace=MESSAGES)(PEERS)
+    community.aggregator_0 = Aggregator()
+    community.selector_0()
+
+    assert community.packed == [1, 2]
+    assert community.sent == [(peer.address, b"\x01") for peer in PEERS]
+    assert community.aggregator_0.sent == [(peer.address, b"\x02") for peer in PEERS]
+
+
+def test_no_peers():
+    community = generated_class(produce_selector_block(0, ["Ping"], True, serialize_once=True),
+                                namespace=MESSAGES)()
+    community.selector_0()
+
+    assert community.sent == []
+
+
+class FakeNetwork:
+
+    def __init__(self, peers):
+        self.verified_peers = set(peers)
+
+
+class SamplingCommunity(FakeCommunity):
+
+    def __init__(self, my_peer, endpoint, network):
+        super().__init__()
+        self.network = network
+        self.copies = 0
+
+    def get_peers(self):
+        self.copies += 1
+        return list(self.network.verified_peers)
+
+
+def sampling_community(peers):
+    community_class = generated_class(list(produce_init_block([], [], has_random_selector=True))
+                                      + list(produce_peer_sampling_block())
+                                      + list(produce_selector_block(0, ["Ping"], False, fan_out=3)),
+                                      SamplingCommunity, dict(MESSAGES, sample=sample))
+    return community_class(None, None, FakeNetwork(peers))
+
+
+def test_random_peer_fan_out():
+    seed(0)
+    community = sampling_community(PEERS)
+    for _ in range(100):
+        community.sent.clear()
+        community.selector_0()
+        addresses = [address for address, _ in community.sent]
+        assert len(addresses) == len(set(addresses)) == 3
+
+    # The peers are copied once, not on every tick.
+    assert community.copies == 1
+
+
+def test_random_peer_fan_out_above_peers():
+    community = sampling_community(PEERS[:2])
+    community.selector_0()
+
+    assert sorted(address for address, _ in community.sent) == [peer.address for peer in PEERS[:2]]
+
+
+def test_random_peer_pool_follows_network():
+    seed(0)
+    community = sampling_community(PEERS[:4])
+    community.selector_0()
+
+    # As many peers as before, but one of them left and another joined.
+    community.network.verified_peers.discard(PEERS[0])
+    community.network.verified_peers.add(PEERS[4])
+    sampled = set()
+    for _ in range(100):
+        community.sent.clear()
+        community.selector_0()
+        sampled.update(address for address, _ in community.sent)
+
+    assert sampled == {peer.address for peer in PEERS[1:]}
+    assert community.copies == 2
+
+
+def test_random_peer_no_peers():
+    community = sampling_community([])
+    community.selector_0()
+
+    assert community.sent == []
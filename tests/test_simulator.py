@@ -0,0 +1,71 @@
+import json
+
+from graph import project_data
+from simulator import build_plan, run, simulate, summarize
+
+
+def test_plan(design):
+    plan = build_plan(design)
+
+    assert plan["messages"] == ["Ping", "Pong", "Announce", "Query", "Answer"]
+    assert plan["responses"] == [1, None, None, 4, None]
+    assert plan["creates"] == [0, None, None, None, None]
+    assert plan["retrieves"] == [None, 0, None, None, None]
+    assert plan["limited_by"] == [0, None, None, None, None]
+    assert plan["limiters"] == [(10.0, 20.0, 0.0, 100.0, True, 256, 1024)]
+    assert [(interval, len(selectors)) for interval, selectors in plan["tasks"]] == [(1.0, 1), (2.0, 1), (4.0, 1)]
+
+
+def test_request_and_response(design):
+    summary = summarize(simulate(design, 20, duration=20.0), 5.0)
+    messages = summary["messages"]
+
+    # Every Pong comes back to the peer that sent the Ping and created the cache, long before it times out.
+    assert messages["Ping"]["handled_per_s"] > 0
+    assert messages["Pong"]["dropped_per_s"] == 0
+    assert abs(messages["Pong"]["handled_per_s"] - messages["Ping"]["handled_per_s"]) < 5
+    assert summary["caches"]["PingCache"]["timeouts_per_s"] == 0
+    assert summary["caches"]["PingCache"]["outstanding"] > 0
+
+
+def test_rate_limiter_drops(design):
+    limiter = design[12]
+    limiter.policy = "drop"
+    limiter.peer_rate = 0.0
+    limiter.global_rate = 1.0
+    limiter.global_burst = 1.0
+    summary = summarize(simulate(design, 20, duration=20.0), 5.0)
+    messages = summary["messages"]
+
+    # 20 peers handle about one Ping per second each, of the 3 that they receive.
+    assert 15 < messages["Ping"]["handled_per_s"] <= 21
+    assert messages["Ping"]["dropped_per_s"] > 30
+    assert messages["Pong"]["sent_per_s"] == messages["Ping"]["handled_per_s"]
+
+
+def test_cache_limit(design):
+    design[5].max_outstanding = 1
+    summary = summarize(simulate(design, 20, duration=20.0), 5.0)
+
+    assert summary["caches"]["PingCache"]["full_per_s"] > 0
+    assert summary["caches"]["PingCache"]["outstanding"] <= 20
+
+
+def test_shards(design):
+    report = simulate(design, 40, duration=10.0, shards=2, jobs=2)
+
+    assert report["peers"] == 40
+    assert sum(report["messages"]["Announce"]["sent_per_s"]) > 0
+
+
+def test_scripts_are_simulated_separately(design, tmp_path, capsys):
+    project_path = tmp_path / "project.json"
+    project_path.write_text(json.dumps(project_data({"design": design, "empty": []})))
+    json_path = tmp_path / "simulation.json"
+
+    assert run([str(project_path), "-n", "10", "-d", "5", "--shards", "1", "--json", str(json_path)]) == 0
+    reports = json.loads(json_path.read_text())
+    assert list(reports) == ["design", "empty"]
+    assert list(reports["design"]["summary"]["messages"]) == ["Ping", "Pong", "Announce", "Query", "Answer"]
+    assert reports["empty"]["messages"] == {}
+    assert f"{project_path}: empty" in capsys.readouterr().out
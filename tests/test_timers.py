@@ -0,0 +1,129 @@
+from asyncio import run
+from random import seed, uniform
+
+import pytest
+
+from conftest import FakeCommunity, generated_class
+from exporter import Exporter, coalesce_tasks, produce_init_block, produce_scheduler_block
+
+
+class Stop(Exception):
+    pass
+
+
+class TimerCommunity(FakeCommunity):
+
+    def __init__(self, my_peer=None, endpoint=None, network=None):
+        super().__init__()
+        self.tasks = []
+        self.calls = []
+        self.logged = []
+        self.logger = self
+
+    def register_anonymous_task(self, name, task, interval=None, delay=0):
+        self.tasks.append((name, task.__name__, interval, delay))
+
+    def exception(self, message):
+        self.logged.append(message)
+
+
+def run_scheduler(community, ticks):
+    sleeps = []
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == ticks:
+            raise Stop()
+
+    community.scheduler_0.__globals__["sleep"] = sleep
+    with pytest.raises(Stop):
+        run(community.scheduler_0())
+    return sleeps
+
+
+def scheduler_community(tasks, interval_jitter, failing=()):
+    def selector(task_id):
+        def select(self):
+            self.calls.append(task_id)
+            if task_id in failing:
+                raise ValueError(task_id)
+        return select
+
+    selectors = {f"selector_{task_id}": selector(task_id) for task_id, _ in tasks}
+    base = type("Selectors", (TimerCommunity,), selectors)
+    return generated_class(produce_scheduler_block(0, 0.5, tasks, interval_jitter), base, {"uniform": uniform})()
+
+
+def test_coalesce_tasks():
+    assert coalesce_tasks([(0, 1.0), (1, 2.0), (2, 3.0), (3, 0.7)]) == [(0.7, [(3, 1)]),
+                                                                        (1.0, [(0, 1), (1, 2), (2, 3)])]
+    # Merging 1s and 1.001s tasks would tick every millisecond: more wakeups than running them separately.
+    assert len(coalesce_tasks([(0, 1.0), (1, 1.001)])) == 2
+
+
+def test_scheduler_runs_tasks_every_n_ticks():
+    community = scheduler_community([(0, 1), (1, 2)], 0.0)
+    sleeps = run_scheduler(community, 4)
+
+    assert community.calls == [0, 1, 0, 0, 1, 0]
+    assert sleeps == [0.5] * 4
+
+
+def test_scheduler_interval_jitter():
+    seed(0)
+    community = scheduler_community([(0, 1)], 0.2)
+    sleeps = run_scheduler(community, 200)
+
+    assert all(0.4 <= seconds <= 0.6 for seconds in sleeps)
+    assert len(set(sleeps)) > 1
+
+
+def test_scheduler_logs_failing_selectors():
+    community = scheduler_community([(0, 1), (1, 1)], 0.0, failing={0})
+    run_scheduler(community, 3)
+
+    # A failing task neither stops the loop nor the other tasks of the scheduler.
+    assert community.calls == [0, 1] * 3
+    assert community.logged == ["selector_0 failed"] * 3
+
+
+def selector_0(self):
+    pass
+
+
+async def scheduler_0(self):
+    pass
+
+
+def test_start_jitter():
+    seed(0)
+    base = type("Tasks", (TimerCommunity,), {"selector_0": selector_0, "scheduler_0": scheduler_0})
+    community_class = generated_class(produce_init_block([], [(0, 1.0)], schedulers=[0], start_jitter=0.5), base,
+                                      {"uniform": uniform})
+    delays = set()
+    for _ in range(50):
+        community = community_class(None, None, None)
+        assert [task[:3] for task in community.tasks] == [("interval_task", "selector_0", 1.0),
+                                                          ("scheduler", "scheduler_0", None)]
+        delays.update(task[3] for task in community.tasks)
+
+    assert all(0 <= delay <= 0.5 for delay in delays)
+    assert len(delays) > 1
+
+
+@pytest.mark.parametrize("interval_jitter", [-0.1, 1.0, 2.5])
+def test_interval_jitter_out_of_range(design, interval_jitter):
+    with pytest.raises(RuntimeError):
+        Exporter(design, interval_jitter=interval_jitter)
+
+
+def test_jitter_turns_tasks_into_schedulers(design):
+    # A plain interval task cannot vary its interval, so with jitter every task runs in a scheduler loop.
+    plain_tasks, schedulers = Exporter(design).timer_plan()
+    assert len(plain_tasks) == 3 and schedulers == []
+
+    plain_tasks, schedulers = Exporter(design, interval_jitter=0.1).timer_plan()
+    assert plain_tasks == [] and len(schedulers) == 3
+
+    plain_tasks, schedulers = Exporter(design, timer_mode="coalesced").timer_plan()
+    assert plain_tasks == [] and schedulers == [(1.0, [(0, 1), (1, 2), (2, 4)])]
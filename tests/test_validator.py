@@ -0,0 +1,97 @@
+from collections import Counter
+from random import Random
+
+import pytest
+
+from conftest import link
+from graph import NODE_PORTS, GraphNode
+from validator import GraphLinter
+
+TITLES = ["Ping", "Pong", "FooBar", "Foo_bar", "Foo", "Foo_work", "Packet", "Batch", "Announce"]
+
+
+def summary(linter):
+    return Counter((id(diagnostic.node), diagnostic.severity, diagnostic.message)
+                   for diagnostic in linter.diagnostics())
+
+
+def assert_same_as_full_lint(linter, nodes, strict_names=False):
+    full = GraphLinter(nodes, strict_names=strict_names)
+    assert summary(linter) == summary(full)
+    assert linter.error_count == len(full.errors())
+
+
+def connections(nodes):
+    return [connection for node in nodes for port in node.outputs for connection in port.connections]
+
+
+def disconnect(connection):
+    connection.out.connections.remove(connection)
+    connection.inp.connections.remove(connection)
+
+
+def test_design_is_valid(design):
+    assert GraphLinter(design).error_count == 0
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_incremental_lint_matches_full_lint(design, seed):
+    rng = Random(seed)
+    nodes = list(design)
+    linter = GraphLinter(nodes)
+    assert_same_as_full_lint(linter, nodes)
+
+    for _ in range(300):
+        edit = rng.choice(["add", "remove", "connect", "disconnect", "rename", "option", "strict"])
+        if edit == "add":
+            title = rng.choice(list(NODE_PORTS))
+            node = GraphNode(title, rng.choice(TITLES) if title in ("Message", "Cache") else title)
+            nodes.append(node)
+            linter.node_added(node)
+        elif edit == "remove" and nodes:
+            node = rng.choice(nodes)
+            # Like Ryven, the connections of a node are removed before the node itself.
+            for port in node.inputs + node.outputs:
+                for connection in list(port.connections):
+                    disconnect(connection)
+                    linter.connection_changed(connection)
+            nodes.remove(node)
+            linter.node_removed(node)
+        elif edit == "connect":
+            outs = [(node, port) for node in nodes for port in node.outputs]
+            ins = [(node, port) for node in nodes for port in node.inputs]
+            if outs and ins:
+                out_node, out_port = rng.choice(outs)
+                in_node, in_port = rng.choice(ins)
+                linter.connection_changed(link(out_node, out_port.label_str, in_node, in_port.label_str))
+        elif edit == "disconnect" and connections(nodes):
+            connection = rng.choice(connections(nodes))
+            disconnect(connection)
+            linter.connection_changed(connection)
+        elif edit == "rename":
+            named = [node for node in nodes if node.title in ("Message", "Cache")]
+            if named:
+                node = rng.choice(named)
+                node.display_title = rng.choice(TITLES)
+                linter.node_changed(node)
+        elif edit == "option":
+            messages = [node for node in nodes if node.title == "Message"]
+            if messages:
+                node = rng.choice(messages)
+                node.offload = rng.choice(["inline", "thread"])
+                linter.node_changed(node)
+        elif edit == "strict":
+            linter.set_strict_names(not linter.strict_names)
+        assert_same_as_full_lint(linter, nodes, linter.strict_names)
+
+
+def test_handler_name_collisions():
+    foo_bar = GraphNode("Message", "FooBar")
+    foo_bar_2 = GraphNode("Message", "Foo_bar")
+    packet = GraphNode("Message", "Packet")
+    linter = GraphLinter([foo_bar, foo_bar_2, packet])
+    assert linter.error_count == 0
+
+    linter.set_strict_names(True)
+    assert {diagnostic.node for diagnostic in linter.errors()} == {foo_bar, foo_bar_2, packet}
+
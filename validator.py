@@ -0,0 +1,299 @@
+"""
+Incremental linter for community designs.
+
+Every rule only looks at a node and its direct connections, so an edit only re-checks the nodes that it touches.
+The exceptions are kept up to date through indices: name collisions through the nodes per generated name, and the
+number of messages through the messages and aggregators per flow. Every script is exported as its own module, so names
+only collide (and message ids only run out) within a flow.
+"""
+from keyword import iskeyword
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from exporter import RESERVED_METHOD_NAMES, RESERVED_MODULE_NAMES, camel_to_joined_lower, to_identifier
+from graph import BATCH_MSG_ID, FIRST_RESERVED_MSG_ID, MAX_BATCH_BYTES, SINGLETON_PORTS
+from wire_types import is_hashable
+
+ERROR = "error"
+WARNING = "warning"
+
+
+class Diagnostic(NamedTuple):
+    severity: str
+    node: object
+    message: str
+
+
+def connected(node, label: str) -> bool:
+    for port in node.inputs + node.outputs:
+        if port.label_str == label and len(port.connections) > 0:
+            return True
+    return False
+
+
+def neighbours(node) -> List[object]:
+    out = []
+    for port in node.outputs:
+        out.extend(connection.inp.node for connection in port.connections)
+    for port in node.inputs:
+        out.extend(connection.out.node for connection in port.connections)
+    return out
+
+
+def lint_fields(node) -> Iterable[str]:
+    for field_name in node.custom_fields_dict:
+        if not field_name.isidentifier() or iskeyword(field_name):
+            yield f"\"{field_name}\" cannot be used as a field name"
+    if node.title == "Message" and "identifier" in node.custom_fields_dict and (connected(node, "retrieve_cache")
+                                                                              or connected(node, "create_cache")):
+        yield "the field \"identifier\" is reserved for the cache identifier of messages with a cache"
+
+
+def lint_node(node) -> List[Diagnostic]:
+    """
+    The diagnostics of one node, which only depend on the node itself and its direct connections.
+    """
+    diagnostics = []
+
+    def report(severity, message):
+        diagnostics.append(Diagnostic(severity, node, message))
+
+    for port in node.inputs + node.outputs:
+        if port.label_str in SINGLETON_PORTS.get(node.title, ()) and len(port.connections) > 1:
+            report(ERROR, f"\"{port.label_str}\" can only have one connection")
+    if node.title in ("Message", "Cache"):
+        for message in lint_fields(node):
+            report(ERROR, message)
+
+    if node.title == "Message":
+        if not connected(node, "received_by"):
+            report(WARNING, "nothing sends this message")
+        if connected(node, "memoize"):
+            if not connected(node, "response"):
+                report(WARNING, "this message has no response to memoize")
+            elif connected(node, "retrieve_cache") or connected(node, "create_cache"):
+                report(ERROR, "the responses of messages with a cache cannot be memoized")
+            if not all(is_hashable(field_type) for field_type in node.custom_fields_dict.values()):
+                report(ERROR, "the responses of messages with object fields cannot be memoized, as their values may "
+                              "not be hashable")
+    elif node.title == "Cache":
+        created = connected(node, "belongs_to")
+        retrieved = connected(node, "received_by")
+        if retrieved and not created:
+            report(ERROR, "this cache is retrieved but never created, its handler would never run")
+        elif created and not retrieved:
+            report(WARNING, "this cache is created but never retrieved, it will always time out")
+        elif not created:
+            report(WARNING, "this cache is not used")
+        if node.timeout <= 0:
+            report(ERROR, "the timeout of a cache must be positive")
+        if node.max_outstanding < 0:
+            report(ERROR, "the maximum number of outstanding caches cannot be negative")
+    elif node.title == "PeriodicTask":
+        if not connected(node, "on_timer_fire"):
+            report(WARNING, "this task has no selector and does nothing")
+        if node.interval <= 0:
+            report(ERROR, "the interval of a task must be positive")
+    elif node.title in ("AllPeers", "RandomPeer"):
+        if not connected(node, "select"):
+            report(WARNING, "no task fires this selector")
+        if not connected(node, "message"):
+            report(WARNING, "this selector sends no message")
+    elif node.title == "RateLimiter":
+        if not connected(node, "limits"):
+            report(WARNING, "this rate limiter limits no message")
+        if node.peer_rate < 0 or node.global_rate < 0:
+            report(ERROR, "the rates of a rate limiter cannot be negative")
+        elif node.peer_rate == 0 and node.global_rate == 0:
+            report(ERROR, "a rate limiter needs a per-peer or global rate above 0, 0 is unlimited")
+        if node.peer_burst < 1 or node.global_burst < 1:
+            report(ERROR, "the bursts of a rate limiter must be at least 1 message, or no message gets through")
+        if node.max_peers < 1:
+            report(ERROR, "a rate limiter must remember at least one peer")
+        if node.max_deferred < 0:
+            report(ERROR, "the maximum number of deferred messages cannot be negative")
+    elif node.title == "Memoizer":
+        if not connected(node, "memoizes"):
+            report(WARNING, "this memoizer memoizes no response")
+        if node.max_entries < 1:
+            report(ERROR, "a memoizer must remember at least one response")
+        if node.ttl <= 0:
+            report(ERROR, "the time to live of a memoizer must be positive")
+    elif node.title == "Aggregator":
+        if not connected(node, "aggregates"):
+            report(WARNING, "this aggregator batches no message")
+        if node.max_delay <= 0:
+            report(ERROR, "the delay of an aggregator must be positive")
+        if not 0 < node.max_bytes <= MAX_BATCH_BYTES:
+            report(ERROR, f"the batch size must be between 1 and {MAX_BATCH_BYTES} bytes")
+    return diagnostics
+
+
+class GraphLinter:
+    """
+    Keeps the diagnostics of a graph up to date, given the nodes and connections that are added, removed and edited.
+
+    Every update is O(1) in the size of the graph: it re-checks the edited node and its direct neighbours, and the
+    (few) nodes that share a generated name with it. Only an update that takes the number of messages of a flow over or
+    under its limit re-checks all of them. ``on_change`` is called with every node whose diagnostics changed.
+
+    Name collisions are renamed by the exporter, so they are warnings, unless ``strict_names`` is set: then they are
+    errors, like they are for an ``Exporter`` that does not ``rename_collisions``.
+    """
+
+    def __init__(self, nodes: Iterable = (), on_change: Optional[Callable[[object], None]] = None,
+                 strict_names: bool = False):
+        self.on_change = on_change
+        self.strict_names = strict_names
+        self.node_diagnostics: Dict[object, List[Diagnostic]] = {}
+        self.names: Dict[object, List[Tuple[object, str, str]]] = {}
+        self.nodes_by_name: Dict[Tuple[object, str, str], Set[object]] = {}
+        self.flow_nodes: Dict[Tuple[object, str], Set[object]] = {}
+        self.error_count = 0
+        for node in nodes:
+            self.node_added(node)
+
+    def names_of(self, node) -> List[Tuple[object, str, str]]:
+        """
+        The names that the exporter generates for a node, as the flow of the node (Ryven nodes only), the namespace
+        (``"module"`` or ``"method"``) and the name, in the order in which the ``exporter.SymbolTable`` claims them.
+        """
+        if node.title not in ("Message", "Cache"):
+            return []
+        flow = getattr(node, "flow", None)
+        class_name = to_identifier(node.display_title)
+        names = [(flow, "module", class_name)]
+        if node.title == "Message":
+            handler_name = f"on_{camel_to_joined_lower(class_name)}"
+            names.append((flow, "method", handler_name))
+            if node.offload != "inline":
+                names.extend([(flow, "method", f"{handler_name}_work"), (flow, "method", f"{handler_name}_done")])
+        return names
+
+    def name_diagnostic(self, node) -> Optional[Diagnostic]:
+        """
+        The first generated name of the node that collides with another node or with the generated code, if any.
+        """
+        consequence = "it cannot be exported with strict names" if self.strict_names else "it will be renamed"
+        severity = ERROR if self.strict_names else WARNING
+        for key in self.names.get(node, []):
+            _, namespace, name = key
+            if len(self.nodes_by_name[key]) > 1:
+                other = ("another message or cache is also called" if namespace == "module"
+                         else "another message also generates the method")
+                return Diagnostic(severity, node, f"{other} \"{name}\", {consequence}")
+            if name in (RESERVED_MODULE_NAMES if namespace == "module" else RESERVED_METHOD_NAMES):
+                return Diagnostic(severity, node, f"\"{name}\" is already used by the generated code, {consequence}")
+        return None
+
+    def max_messages(self, flow) -> int:
+        """
+        The number of messages that a flow can have before their ids reach those of IPv8 or of the aggregators.
+        """
+        return BATCH_MSG_ID if self.flow_nodes.get((flow, "Aggregator")) else FIRST_RESERVED_MSG_ID
+
+    def too_many_messages(self, flow) -> bool:
+        return len(self.flow_nodes.get((flow, "Message"), ())) > self.max_messages(flow)
+
+    def count_node(self, node, added: bool) -> List[object]:
+        """
+        (Un)index a message or aggregator, returning the messages of its flow if they went over or under the limit.
+        """
+        if node.title not in ("Message", "Aggregator"):
+            return []
+        flow = getattr(node, "flow", None)
+        was_over = self.too_many_messages(flow)
+        if added:
+            self.flow_nodes.setdefault((flow, node.title), set()).add(node)
+        else:
+            self.flow_nodes[(flow, node.title)].discard(node)
+        if self.too_many_messages(flow) == was_over:
+            return []
+        return list(self.flow_nodes.get((flow, "Message"), ()))
+
+    def diagnostics(self) -> List[Diagnostic]:
+        return [diagnostic for diagnostics in self.node_diagnostics.values() for diagnostic in diagnostics]
+
+    def errors(self) -> List[Diagnostic]:
+        return [diagnostic for diagnostic in self.diagnostics() if diagnostic.severity == ERROR]
+
+    def relint(self, node) -> None:
+        if node not in self.node_diagnostics:
+            return
+        diagnostics = lint_node(node)
+        name_diagnostic = self.name_diagnostic(node)
+        if name_diagnostic is not None:
+            diagnostics.append(name_diagnostic)
+        flow = getattr(node, "flow", None)
+        if node.title == "Message" and self.too_many_messages(flow):
+            diagnostics.append(Diagnostic(ERROR, node, f"a community can have at most {self.max_messages(flow)} "
+                                                       f"messages, the other message ids are reserved"))
+        old = self.node_diagnostics[node]
+        if diagnostics != old:
+            self.error_count += (sum(diagnostic.severity == ERROR for diagnostic in diagnostics)
+                                 - sum(diagnostic.severity == ERROR for diagnostic in old))
+            self.node_diagnostics[node] = diagnostics
+            if self.on_change is not None:
+                self.on_change(node)
+
+    def claim_name(self, node) -> List[object]:
+        """
+        (Re)index the generated names of a node, returning the nodes whose collisions may have changed.
+        """
+        affected = []
+        for old_key in self.names.pop(node, []):
+            self.nodes_by_name[old_key].discard(node)
+            affected.extend(self.nodes_by_name[old_key])
+            if not self.nodes_by_name[old_key]:
+                del self.nodes_by_name[old_key]
+        if node in self.node_diagnostics:
+            keys = self.names_of(node)
+            if keys:
+                self.names[node] = keys
+            for key in keys:
+                self.nodes_by_name.setdefault(key, set()).add(node)
+                affected.extend(self.nodes_by_name[key])
+        return affected
+
+    def node_added(self, node) -> None:
+        self.node_diagnostics[node] = []
+        for affected in dict.fromkeys(self.claim_name(node) + self.count_node(node, True) + [node] + neighbours(node)):
+            self.relint(affected)
+
+    def node_removed(self, node) -> None:
+        old = self.node_diagnostics.pop(node, None)
+        if old is None:
+            return
+        self.error_count -= sum(diagnostic.severity == ERROR for diagnostic in old)
+        for affected in dict.fromkeys(self.claim_name(node) + self.count_node(node, False) + neighbours(node)):
+            self.relint(affected)
+        if self.on_change is not None:
+            self.on_change(node)
+
+    def node_changed(self, node) -> None:
+        if node in self.node_diagnostics:
+            for affected in dict.fromkeys(self.claim_name(node) + [node]):
+                self.relint(affected)
+
+    def set_strict_names(self, strict_names: bool) -> None:
+        if strict_names != self.strict_names:
+            self.strict_names = strict_names
+            for node in list(self.names):
+                self.relint(node)
+
+    def connection_changed(self, connection) -> None:
+        """
+        A connection was added or removed.
+        """
+        self.relint(connection.out.node)
+        self.relint(connection.inp.node)
+
+    def clear(self) -> None:
+        removed = list(self.node_diagnostics)
+        self.node_diagnostics = {}
+        self.names = {}
+        self.nodes_by_name = {}
+        self.flow_nodes = {}
+        self.error_count = 0
+        if self.on_change is not None:
+            for node in removed:
+                self.on_change(node)
@@ -1,7 +1,14 @@
+import multiprocessing
+import os
 import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
 from functools import wraps
 
-from PySide2.QtWidgets import QFileDialog
+from PySide2.QtCore import QObject, QRunnable, Qt, QThreadPool, QTimer, Signal
+from PySide2.QtWidgets import (QCheckBox, QComboBox, QDialog, QDialogButtonBox, QDockWidget, QDoubleSpinBox,
+                               QFileDialog, QFormLayout, QListWidget, QListWidgetItem, QMessageBox, QPlainTextEdit,
+                               QProgressDialog, QSpinBox)
 from qtpy.QtGui import QFont, QFontDatabase
 from qtpy.QtWidgets import QApplication
 from ryven import NodesPackage
@@ -13,8 +20,166 @@ from ryvencore.NodePort import NodePort
 from ryvencore_qt.src.flows.connections.ConnectionItem import ConnectionItem
 from shiboken2 import shiboken2
 
-from exporter import Exporter
-from nodes import nodes
+from batch_export import DEFAULT_EXPORTER_OPTIONS, export_flow
+from exporter import PAYLOAD_STYLES, TIMER_MODES, BlockCache, Exporter, script_names
+from graph import dump_flow, flow_batches, load_scripts, script_settings, snapshot_nodes, touch
+from project_format import read_project
+from validator import ERROR, GraphLinter
+from nodes import graph_events, nodes
+
+
+class PreviewSignals(QObject):
+    generated = Signal(int, str)
+
+
+class PreviewWorker(QRunnable):
+    """
+    Generates the code of a graph snapshot on a ``QThreadPool`` thread.
+    """
+
+    def __init__(self, generation, graph_nodes, block_cache, community_name, exporter_options):
+        super().__init__()
+
+        self.generation = generation
+        self.graph_nodes = graph_nodes
+        self.block_cache = block_cache
+        self.community_name = community_name
+        self.exporter_options = exporter_options
+        self.signals = PreviewSignals()
+
+    def run(self):
+        try:
+            exporter = Exporter(self.graph_nodes, self.block_cache, community_name=self.community_name,
+                                **self.exporter_options)
+            code = "".join(f"# Warning: {rename}\n" for rename in exporter.symbols.renames)
+            code += "".join(exporter.fragments())
+        except Exception:
+            code = "# Unable to generate code for this graph:\n# " + traceback.format_exc().replace("\n", "\n# ")
+        self.signals.generated.emit(self.generation, code)
+
+
+class ExportSignals(QObject):
+    finished = Signal(list)
+
+
+class ExportWorker(QRunnable):
+    """
+    Exports every script as its own community module, in parallel worker processes, from a ``QThreadPool`` thread.
+    """
+
+    def __init__(self, jobs, exporter_options):
+        super().__init__()
+
+        # (label, flow data, output path, community name) per script. Flow data is plain data, which (unlike nodes and
+        # their connections) pickles without deep recursion.
+        self.jobs = jobs
+        self.exporter_options = exporter_options
+        self.signals = ExportSignals()
+
+    def run(self):
+        results = []
+        # Forking a process with a running Qt application (and its threads) is unsafe, so the workers are spawned.
+        with ProcessPoolExecutor(max_workers=max(1, min(os.cpu_count() or 1, len(self.jobs))),
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = [(job[0], executor.submit(export_flow, *job, exporter_options=self.exporter_options,
+                                                     validate=False)) for job in self.jobs]
+            for label, future in futures:
+                try:
+                    _, output_path, duration, _, renames = future.result()
+                except Exception as e:
+                    results.append(f"{label} FAILED: {e!r}")
+                    continue
+                results.append(f"{label} -> {output_path} ({duration:.3f}s)")
+                results.extend(f"{label} warning: {rename}" for rename in renames)
+        self.signals.finished.emit(results)
+
+
+class ExportOptionsDialog(QDialog):
+    """
+    The options of the ``Exporter``, as offered by ``batch_export.py`` on the command line.
+    """
+
+    def __init__(self, exporter_options, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Export Options")
+
+        self.timer_mode = QComboBox()
+        self.timer_mode.addItems(TIMER_MODES)
+        self.timer_mode.setCurrentText(exporter_options["timer_mode"])
+        self.start_jitter = QDoubleSpinBox()
+        self.start_jitter.setRange(0.0, 3600.0)
+        self.start_jitter.setValue(exporter_options["start_jitter"])
+        self.interval_jitter = QDoubleSpinBox()
+        self.interval_jitter.setRange(0.0, 0.99)
+        self.interval_jitter.setSingleStep(0.05)
+        self.interval_jitter.setValue(exporter_options["interval_jitter"])
+        self.payload_style = QComboBox()
+        self.payload_style.addItems(PAYLOAD_STYLES)
+        self.payload_style.setCurrentText(exporter_options["payload_style"])
+        self.instrument = QCheckBox()
+        self.instrument.setChecked(exporter_options["instrument"])
+        self.offload_workers = QSpinBox()
+        self.offload_workers.setRange(1, 1024)
+        self.offload_workers.setValue(exporter_options["offload_workers"])
+        self.max_offloaded = QSpinBox()
+        self.max_offloaded.setRange(1, 1 << 20)
+        self.max_offloaded.setValue(exporter_options["max_offloaded"])
+        self.strict_names = QCheckBox()
+        self.strict_names.setChecked(not exporter_options["rename_collisions"])
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        layout = QFormLayout(self)
+        layout.addRow("Timer mode", self.timer_mode)
+        layout.addRow("Start jitter (s)", self.start_jitter)
+        layout.addRow("Interval jitter (fraction)", self.interval_jitter)
+        layout.addRow("Payload style", self.payload_style)
+        layout.addRow("Instrument", self.instrument)
+        layout.addRow("Offload workers", self.offload_workers)
+        layout.addRow("Max offloaded messages", self.max_offloaded)
+        layout.addRow("Fail on name collisions", self.strict_names)
+        layout.addRow(buttons)
+
+    def exporter_options(self):
+        return {
+            "rename_collisions": not self.strict_names.isChecked(),
+            "timer_mode": self.timer_mode.currentText(),
+            "start_jitter": self.start_jitter.value(),
+            "interval_jitter": self.interval_jitter.value(),
+            "payload_style": self.payload_style.currentText(),
+            "instrument": self.instrument.isChecked(),
+            "offload_workers": self.offload_workers.value(),
+            "max_offloaded": self.max_offloaded.value()
+        }
+
+
+class ProjectLoaderSignals(QObject):
+    loaded = Signal(dict)
+    failed = Signal(str)
+
+
+class ProjectLoader(QRunnable):
+    """
+    Reads, parses and checks a project file on a ``QThreadPool`` thread.
+    """
+
+    def __init__(self, file_path):
+        super().__init__()
+
+        self.file_path = file_path
+        self.signals = ProjectLoaderSignals()
+
+    def run(self):
+        try:
+            project = read_project(self.file_path)
+            # Fail on unknown nodes and dangling connections before the current project is closed.
+            load_scripts(project)
+        except Exception as e:
+            self.signals.failed.emit(f"Unable to load {self.file_path}: {e!r}")
+            return
+        self.signals.loaded.emit(project)
 
 
 class IPv8VisualProgrammer(MainWindow):
@@ -22,11 +187,141 @@ class IPv8VisualProgrammer(MainWindow):
     This class hot-patches the Ryven MainWindow to remove elements that are not needed for IPv8 Community design.
     """
 
+    PREVIEW_DEBOUNCE_MS = 300
+    # Number of nodes or connections that are added to a flow per event loop iteration while loading a project.
+    LOAD_BATCH_SIZE = 50
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         MainConsole.instance.deleteLater()
 
+        self.setup_preview_dock()
+        # Edited nodes are marked first, so the preview does not reuse their cached code.
+        graph_events.changed.connect(touch)
+        graph_events.changed.connect(self.schedule_preview)
+        self.ui.scripts_tab_widget.currentChanged.connect(self.schedule_preview)
+        self.setup_diagnostics_dock()
+        graph_events.changed.connect(self.linter.node_changed)
+
+        self.load_steps = None
+        self.load_progress = None
+        self.load_timer = QTimer(self)
+        self.load_timer.timeout.connect(self.load_next_batch)
+
+    def setup_preview_dock(self):
+        self.preview_editor = QPlainTextEdit()
+        self.preview_editor.setReadOnly(True)
+        self.preview_editor.setLineWrapMode(QPlainTextEdit.NoWrap)
+        self.preview_editor.setFont(QFont('source code pro', 10))
+
+        self.preview_dock = QDockWidget("Generated Code", self)
+        self.preview_dock.setWidget(self.preview_editor)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.preview_dock)
+
+        # Edits restart the timer, so bursts of edits (like typing) only regenerate once.
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(self.PREVIEW_DEBOUNCE_MS)
+        self.preview_timer.timeout.connect(self.regenerate_preview)
+
+        self.preview_block_cache = BlockCache()
+        # The options of the last export, which the preview is generated with as well.
+        self.exporter_options = dict(DEFAULT_EXPORTER_OPTIONS)
+        self.preview_generation = 0
+        self.preview_running = False
+        self.preview_pending = False
+
+    def setup_diagnostics_dock(self):
+        self.diagnostics_list = QListWidget()
+        self.diagnostics_list.setFont(QFont('source code pro', 10))
+
+        self.diagnostics_dock = QDockWidget("Diagnostics", self)
+        self.diagnostics_dock.setWidget(self.diagnostics_list)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.diagnostics_dock)
+
+        # Linting is incremental, only redrawing the list of diagnostics is done once per burst of edits.
+        self.diagnostics_timer = QTimer(self)
+        self.diagnostics_timer.setSingleShot(True)
+        self.diagnostics_timer.setInterval(self.PREVIEW_DEBOUNCE_MS)
+        self.diagnostics_timer.timeout.connect(self.show_diagnostics)
+
+        self.linter = GraphLinter(on_change=self.schedule_diagnostics)
+
+    # The first script (and its flow) is created before the linter is, so flows are connected to these methods.
+    def lint_node_added(self, node):
+        self.linter.node_added(node)
+
+    def lint_node_removed(self, node):
+        self.linter.node_removed(node)
+
+    def lint_connection_changed(self, connection):
+        self.linter.connection_changed(connection)
+
+    def schedule_diagnostics(self, *args):
+        if graph_events.loading_project:
+            return
+        self.diagnostics_timer.start()
+
+    def show_diagnostics(self):
+        self.diagnostics_list.clear()
+        for diagnostic in sorted(self.linter.diagnostics(), key=lambda diagnostic: diagnostic.severity != ERROR):
+            item = QListWidgetItem(f"{diagnostic.severity}: {diagnostic.node.display_title}: {diagnostic.message}")
+            item.setForeground(Qt.red if diagnostic.severity == ERROR else Qt.yellow)
+            self.diagnostics_list.addItem(item)
+        self.diagnostics_dock.setWindowTitle(f"Diagnostics ({self.linter.error_count} errors)")
+
+    def touch_connection(self, connection):
+        touch(connection.out.node)
+        touch(connection.inp.node)
+
+    def schedule_preview(self, *args):
+        if graph_events.loading_project:
+            return
+        self.preview_timer.start()
+
+    def regenerate_preview(self):
+        if self.preview_running:
+            # The block cache may only be used by one worker at a time, try again when the current one is done.
+            self.preview_pending = True
+            return
+        self.preview_running = True
+        self.preview_generation += 1
+        script = self.current_script()
+        if script is None:
+            self.preview_running = False
+            return
+        community_name = dict(zip(self.session.scripts, self.script_names()))[script][1]
+        # Snapshotting is O(V+E) and happens on the GUI thread, the code generation itself does not.
+        worker = PreviewWorker(self.preview_generation, snapshot_nodes(script.flow.nodes), self.preview_block_cache,
+                               community_name, self.exporter_options)
+        worker.signals.generated.connect(self.preview_generated)
+        QThreadPool.globalInstance().start(worker)
+
+    def current_script(self):
+        current_widget = self.ui.scripts_tab_widget.currentWidget()
+        for script, script_ui in self.script_UIs.items():
+            if script_ui is current_widget:
+                return script
+        return None
+
+    def script_names(self):
+        """
+        The module name and community class name of every script, in the order of ``session.scripts``.
+        """
+        return script_names([script.title for script in self.session.scripts])
+
+    def preview_generated(self, generation, code):
+        self.preview_running = False
+        if self.preview_pending:
+            self.preview_pending = False
+            self.schedule_preview()
+        if generation == self.preview_generation:
+            scroll_bar = self.preview_editor.verticalScrollBar()
+            scroll_position = scroll_bar.value()
+            self.preview_editor.setPlainText(code)
+            scroll_bar.setValue(scroll_position)
+
     def import_nodes(self, package: NodesPackage = None, path: str = None):
         self.session.register_nodes(nodes)
 
@@ -79,8 +374,8 @@ class IPv8VisualProgrammer(MainWindow):
                     valid = True
 
                     # Custom checks
-                    p1_is_single = p1.label_str in getattr(p1.node, "singleton_ports", [])
-                    p2_is_single = p2.label_str in getattr(p2.node, "singleton_ports", [])
+                    p1_is_single = p1.label_str in p1.node.singleton_ports
+                    p2_is_single = p2.label_str in p2.node.singleton_ports
                     if p1_is_single and len(p1.connections) > 0:
                         valid = False
                     if p2_is_single and len(p2.connections) > 0:
@@ -94,40 +389,125 @@ class IPv8VisualProgrammer(MainWindow):
 
                 workspace_pane.flow_view.flow.check_connection_validity = check_connection_validity_overwrite
 
+                # Preview updates
+                flow = workspace_pane.flow_view.flow
+                flow.node_added.connect(self.schedule_preview)
+                flow.node_removed.connect(self.schedule_preview)
+                flow.connection_added.connect(self.touch_connection)
+                flow.connection_removed.connect(self.touch_connection)
+                flow.connection_added.connect(self.schedule_preview)
+                flow.connection_removed.connect(self.schedule_preview)
+
+                # Diagnostics
+                flow.node_added.connect(self.lint_node_added)
+                flow.node_removed.connect(self.lint_node_removed)
+                flow.connection_added.connect(self.lint_connection_changed)
+                flow.connection_removed.connect(self.lint_connection_changed)
+
     def on_import_nodes_triggered(self):
         """
         Overwritten -> now "Load Project" action.
         """
-        file_path = QFileDialog.getOpenFileName(self, 'select nodes file', '.', '(*.json)', )[0]
-        if file_path != '':
-            while self.ui.scripts_tab_widget.count() > 0:
-                self.ui.scripts_tab_widget.removeTab(0)
-            for key in list(self.script_UIs.keys()):
-                del self.script_UIs[key]
-                del self.session.flow_views[key]
-            self.session.scripts = []
-            import json
-            with open(file_path, 'r') as fp:
-                self.session.load(json.load(fp))
-            
-            for flow_view in self.session.flow_views.values():
-                flow_view.hide()
-                selected = flow_view.scene().selectedItems()
-                flow_view.select_all()
-                QApplication.instance().processEvents()
-                flow_view.clear_selection()
-                flow_view.select_components(selected)
-                flow_view.show()
+        file_path = QFileDialog.getOpenFileName(self, 'select nodes file', '.', '(*.json *.ipv8z)', )[0]
+        if file_path != '' and self.load_steps is None:
+            loader = ProjectLoader(file_path)
+            loader.signals.loaded.connect(self.project_loaded)
+            loader.signals.failed.connect(self.project_load_failed)
+            self.ui.actionImport_Nodes.setEnabled(False)
+            QThreadPool.globalInstance().start(loader)
+
+    def project_load_failed(self, message):
+        self.ui.actionImport_Nodes.setEnabled(True)
+        QMessageBox.warning(self, "Load Project", message)
+
+    def project_loaded(self, project):
+        """
+        Replace the current project by the given (parsed) project, adding its nodes and connections in batches.
+        """
+        while self.ui.scripts_tab_widget.count() > 0:
+            self.ui.scripts_tab_widget.removeTab(0)
+        for key in list(self.script_UIs.keys()):
+            del self.script_UIs[key]
+            del self.session.flow_views[key]
+        self.session.scripts = []
+        self.linter.clear()
+
+        total = sum(len(script_data["flow"]["nodes"]) + len(script_data["flow"].get("connections", []))
+                    for script_data in project["scripts"])
+        self.load_progress = QProgressDialog("Loading project...", None, 0, max(1, total), self)
+        self.load_progress.setWindowModality(Qt.WindowModal)
+        self.load_progress.setMinimumDuration(500)
+        graph_events.loading_project = True
+        self.load_steps = self.load_batches(project)
+        self.load_timer.start(0)
+
+    def load_batches(self, project):
+        """
+        Add the scripts of a project, yielding the number of added items after every batch.
+        """
+        done = 0
+        for script_data in project["scripts"]:
+            # Created from the script's settings, as session.load would, to keep its variables and algorithm mode.
+            script = self.session.create_script(data=script_settings(script_data))
+            flow_nodes = []
+            for kind, batch in flow_batches(script_data["flow"], self.LOAD_BATCH_SIZE):
+                if kind == "nodes":
+                    flow_nodes += script.flow.create_nodes_from_data(batch)
+                else:
+                    script.flow.connect_nodes_from_data(flow_nodes, batch)
+                done += len(batch)
+                yield done
+
+    def load_next_batch(self):
+        try:
+            self.load_progress.setValue(next(self.load_steps))
+            return
+        except StopIteration:
+            error = None
+        except Exception:
+            error = traceback.format_exc()
+        self.load_timer.stop()
+        self.load_steps = None
+        self.load_progress.close()
+        self.load_progress = None
+        graph_events.loading_project = False
+        self.ui.actionImport_Nodes.setEnabled(True)
+        for flow_view in self.session.flow_views.values():
+            flow_view.viewport().update()
+        self.schedule_preview()
+        self.schedule_diagnostics()
+        if error is not None:
+            QMessageBox.warning(self, "Load Project", f"Unable to load the project:\n{error}")
 
     def on_import_example_nodes_triggered(self):
         """
         Overwritten -> now "Export" action.
         """
-        # Dialog to select save file
-        file_path = QFileDialog.getSaveFileName(self, 'select file name', '', 'PY(*.py)')[0]
-        if file_path != '':
-            exporter = Exporter(self.session.all_node_objects())
-            exporter.export(file_path)
+        options_dialog = ExportOptionsDialog(self.exporter_options, self)
+        if options_dialog.exec_() != QDialog.Accepted:
+            return
+        self.exporter_options = options_dialog.exporter_options()
+        self.linter.set_strict_names(not self.exporter_options["rename_collisions"])
+        self.schedule_preview()
+        errors = self.linter.errors()
+        if errors:
+            QMessageBox.warning(self, "Export", "Fix these errors before exporting:\n" + "\n".join(
+                f"{diagnostic.node.display_title}: {diagnostic.message}" for diagnostic in errors))
+            return
+        # Dialog to select the directory to write one module per script to
+        directory = QFileDialog.getExistingDirectory(self, 'select export directory', '')
+        if directory != '':
+            jobs = [(script.title, dump_flow(snapshot_nodes(script.flow.nodes)),
+                     os.path.join(directory, module_name + ".py"), class_name)
+                    for script, (module_name, class_name) in zip(self.session.scripts, self.script_names())]
+            worker = ExportWorker(jobs, self.exporter_options)
+            worker.signals.finished.connect(self.export_finished)
+            self.ui.actionImport_Example_Nodes.setEnabled(False)
+            QThreadPool.globalInstance().start(worker)
+
+    def export_finished(self, results):
+        self.ui.actionImport_Example_Nodes.setEnabled(True)
+        QMessageBox.information(self, "Export", "\n".join(results))
 
     def script_created(self, script, flow_view):
         super().script_created(script, flow_view)
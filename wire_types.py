@@ -0,0 +1,96 @@
+"""
+The field types that can be chosen for Message and Cache fields and how they map onto IPv8 payload declarations.
+"""
+from typing import Dict, Iterable, List, Optional
+
+
+# Types that the IPv8 dataclass payloads understand out of the box.
+NATIVE_TYPES = ["str", "int", "float", "object", "bool", "bytes"]
+# Compact types, field type -> (generated type name, IPv8 serializer format).
+COMPACT_TYPES = {
+    "uint8": ("UInt8", "B"),
+    "uint16": ("UInt16", "H"),
+    "uint32": ("UInt32", "I"),
+    "uint64": ("UInt64", "Q"),
+    "int8": ("Int8", "b"),
+    "int16": ("Int16", "h"),
+    "int32": ("Int32", "i"),
+    "int64": ("Int64", "q"),
+    "long_bytes": ("LongBytes", "varlenI")
+}
+# IPv8 serializer formats of the native types that have a fixed encoding.
+NATIVE_FORMATS = {
+    "str": "varlenHutf8",
+    "int": "q",
+    "float": "d",
+    "bool": "?",
+    "bytes": "varlenH"
+}
+LIST_ELEMENT_TYPES = ["bool", "bytes", "int", "str", "uint8", "uint16", "uint32", "uint64",
+                      "int8", "int16", "int32", "int64"]
+FIELD_TYPES = NATIVE_TYPES + list(COMPACT_TYPES) + [f"List[{t}]" for t in LIST_ELEMENT_TYPES]
+
+
+def is_list(field_type: str) -> bool:
+    return field_type.startswith("List[") and field_type.endswith("]")
+
+
+def element_type(field_type: str) -> str:
+    return field_type[len("List["):-1] if is_list(field_type) else field_type
+
+
+def is_hashable(field_type: str) -> bool:
+    """
+    Whether the values of a field can be part of a dictionary key (lists as tuples): ``object`` fields may hold a list
+    or a dictionary.
+    """
+    return element_type(field_type) != "object"
+
+
+def payload_annotation(field_type: str) -> str:
+    """
+    The annotation of a field in a generated payload dataclass.
+    """
+    element = element_type(field_type)
+    annotation = COMPACT_TYPES[element][0] if element in COMPACT_TYPES else element
+    return f"List[{annotation}]" if is_list(field_type) else annotation
+
+
+def python_annotation(field_type: str) -> str:
+    """
+    The annotation of a field that is never serialized, like the fields of a cache.
+    """
+    element = element_type(field_type)
+    if element in COMPACT_TYPES:
+        element = "bytes" if element == "long_bytes" else "int"
+    return f"List[{element}]" if is_list(field_type) else element
+
+
+def serializer_format(field_type: str) -> Optional[str]:
+    """
+    The IPv8 serializer format of a field, or ``None`` if the field can only be serialized by the dataclass payloads.
+    """
+    if field_type in COMPACT_TYPES:
+        return COMPACT_TYPES[field_type][1]
+    return NATIVE_FORMATS.get(field_type)
+
+
+def required_formats(field_types: Iterable[str]) -> Dict[str, str]:
+    """
+    The ``type_from_format`` declarations (generated type name -> format) that the given field types need.
+    """
+    used = {element_type(field_type) for field_type in field_types}
+    return {name: fmt for field_type, (name, fmt) in COMPACT_TYPES.items() if field_type in used}
+
+
+def uses_lists(field_types: Iterable[str]) -> bool:
+    return any(is_list(field_type) for field_type in field_types)
+
+
+def fields_annotations(fields: Dict[str, str], serialized: bool = True) -> Dict[str, str]:
+    annotate = payload_annotation if serialized else python_annotation
+    return {name: annotate(field_type) for name, field_type in fields.items()}
+
+
+def all_field_types(nodes) -> List[str]:
+    return [field_type for node in nodes for field_type in node.custom_fields_dict.values()]